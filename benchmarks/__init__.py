@@ -0,0 +1,6 @@
+"""Performance benchmarks for realtime
+
+Run a benchmark module from the repository root e.g.::
+
+    $ python -m benchmarks.bench_parse
+"""
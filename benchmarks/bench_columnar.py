@@ -0,0 +1,83 @@
+"""Rows per second turned into columns, row by row and with columnar batches
+
+Approaches are timed in turn within each round, after a warm-up round, and
+the median of the rounds is reported, so drift in the machine's speed
+affects them alike. Every approach parses the lines first; "parse only"
+is that share of the time.
+"""
+import gc
+import statistics
+import time
+from collections import defaultdict
+from typing import Any, Callable, Dict, List, Tuple
+
+from benchmarks.corpus import generate
+from realtime.columnar import columnar
+from realtime.message import CRUDMessage, parse_many
+
+N_ROWS = 20_000
+ROUNDS = 9
+
+
+def row_by_row(lines: List[str]) -> Dict[Tuple[Any, ...], Dict[str, List[Any]]]:
+    """What consumers do without columnar batches"""
+    tables: Dict[Tuple[Any, ...], Dict[str, List[Any]]] = defaultdict(
+        lambda: defaultdict(list)
+    )
+    for message in parse_many(lines):
+        if isinstance(message, CRUDMessage):
+            columns = tables[(message.schema, message.table, message.command)]
+            for column in message.columns:
+                columns[column.column].append(column.typed)
+    return tables
+
+
+def parse_only(lines: List[str]) -> None:
+    for message in parse_many(lines):
+        if isinstance(message, CRUDMessage):
+            message.raw_columns()
+
+
+def timed(func: Callable[[], object]) -> float:
+    gc.collect()
+    started = time.perf_counter()
+    func()
+    return time.perf_counter() - started
+
+
+def main() -> None:
+    lines = [data for _, _, data in generate(N_ROWS)]
+    approaches: List[Tuple[str, Callable[[], object]]] = [
+        ("parse only", lambda: parse_only(lines)),
+        ("row by row", lambda: row_by_row(lines)),
+        ("columnar", lambda: columnar(parse_many(lines))),
+        ("columnar compact", lambda: columnar(parse_many(lines, compact=True))),
+    ]
+    for _, func in approaches:
+        func()
+
+    seconds: Dict[str, List[float]] = {name: [] for name, _ in approaches}
+    for _ in range(ROUNDS):
+        for name, func in approaches:
+            seconds[name].append(timed(func))
+
+    baseline = seconds["row by row"]
+    print("{} rows, median of {} rounds".format(N_ROWS, ROUNDS))
+    print(
+        "{:>20} {:>12} {:>10} {:>14}".format(
+            "approach", "rows/s", "spread", "vs row by row"
+        )
+    )
+    for name, _ in approaches:
+        median = statistics.median(seconds[name])
+        spread = (max(seconds[name]) - min(seconds[name])) / median
+        speedup = statistics.median(b / s for b, s in zip(baseline, seconds[name]))
+        print(
+            "{:>20} {:>12.0f} {:>9.0%} {:>13.2f}x".format(
+                name, N_ROWS / median, spread, speedup
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
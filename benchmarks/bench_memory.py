@@ -0,0 +1,88 @@
+"""Bytes per buffered row for narrow and wide tables"""
+import gc
+import tracemalloc
+from dataclasses import dataclass
+from typing import Callable, List, Optional
+
+from benchmarks.bench_parse import make_line
+from realtime.message import parse, parse_many
+
+N_ROWS = 10_000
+WIDTHS = (3, 50)
+
+
+@dataclass
+class LegacyColumn:
+    column: str
+    data_type: str
+    value: Optional[str]
+
+
+@dataclass
+class LegacyMessage:
+    command: str
+    schema: Optional[str]
+    table: str
+    columns: List[LegacyColumn]
+
+
+def legacy(line: str) -> LegacyMessage:
+    """The dataclass representation, with fresh name strings per row"""
+    message = parse(line)
+    return LegacyMessage(
+        "".join(message.command),  # type: ignore
+        "".join(message.schema),  # type: ignore
+        "".join(message.table),  # type: ignore
+        [
+            LegacyColumn("".join(col.column), "".join(col.data_type), col.value)
+            for col in message.columns  # type: ignore
+        ],
+    )
+
+
+def lines_for(width: int) -> List[str]:
+    # Distinct values per row, so only names can be shared
+    return [make_line(width).replace("5", str(ix)) for ix in range(N_ROWS)]
+
+
+def bytes_per_row(build: Callable[[], object]) -> float:
+    """Memory held by what *build* returns, per row, including any raw lines
+    it keeps
+    """
+    gc.collect()
+    tracemalloc.start()
+    held = build()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del held
+    return size / N_ROWS
+
+
+def main() -> None:
+    print(
+        "{:>8} {:>10} {:>10} {:>10} {:>10} {:>10}".format(
+            "columns", "raw text", "dataclass", "unread", "read", "compact"
+        )
+    )
+    for width in WIDTHS:
+
+        def read() -> object:
+            messages = parse_many(lines_for(width))
+            for message in messages:
+                message.columns  # type: ignore
+            return messages
+
+        print(
+            "{:>8} {:>10.0f} {:>10.0f} {:>10.0f} {:>10.0f} {:>10.0f}".format(
+                width,
+                bytes_per_row(lambda: lines_for(width)),
+                bytes_per_row(lambda: [legacy(line) for line in lines_for(width)]),
+                bytes_per_row(lambda: parse_many(lines_for(width))),
+                bytes_per_row(read),
+                bytes_per_row(lambda: parse_many(lines_for(width), compact=True)),
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
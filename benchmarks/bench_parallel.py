@@ -0,0 +1,75 @@
+"""Rows per second decoded in-process and on a process pool, by fetch size"""
+import asyncio
+import os
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor
+from typing import Any, Callable, List, Optional
+
+from benchmarks.corpus import generate
+from realtime.decoders import TestDecodingDecoder
+from realtime.parallel import decode
+
+FETCH_SIZES = (1_000, 5_000, 20_000, 100_000)
+REPEAT = 3
+
+
+def read(pairs: Any) -> None:
+    for _, message in pairs:
+        getattr(message, "columns", None)
+
+
+def best(func: Callable[[], None]) -> float:
+    """Best observed seconds per call"""
+    timings = []
+    for _ in range(REPEAT):
+        started = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+
+def decoding(
+    lines: List[str], executor: Optional[Executor], read_columns: bool
+) -> Callable[[], None]:
+    decoder = TestDecodingDecoder()
+
+    def run() -> None:
+        async def main() -> None:
+            pairs = await decode(decoder, lines, executor, min_rows=1)
+            if read_columns:
+                read(pairs)
+            else:
+                list(pairs)
+
+        asyncio.run(main())
+
+    return run
+
+
+def main() -> None:
+    workers = min(4, os.cpu_count() or 1)
+    print("process pool of {} workers".format(workers))
+    print(
+        "{:>8} {:>12} {:>12} {:>14} {:>14}".format(
+            "rows", "in-process", "pool", "in-process+read", "pool+read"
+        )
+    )
+    with ProcessPoolExecutor(workers) as executor:
+        # Start the workers before timing
+        executor.submit(len, []).result()
+        for n_rows in FETCH_SIZES:
+            lines = [data for _, _, data in generate(n_rows)]
+            rates = [
+                n_rows / best(decoding(lines, pool, read_columns))
+                for read_columns in (False, True)
+                for pool in (None, executor)
+            ]
+            print(
+                "{:>8} {:>12.0f} {:>12.0f} {:>14.0f} {:>14.0f}".format(
+                    n_rows, rates[0], rates[1], rates[2], rates[3]
+                )
+            )
+
+
+if __name__ == "__main__":
+    main()
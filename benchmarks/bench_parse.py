@@ -0,0 +1,79 @@
+"""Per-row cost of tokenizing test_decoding lines of increasing width"""
+import timeit
+from typing import Callable, List
+
+from realtime.message import parse, parse_many
+from realtime.parse_utils import tokenize_crud, tokenize_crud_legacy
+
+WIDTHS = (5, 50, 500)
+FETCH_SIZE = 10_000
+
+
+def make_line(n_columns: int) -> str:
+    cols = []
+    for ix in range(n_columns):
+        if ix % 3 == 0:
+            cols.append("id_{}[integer]:{}".format(ix, ix))
+        elif ix % 3 == 1:
+            cols.append("txt_{}[text]:'it''s value {}'".format(ix, ix))
+        else:
+            cols.append("arr_{}[integer[]]:'{{{},{}}}'".format(ix, ix, ix + 1))
+    return "table public.wide: INSERT: " + " ".join(cols)
+
+
+def make_fetch(n_rows: int) -> List[str]:
+    """A narrow table's rows wrapped in single row transactions"""
+    lines = []
+    for ix in range(n_rows // 3):
+        lines.append("BEGIN {}".format(ix))
+        lines.append(
+            "table public.narrow: INSERT: id[integer]:{} name[text]:'n{}'".format(
+                ix, ix
+            )
+        )
+        lines.append("COMMIT {}".format(ix))
+    return lines
+
+
+def per_call(func: Callable[[], object], repeat: int = 5) -> float:
+    """Best observed seconds per call"""
+    timer = timeit.Timer(func)
+    number, _ = timer.autorange()
+    return min(timer.repeat(repeat=repeat, number=number)) / number
+
+
+def main() -> None:
+    print(
+        "{:>8} {:>16} {:>16} {:>16} {:>8}".format(
+            "columns", "legacy us/row", "tokenize us/row", "parse us/row", "speedup"
+        )
+    )
+    for width in WIDTHS:
+        line = make_line(width)
+        legacy = per_call(lambda: tokenize_crud_legacy(line))
+        new = per_call(lambda: tokenize_crud(line))
+        # Columns are tokenized when first read
+        full = per_call(lambda: parse(line).columns)  # type: ignore
+        print(
+            "{:>8} {:>16.2f} {:>16.2f} {:>16.2f} {:>7.1f}x".format(
+                width, legacy * 1e6, new * 1e6, full * 1e6, legacy / new
+            )
+        )
+
+    lines = make_fetch(FETCH_SIZE)
+    print()
+    print("{:>24} {:>16}".format("fetch of {} rows".format(len(lines)), "us/row"))
+    for label, func in [
+        ("parse per row", lambda: [parse(line) for line in lines]),
+        ("parse_many", lambda: parse_many(lines)),
+        (
+            "parse_many, read",
+            lambda: [getattr(m, "columns", None) for m in parse_many(lines)],
+        ),
+        ("parse_many compact", lambda: parse_many(lines, compact=True)),
+    ]:
+        print("{:>24} {:>16.2f}".format(label, per_call(func) / len(lines) * 1e6))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+"""Per-row cost of decoding pgoutput frames vs parsing test_decoding lines"""
+import struct
+from typing import List
+
+from benchmarks.bench_parse import make_fetch, per_call
+from realtime.message import parse_many
+from realtime.pgoutput import PgOutputDecoder
+
+FETCH_SIZE = 10_000
+
+RELATION = (
+    b"R"
+    + struct.pack("!I", 1)
+    + b"public\x00narrow\x00d"
+    + struct.pack("!h", 2)
+    + b"\x01id\x00"
+    + struct.pack("!Ii", 23, -1)
+    + b"\x00name\x00"
+    + struct.pack("!Ii", 25, -1)
+)
+
+
+def text(value: str) -> bytes:
+    data = value.encode()
+    return b"t" + struct.pack("!i", len(data)) + data
+
+
+def make_frames(n_rows: int) -> List[bytes]:
+    """The workload of make_fetch as pgoutput frames"""
+    frames = [RELATION]
+    for ix in range(n_rows // 3):
+        frames.append(b"B" + struct.pack("!QqI", ix, 0, ix))
+        frames.append(
+            b"I"
+            + struct.pack("!I", 1)
+            + b"N"
+            + struct.pack("!h", 2)
+            + text(str(ix))
+            + text("n{}".format(ix))
+        )
+        frames.append(b"C\x00" + struct.pack("!QQq", ix, ix, 0))
+    return frames
+
+
+def main() -> None:
+    lines = make_fetch(FETCH_SIZE)
+    frames = make_frames(FETCH_SIZE)
+    decoder = PgOutputDecoder()
+
+    test_decoding = per_call(lambda: parse_many(lines, compact=True)) / len(lines)
+    pgoutput = per_call(lambda: decoder.decode_many(frames)) / len(frames)
+
+    print("{:>16} {:>8}".format("plugin", "us/row"))
+    print("{:>16} {:>8.2f}".format("test_decoding", test_decoding * 1e6))
+    print("{:>16} {:>8.2f}".format("pgoutput", pgoutput * 1e6))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,45 @@
+"""Rows per second replayed from a capture of the synthetic corpus"""
+import asyncio
+import tempfile
+import time
+
+from benchmarks.corpus import generate
+from realtime.capture import Capture, Recorder, replay
+
+N_ROWS = 200_000
+
+
+async def consume(path: str) -> int:
+    seen = 0
+    async for _ in replay(path):
+        seen += 1
+    return seen
+
+
+def main() -> None:
+    rows = generate(N_ROWS)
+    with tempfile.TemporaryDirectory() as path:
+        start = time.perf_counter()
+        with Recorder(path) as recorder:
+            for ix in range(0, len(rows), 10_000):
+                recorder.write(rows[ix : ix + 10_000])
+        record = time.perf_counter() - start
+
+        start = time.perf_counter()
+        with Capture(path) as capture:
+            n_records = sum(1 for _ in capture.rows())
+        read = time.perf_counter() - start
+
+        start = time.perf_counter()
+        n_messages = asyncio.run(consume(path))
+        messages = time.perf_counter() - start
+
+    assert n_records == n_messages == len(rows)
+    print("{:>16} {:>12}".format("stage", "rows/s"))
+    print("{:>16} {:>12.0f}".format("record", len(rows) / record))
+    print("{:>16} {:>12.0f}".format("read records", len(rows) / read))
+    print("{:>16} {:>12.0f}".format("replay", len(rows) / messages))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""Throughput of parsing and subscribing over the synthetic corpus
+
+Saves results as JSON with --output, and with --baseline exits non-zero
+when a benchmark is more than --tolerance slower than a saved run::
+
+    $ python -m benchmarks.bench_suite --output baseline.json
+    $ python -m benchmarks.bench_suite --baseline baseline.json
+"""
+import argparse
+import asyncio
+import sys
+from typing import Callable, Dict, List
+
+from benchmarks.bench_parse import per_call
+from benchmarks.corpus import Row, generate
+from benchmarks.results import compare, load, results, save
+from realtime.columnar import columnar
+from realtime.message import CRUDMessage, parse, parse_many
+from realtime.parse_utils import tokenize_crud_legacy
+from realtime.subscribe import subscribe
+from tests.fakes import FakeConnection
+
+BATCH_SIZE = 10_000
+
+
+async def consume(rows: List[Row]) -> None:
+    con = FakeConnection(rows)
+    subscription = subscribe(con, "bench", batch_size=BATCH_SIZE)  # type: ignore
+    seen = 0
+    async for _ in subscription:
+        seen += 1
+        if seen == len(rows):
+            break
+    await subscription.aclose()
+
+
+def columns(lines: List[str]) -> None:
+    for message in parse_many(lines):
+        if isinstance(message, CRUDMessage):
+            message.columns
+
+
+def typed(lines: List[str]) -> None:
+    for message in parse_many(lines):
+        if isinstance(message, CRUDMessage):
+            for column in message.columns:
+                column.typed
+
+
+def benchmarks(rows: List[Row]) -> Dict[str, Callable[[], object]]:
+    lines = [data for _, _, data in rows]
+    crud = [line for line in lines if line.startswith("table ")]
+    return {
+        "parse": lambda: [parse(line) for line in lines],
+        "parse_many": lambda: parse_many(lines),
+        "parse_many_compact": lambda: parse_many(lines, compact=True),
+        # Rows of the tokenizer built on read_column, which needs CRUD rows
+        "read_column": lambda: [tokenize_crud_legacy(line) for line in crud],
+        "columns": lambda: columns(lines),
+        "typed": lambda: typed(lines),
+        "columnar": lambda: columnar(parse_many(lines)),
+        "subscribe": lambda: asyncio.run(consume(rows)),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--rows", type=int, default=20_000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="save results to this JSON file")
+    parser.add_argument("--baseline", help="compare with results saved earlier")
+    parser.add_argument("--tolerance", type=float, default=0.1)
+    parser.add_argument("names", nargs="*", help="benchmarks to run, default all")
+    args = parser.parse_args()
+
+    rows = generate(args.rows, args.seed)
+    n_crud = sum(1 for _, _, data in rows if data.startswith("table "))
+
+    throughput = {}
+    print("{:>20} {:>12}".format("benchmark", "rows/s"))
+    for name, func in benchmarks(rows).items():
+        if args.names and name not in args.names:
+            continue
+        seconds = per_call(func, repeat=3)
+        n_rows = n_crud if name == "read_column" else len(rows)
+        throughput[name] = {"rows_per_second": n_rows / seconds, "seconds": seconds}
+        print("{:>20} {:>12.0f}".format(name, n_rows / seconds))
+
+    current = results({"rows": len(rows), "seed": args.seed}, throughput)
+    if args.output:
+        save(args.output, current)
+
+    if args.baseline:
+        regressions = compare(load(args.baseline), current, args.tolerance)
+        for regression in regressions:
+            print(
+                "REGRESSION {}: {:.0f} -> {:.0f} rows/s ({:+.1%})".format(
+                    regression.name,
+                    regression.baseline,
+                    regression.current,
+                    regression.change,
+                )
+            )
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+"""Per-row cost of decoding wal2json rows vs parsing test_decoding lines"""
+import json
+from typing import List
+
+from benchmarks.bench_parse import make_fetch, per_call
+from realtime.message import parse_many
+from realtime.wal2json import Wal2JsonDecoder
+
+FETCH_SIZE = 10_000
+
+
+def make_rows(n_rows: int) -> List[str]:
+    """The workload of make_fetch as wal2json format-version 2 rows"""
+    rows = []
+    for ix in range(n_rows // 3):
+        rows.append(json.dumps({"action": "B", "xid": ix}))
+        rows.append(
+            json.dumps(
+                {
+                    "action": "I",
+                    "schema": "public",
+                    "table": "narrow",
+                    "columns": [
+                        {"name": "id", "type": "integer", "value": ix},
+                        {"name": "name", "type": "text", "value": "n{}".format(ix)},
+                    ],
+                    "pk": [{"name": "id", "type": "integer"}],
+                }
+            )
+        )
+        rows.append(json.dumps({"action": "C", "xid": ix}))
+    return rows
+
+
+def main() -> None:
+    lines = make_fetch(FETCH_SIZE)
+    rows = make_rows(FETCH_SIZE)
+
+    decoder = Wal2JsonDecoder()
+
+    test_decoding = per_call(lambda: parse_many(lines)) / len(lines)
+    wal2json = per_call(lambda: decoder.decode_many(rows)) / len(rows)
+    per_row = per_call(lambda: [decoder.decode_many([row]) for row in rows]) / len(rows)
+
+    print("{:>24} {:>8}".format("decoder", "us/row"))
+    print("{:>24} {:>8.2f}".format("test_decoding parse_many", test_decoding * 1e6))
+    print("{:>24} {:>8.2f}".format("wal2json per row", per_row * 1e6))
+    print("{:>24} {:>8.2f}".format("wal2json per fetch", wal2json * 1e6))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+"""Deterministic synthetic test_decoding output for benchmarks
+
+generate(n_rows, seed) always returns the same rows for the same arguments,
+so results are comparable between runs and releases. Rows are grouped into
+transactions over a mix of tables:
+
+- narrow: a few integer and text columns
+- wide: 60 columns of mixed types
+- quoted: text with '' escapes, spaces and quoted names
+- arrays: integer, text and nested arrays, with quoted elements
+- nullable: mostly null columns
+- long_text: text values of several kilobytes
+
+Updates log an old-key, as when a row's key changes, and deletes only the
+key, as with the default replica identity.
+"""
+import random
+from typing import Callable, Dict, List, Tuple
+
+Row = Tuple[str, int, str]
+
+WORDS = (
+    "alpha bravo it's o'brien charlie delta \"echo\" fox golf hotel ' india "
+    "juliett kilo lima mike november oscar papa quebec romeo sierra tango"
+).split(" ")
+
+
+def text(rng: random.Random, n_words: int) -> str:
+    """Quoted text as test_decoding prints it, with quotes doubled"""
+    value = " ".join(rng.choice(WORDS) for _ in range(n_words))
+    return "'{}'".format(value.replace("'", "''"))
+
+
+def narrow(rng: random.Random, id: int) -> List[str]:
+    return [
+        "id[integer]:{}".format(id),
+        "name[text]:{}".format(text(rng, 2)),
+        "score[bigint]:{}".format(rng.randint(-(2**40), 2**40)),
+    ]
+
+
+def wide(rng: random.Random, id: int) -> List[str]:
+    columns = ["id[integer]:{}".format(id)]
+    for ix in range(1, 60):
+        kind = ix % 6
+        if kind == 0:
+            columns.append("n_{}[numeric(12,2)]:{:.2f}".format(ix, rng.random() * 1e6))
+        elif kind == 1:
+            columns.append("t_{}[text]:{}".format(ix, text(rng, 3)))
+        elif kind == 2:
+            columns.append("b_{}[boolean]:{}".format(ix, rng.choice(["true", "false"])))
+        elif kind == 3:
+            columns.append(
+                "ts_{}[timestamp with time zone]:'2023-{:02d}-{:02d} "
+                "12:{:02d}:00.{:06d}+00'".format(
+                    ix,
+                    rng.randint(1, 12),
+                    rng.randint(1, 28),
+                    rng.randint(0, 59),
+                    rng.randint(0, 999999),
+                )
+            )
+        elif kind == 4:
+            columns.append("i_{}[integer]:{}".format(ix, rng.randint(0, 10**6)))
+        else:
+            columns.append("v_{}[character varying(32)]:{}".format(ix, text(rng, 1)))
+    return columns
+
+
+def quoted(rng: random.Random, id: int) -> List[str]:
+    return [
+        "id[integer]:{}".format(id),
+        '"Display Name"[text]:{}'.format(text(rng, 4)),
+        "note[text]:'{}'".format("''" * rng.randint(1, 4) + " x ''quoted''"),
+        "body[text]:{}".format(text(rng, 12)),
+    ]
+
+
+def arrays(rng: random.Random, id: int) -> List[str]:
+    ints = ",".join(str(rng.randint(0, 1000)) for _ in range(rng.randint(0, 20)))
+    tags = ",".join(
+        rng.choice(["plain", '"two words"', '"it\'s"', "NULL", '"a\\"b"'])
+        for _ in range(rng.randint(1, 6))
+    ).replace("'", "''")
+    return [
+        "id[integer]:{}".format(id),
+        "ints[integer[]]:'{{{}}}'".format(ints),
+        "tags[text[]]:'{{{}}}'".format(tags),
+        "grid[integer[]]:'{{{{1,2}},{{3,{}}}}}'".format(rng.randint(0, 9)),
+    ]
+
+
+def nullable(rng: random.Random, id: int) -> List[str]:
+    columns = ["id[integer]:{}".format(id)]
+    for ix in range(8):
+        if rng.random() < 0.8:
+            columns.append("c_{}[text]:null".format(ix))
+        else:
+            columns.append("c_{}[text]:{}".format(ix, text(rng, 2)))
+    return columns
+
+
+def long_text(rng: random.Random, id: int) -> List[str]:
+    return [
+        "id[integer]:{}".format(id),
+        "body[text]:{}".format(text(rng, rng.randint(400, 1500))),
+    ]
+
+
+TABLES: Dict[str, Callable[[random.Random, int], List[str]]] = {
+    "narrow": narrow,
+    "wide": wide,
+    "quoted": quoted,
+    "arrays": arrays,
+    "nullable": nullable,
+    "long_text": long_text,
+}
+
+# Relative frequency of changes to each table
+WEIGHTS = {
+    "narrow": 40,
+    "wide": 10,
+    "quoted": 20,
+    "arrays": 15,
+    "nullable": 10,
+    "long_text": 5,
+}
+
+
+def change(rng: random.Random, table: str, id: int) -> str:
+    columns = TABLES[table](rng, id)
+    roll = rng.random()
+    if roll < 0.7:
+        return "table public.{}: INSERT: {}".format(table, " ".join(columns))
+    if roll < 0.9:
+        return "table public.{}: UPDATE: old-key: {} new-tuple: {}".format(
+            table, columns[0], " ".join(columns)
+        )
+    return "table public.{}: DELETE: {}".format(table, columns[0])
+
+
+def generate(n_rows: int, seed: int = 0, rows_per_transaction: int = 20) -> List[Row]:
+    """About *n_rows* (lsn, xid, data) rows, the same for the same arguments"""
+    rng = random.Random(seed)
+    tables = list(WEIGHTS)
+    weights = [WEIGHTS[table] for table in tables]
+
+    out: List[Row] = []
+    lsn = 0x16B3748
+    xid = 500
+    while len(out) < n_rows:
+        xid += 1
+        n_changes = max(1, min(rows_per_transaction, n_rows - len(out) - 2))
+        lsn += 8
+        out.append(("0/{:X}".format(lsn), xid, "BEGIN {}".format(xid)))
+        for _ in range(n_changes):
+            table = rng.choices(tables, weights)[0]
+            lsn += rng.randint(40, 400)
+            out.append(
+                ("0/{:X}".format(lsn), xid, change(rng, table, rng.randint(1, 10**6)))
+            )
+        lsn += 48
+        out.append(("0/{:X}".format(lsn), xid, "COMMIT {}".format(xid)))
+    return out
+
+
+def lines(n_rows: int, seed: int = 0) -> List[str]:
+    """The data of generate's rows"""
+    return [data for _, _, data in generate(n_rows, seed)]
@@ -0,0 +1,88 @@
+"""Benchmark results saved as JSON, for comparing throughput between releases
+
+A results file looks like::
+
+    {
+        "format": 1,
+        "realtime": "0.0.1",
+        "python": "3.11.7",
+        "platform": "Linux-6.1-x86_64",
+        "created": "2024-01-01T00:00:00Z",
+        "corpus": {"rows": 20000, "seed": 0},
+        "benchmarks": {
+            "parse": {"rows_per_second": 812345.6, "seconds": 0.0246},
+            ...
+        }
+    }
+
+Throughput is rows per second of the best of several repeats, so higher is
+better. compare reports benchmarks that are slower than a baseline by more
+than a tolerance.
+"""
+import json
+import platform
+import time
+from typing import Any, Dict, List, NamedTuple
+
+import realtime
+
+FORMAT = 1
+
+
+class Regression(NamedTuple):
+    name: str
+    baseline: float
+    current: float
+
+    @property
+    def change(self) -> float:
+        """Relative change in throughput, e.g. -0.2 for 20% slower"""
+        return self.current / self.baseline - 1
+
+
+def results(
+    corpus: Dict[str, Any], throughput: Dict[str, Dict[str, float]]
+) -> Dict[str, Any]:
+    return {
+        "format": FORMAT,
+        "realtime": realtime.__version__,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "created": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "corpus": corpus,
+        "benchmarks": throughput,
+    }
+
+
+def save(path: str, data: Dict[str, Any]) -> None:
+    with open(path, "w") as f:
+        json.dump(data, f, indent=2, sort_keys=True)
+        f.write("\n")
+
+
+def load(path: str) -> Dict[str, Any]:
+    with open(path) as f:
+        data = json.load(f)
+    if data.get("format") != FORMAT:
+        raise ValueError("Unsupported results format: {}".format(data.get("format")))
+    return data
+
+
+def compare(
+    baseline: Dict[str, Any], current: Dict[str, Any], tolerance: float = 0.1
+) -> List[Regression]:
+    """Benchmarks more than *tolerance* slower in *current* than in *baseline*
+
+    Benchmarks missing from either are skipped.
+    """
+    regressions = []
+    for name, before in sorted(baseline["benchmarks"].items()):
+        after = current["benchmarks"].get(name)
+        if after is None:
+            continue
+        regression = Regression(
+            name, before["rows_per_second"], after["rows_per_second"]
+        )
+        if regression.change < -tolerance:
+            regressions.append(regression)
+    return regressions
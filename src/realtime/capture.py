@@ -0,0 +1,304 @@
+"""Record the raw rows read from a slot, and replay them without a database
+
+A capture is a directory holding:
+
+- capture.json: the format version, output plugin and its options
+- NNNNNNNN.seg: append-only segments of (lsn, xid, data) records, each a
+  struct "!QqI" header of the lsn, xid (-1 when unknown) and data length,
+  followed by the data
+- NNNNNNNN.idx: each segment's sparse index of struct "!QQ" (key, offset)
+  entries. An entry is written at a transaction boundary every
+  INDEX_INTERVAL bytes, keyed by the highest lsn of the records before it
+"""
+import json
+import mmap
+import os
+import struct
+from bisect import bisect_left
+from typing import (
+    IO,
+    Any,
+    AsyncGenerator,
+    Dict,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+)
+
+from realtime.decoders import decoder_for
+from realtime.exceptions import CaptureException
+from realtime.filters import ChangeFilter
+from realtime.lsn import LSN, parse_lsn
+from realtime.message import Message
+from realtime.pgoutput import PgOutputDecoder
+
+__all__ = ["Capture", "Recorder", "replay"]
+
+FORMAT = 1
+HEADER = struct.Struct("!QqI")
+INDEX_ENTRY = struct.Struct("!QQ")
+INDEX_INTERVAL = 64 * 1024
+SEGMENT_SIZE = 64 * 1024 * 1024
+REPLAY_BATCH_SIZE = 10000
+
+Record = Tuple[int, Optional[int], Any]
+
+
+def segment_path(path: str, number: int, suffix: str) -> str:
+    return os.path.join(path, "{:08d}{}".format(number, suffix))
+
+
+def segment_numbers(path: str) -> List[int]:
+    return sorted(
+        int(name[:-4])
+        for name in os.listdir(path)
+        if name.endswith(".seg") and name[:-4].isdigit()
+    )
+
+
+class Recorder:
+    """Append the (lsn, xid, data) rows read from a slot to a capture
+
+    Segments are rolled over at a transaction boundary once they reach
+    *segment_size* bytes. Opening an existing capture appends to it in a
+    new segment.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        plugin: str = "test_decoding",
+        options: Optional[Dict[str, str]] = None,
+        segment_size: int = SEGMENT_SIZE,
+    ) -> None:
+        self.path = path
+        self.plugin = plugin
+        self.options = dict(options or {})
+        self.segment_size = segment_size
+        self.segment: Optional[IO[bytes]] = None
+        self.index: Optional[IO[bytes]] = None
+        self.offset = 0
+        self.indexed = 0
+        self.max_lsn = 0
+        self.xid: Optional[int] = None
+
+        os.makedirs(path, exist_ok=True)
+        meta_path = os.path.join(path, "capture.json")
+        if os.path.exists(meta_path):
+            meta = read_meta(path)
+            if meta["plugin"] != plugin:
+                raise CaptureException(
+                    "Capture {} holds {} rows, not {}".format(
+                        path, meta["plugin"], plugin
+                    )
+                )
+            capture = Capture(path)
+            try:
+                self.max_lsn = capture.max_lsn()
+            finally:
+                capture.close()
+        else:
+            with open(meta_path, "w") as f:
+                json.dump(dict(format=FORMAT, plugin=plugin, options=self.options), f)
+
+        numbers = segment_numbers(path)
+        self.number = numbers[-1] + 1 if numbers else 0
+        self.open_segment()
+
+    def open_segment(self) -> None:
+        self.close()
+        self.segment = open(segment_path(self.path, self.number, ".seg"), "ab")
+        self.index = open(segment_path(self.path, self.number, ".idx"), "ab")
+        self.offset = 0
+        self.indexed = 0
+        self.index.write(INDEX_ENTRY.pack(self.max_lsn, 0))
+
+    def write(self, rows: Sequence[Tuple[LSN, Optional[int], Any]]) -> None:
+        """Append a fetch of rows and flush them to the operating system"""
+        assert self.segment is not None and self.index is not None
+        for lsn, xid, data in rows:
+            if xid != self.xid:
+                # A transaction boundary
+                self.xid = xid
+                if self.offset >= self.segment_size:
+                    self.number += 1
+                    self.open_segment()
+                elif self.offset - self.indexed >= INDEX_INTERVAL:
+                    self.index.write(INDEX_ENTRY.pack(self.max_lsn, self.offset))
+                    self.indexed = self.offset
+
+            raw = data.encode() if isinstance(data, str) else bytes(data)
+            lsn = parse_lsn(lsn)
+            self.segment.write(HEADER.pack(lsn, -1 if xid is None else xid, len(raw)))
+            self.segment.write(raw)
+            self.offset += HEADER.size + len(raw)
+            if lsn > self.max_lsn:
+                self.max_lsn = lsn
+
+        self.segment.flush()
+        self.index.flush()
+
+    def close(self) -> None:
+        for f in (self.segment, self.index):
+            if f is not None:
+                f.close()
+        self.segment = self.index = None
+
+    def __enter__(self) -> "Recorder":
+        return self
+
+    def __exit__(self, *_: Any) -> None:
+        self.close()
+
+
+def read_meta(path: str) -> Dict[str, Any]:
+    with open(os.path.join(path, "capture.json")) as f:
+        meta = json.load(f)
+    if meta.get("format") != FORMAT:
+        raise CaptureException("Unsupported capture format: {}".format(meta))
+    return meta
+
+
+class Capture:
+    """Read the records of a capture through memory maps of its segments"""
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        meta = read_meta(path)
+        self.plugin: str = meta["plugin"]
+        self.options: Dict[str, str] = meta["options"]
+        self.maps: List[mmap.mmap] = []
+        # (key, segment, offset) across every segment, in order
+        self.index: List[Tuple[int, int, int]] = []
+
+        for number in segment_numbers(path):
+            segment = len(self.maps)
+            with open(segment_path(path, number, ".seg"), "rb") as f:
+                size = os.fstat(f.fileno()).st_size
+                if size == 0:
+                    continue
+                self.maps.append(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+            with open(segment_path(path, number, ".idx"), "rb") as f:
+                index = f.read()
+            for key, offset in INDEX_ENTRY.iter_unpack(
+                index[: len(index) - len(index) % INDEX_ENTRY.size]
+            ):
+                if offset < size:
+                    self.index.append((key, segment, offset))
+        self.keys = [key for key, _, _ in self.index]
+
+    def close(self) -> None:
+        for segment in self.maps:
+            segment.close()
+        self.maps = []
+
+    def __enter__(self) -> "Capture":
+        return self
+
+    def __exit__(self, *_: Any) -> None:
+        self.close()
+
+    def records(self, segment: int = 0, offset: int = 0) -> Iterator[Record]:
+        """(lsn, xid, data) records from *offset* in *segment* to the end
+
+        Data is a str for text plugins and bytes for binary ones. A record
+        cut short, e.g. by a crash while recording, ends its segment.
+        """
+        text = self.plugin != "pgoutput"
+        unpack = HEADER.unpack_from
+        for data_map in self.maps[segment:]:
+            end = len(data_map)
+            while offset + HEADER.size <= end:
+                lsn, xid, length = unpack(data_map, offset)
+                start = offset + HEADER.size
+                offset = start + length
+                if offset > end:
+                    break
+                data = data_map[start:offset]
+                yield lsn, None if xid == -1 else xid, data.decode() if text else data
+            offset = 0
+
+    def seek(self, from_lsn: int) -> Tuple[int, int]:
+        """The (segment, offset) of an index entry before every transaction
+        that committed at or after *from_lsn*
+        """
+        ix = bisect_left(self.keys, from_lsn) - 1
+        if ix < 0:
+            return 0, 0
+        _, segment, offset = self.index[ix]
+        return segment, offset
+
+    def max_lsn(self) -> int:
+        max_lsn = self.keys[-1] if self.keys else 0
+        if self.index:
+            _, segment, offset = self.index[-1]
+            for lsn, _, _ in self.records(segment, offset):
+                max_lsn = max(max_lsn, lsn)
+        return max_lsn
+
+    def rows(self, from_lsn: Optional[LSN] = None) -> Iterator[Record]:
+        """(lsn, xid, data) records of the transactions that committed at or
+        after *from_lsn*, or of every transaction
+        """
+        if from_lsn is None:
+            yield from self.records()
+            return
+
+        from_lsn = parse_lsn(from_lsn)
+        segment, offset = self.seek(from_lsn)
+        # Buffer each transaction until its last row, its commit, is known
+        pending: List[Record] = []
+        records = self.records(segment, offset)
+        for record in records:
+            if pending and record[1] != pending[-1][1]:
+                if pending[-1][0] >= from_lsn:
+                    break
+                pending = []
+            pending.append(record)
+        else:
+            if pending and pending[-1][0] >= from_lsn:
+                yield from pending
+            return
+
+        yield from pending
+        yield record
+        yield from records
+
+
+async def replay(
+    path: str,
+    from_lsn: Optional[LSN] = None,
+    where: Optional[ChangeFilter] = None,
+) -> AsyncGenerator[Message, None]:
+    """Replay the messages of a capture recorded with subscribe(..., record=)
+
+    Yields the messages subscribe delivered, without a database, starting
+    with the first transaction that committed at or after *from_lsn*. The
+    capture's index is used to skip to it. *where* drops unwanted changes.
+
+    pgoutput describes each table once, so replaying it from an LSN still
+    decodes the relation messages recorded before that LSN.
+    """
+    with Capture(path) as capture:
+        decoder = decoder_for(capture.plugin, {}, where)
+        if isinstance(decoder, PgOutputDecoder) and from_lsn is not None:
+            start = parse_lsn(from_lsn)
+            decoder.decode_many(
+                [
+                    data
+                    for lsn, _, data in capture.records()
+                    if lsn < start and data[:1] in (b"R", b"Y")
+                ]
+            )
+
+        batch: List[Any] = []
+        for _, _, data in capture.rows(from_lsn):
+            batch.append(data)
+            if len(batch) == REPLAY_BATCH_SIZE:
+                for _, message in decoder.decode_many(batch):
+                    yield message
+                batch = []
+        for _, message in decoder.decode_many(batch):
+            yield message
@@ -0,0 +1,238 @@
+"""Changes as column-oriented batches for analytics consumers
+
+A fetch's changes are grouped by (schema, table, command) into
+ColumnarBatch objects holding one array of values per column and a null
+mask. Integer, float and boolean columns are converted a whole column at a
+time into array.array buffers, which NumPy and Arrow read without copying.
+"""
+from array import array
+from itertools import repeat
+from operator import is_
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    AsyncGenerator,
+    AsyncIterable,
+    Dict,
+    Iterable,
+    List,
+    Optional,
+    Tuple,
+    Union,
+)
+
+from realtime.convert import UNCHANGED_TOAST, boolean, converter_for
+from realtime.message import CRUDMessage, Message, MessageBatch
+from realtime.windows import windowed
+
+if TYPE_CHECKING:  # pragma: no cover
+    import pyarrow
+
+__all__ = ["ColumnarBatch", "columnar", "subscribe_columnar"]
+
+# array.array type codes of the types converted a column at a time
+TYPECODES = {
+    "smallint": "h",
+    "integer": "i",
+    "bigint": "q",
+    "oid": "I",
+    "real": "f",
+    "double precision": "d",
+    "boolean": "B",
+}
+
+UNCHANGED = "unchanged-toast-datum"
+
+Values = Union["array[Any]", List[Any]]
+
+
+def convert_column(
+    data_type: str, texts: List[Optional[str]]
+) -> Tuple[Values, bytearray, Optional[bytearray]]:
+    """A column's values, null mask and, when it has any, unchanged TOAST mask"""
+    nulls = bytearray(map(is_, texts, repeat(None)))
+    typecode = TYPECODES.get(data_type)
+    converter = converter_for(data_type)
+
+    if typecode is not None and converter in (int, float, boolean):
+        if any(nulls):
+            texts = ["0" if value is None else value for value in texts]
+        if converter is boolean:
+            return array(typecode, map("true".__eq__, texts)), nulls, None
+        return array(typecode, map(converter, texts)), nulls, None  # type: ignore
+
+    unchanged = None
+    if UNCHANGED in texts:
+        unchanged = bytearray(map(UNCHANGED.__eq__, texts))
+    values = [
+        None
+        if value is None
+        else UNCHANGED_TOAST
+        if value == UNCHANGED
+        else converter(value)
+        for value in texts
+    ]
+    return values, nulls, unchanged
+
+
+class ColumnarBatch:
+    """The changes of one command to one table, column by column
+
+    *columns* maps each column name to its values: an array.array for
+    integer, float and boolean columns, with 0 in place of nulls, otherwise a
+    list of python values as Column.typed converts them. *nulls* maps each
+    name to a bytearray that is 1 where the value is null or the change did
+    not include the column. *unchanged* holds a mask of the values an update
+    left as unchanged TOAST, for the columns that have any.
+    """
+
+    def __init__(
+        self,
+        schema: Optional[str],
+        table: str,
+        command: str,
+        data_types: Dict[str, str],
+        texts: Dict[str, List[Optional[str]]],
+        length: int,
+    ) -> None:
+        self.schema = schema
+        self.table = table
+        self.command = command
+        self.data_types = data_types
+        self.length = length
+        self.columns: Dict[str, Values] = {}
+        self.nulls: Dict[str, bytearray] = {}
+        self.unchanged: Dict[str, bytearray] = {}
+
+        for name, column_texts in texts.items():
+            values, nulls, unchanged = convert_column(data_types[name], column_texts)
+            self.columns[name] = values
+            self.nulls[name] = nulls
+            if unchanged is not None:
+                self.unchanged[name] = unchanged
+
+    def __len__(self) -> int:
+        return self.length
+
+    def __repr__(self) -> str:
+        return "ColumnarBatch(schema={!r}, table={!r}, command={!r}, rows={})".format(
+            self.schema, self.table, self.command, self.length
+        )
+
+    def to_numpy(self) -> Dict[str, Any]:
+        """Columns as numpy masked arrays, sharing the buffers of array columns"""
+        import numpy
+
+        out = {}
+        for name, values in self.columns.items():
+            mask = numpy.frombuffer(self.nulls[name], dtype=numpy.bool_)
+            if isinstance(values, array):
+                data = numpy.frombuffer(values, dtype=values.typecode)
+                if values.typecode == "B":
+                    data = data.view(numpy.bool_)
+            else:
+                data = numpy.empty(len(values), dtype=object)
+                data[:] = values
+            out[name] = numpy.ma.MaskedArray(data, mask=mask)
+        return out
+
+    def to_arrow(self) -> "pyarrow.RecordBatch":
+        """Columns as a pyarrow RecordBatch, with unchanged TOAST values as nulls"""
+        import numpy
+        import pyarrow
+
+        arrays = []
+        for name, values in self.columns.items():
+            if isinstance(values, array):
+                mask = numpy.frombuffer(self.nulls[name], dtype=numpy.bool_)
+                data = numpy.frombuffer(values, dtype=values.typecode)
+                if values.typecode == "B":
+                    data = data.view(numpy.bool_)
+                arrays.append(pyarrow.array(data, mask=mask))
+            else:
+                arrays.append(
+                    pyarrow.array(
+                        [
+                            None if value is UNCHANGED_TOAST else value
+                            for value in values
+                        ]
+                    )
+                )
+        return pyarrow.RecordBatch.from_arrays(arrays, names=list(self.columns))
+
+
+def columnar(messages: Union[MessageBatch, Iterable[Message]]) -> List[ColumnarBatch]:
+    """Group the changes in *messages*, e.g. a fetch, into ColumnarBatches
+
+    Batches are in the order their (schema, table, command) first appears,
+    and keep the order of their changes. Transaction messages are skipped.
+    Reading a MessageBatch, or messages whose columns have not been read,
+    skips building Column objects altogether.
+    """
+    if isinstance(messages, MessageBatch):
+        changes: Iterable[Tuple[Any, ...]] = (
+            item[:4] for item in messages.items if len(item) == 5
+        )
+    else:
+        changes = (
+            (message.command, message.schema, message.table, message.raw_columns()[0])
+            for message in messages
+            if isinstance(message, CRUDMessage)
+        )
+
+    groups: Dict[
+        Tuple[Optional[str], str, str],
+        Tuple[Dict[str, str], Dict[str, List[Optional[str]]], List[int]],
+    ] = {}
+    for command, schema, table, columns in changes:
+        key = (schema, table, command)
+        try:
+            data_types, texts, length = groups[key]
+        except KeyError:
+            data_types, texts, length = groups[key] = ({}, {}, [0])
+
+        n_rows = length[0]
+        for name, data_type, value in columns:
+            try:
+                column_texts = texts[name]
+            except KeyError:
+                column_texts = texts[name] = []
+                data_types[name] = data_type
+            if len(column_texts) < n_rows:
+                # Missing from earlier changes
+                column_texts.extend(repeat(None, n_rows - len(column_texts)))
+            column_texts.append(value)
+        length[0] = n_rows + 1
+
+    out = []
+    for (schema, table, command), (data_types, texts, length) in groups.items():
+        for column_texts in texts.values():
+            column_texts.extend(repeat(None, length[0] - len(column_texts)))
+        out.append(ColumnarBatch(schema, table, command, data_types, texts, length[0]))
+    return out
+
+
+async def subscribe_columnar(
+    messages: AsyncIterable[Message],
+    max_rows: int = 10_000,
+    max_delay: float = 1.0,
+) -> AsyncGenerator[List[ColumnarBatch], None]:
+    """ColumnarBatches of the changes in *messages*, e.g. a subscription
+
+    Changes are collected until *max_rows* have been read or the oldest
+    has waited *max_delay* seconds, and batches are only cut at transaction
+    boundaries. When a list of batches is yielded, every transaction in it
+    has been delivered, so an AckTracker's ack() acknowledges them.
+    """
+    window: List[Message] = []
+    windows = windowed(messages, max_rows, max_delay)
+    try:
+        async for message in windows:
+            if message is None:
+                if window:
+                    yield columnar(window)
+                window = []
+            elif isinstance(message, CRUDMessage):
+                window.append(message)
+    finally:
+        await windows.aclose()
@@ -0,0 +1,186 @@
+from itertools import count
+from typing import AsyncGenerator, AsyncIterable, Dict, Hashable, List, Optional
+
+from realtime.keys import PrimaryKeys
+from realtime.message import Column, CRUDMessage, Message
+from realtime.metrics import Metrics
+from realtime.windows import windowed
+
+__all__ = ["Compactor", "compact"]
+
+
+def merge_columns(before: List[Column], after: List[Column]) -> List[Column]:
+    """*after*'s columns, keeping *before*'s values of unchanged TOAST columns"""
+    previous = {column.column: column for column in before}
+    return [
+        previous.get(column.column, column)
+        if column.value == "unchanged-toast-datum"
+        else column
+        for column in after
+    ]
+
+
+class Compactor:
+    """Merge the changes to each row within a window into their net effect
+
+    Changes are merged per (schema, table, key values), with keys from
+    *keys*:
+
+    - INSERT then UPDATE is an INSERT of the final values
+    - INSERT then DELETE is nothing
+    - UPDATE then UPDATE is an UPDATE of the final values
+    - UPDATE then DELETE is a DELETE
+    - DELETE then INSERT is an UPDATE of the new values, of the row under
+      the key it was deleted by
+
+    A TRUNCATE drops the pending changes to its table. Changes to tables
+    without a known key are passed through unmerged. Each net change is
+    emitted in the position of the last change it merged.
+
+    compact closes a window once it has received *max_changes* changes or
+    has been open for *max_delay* seconds. *ratio* is changes received per
+    change emitted, and each window's ratio is reported to *metrics* as
+    "compaction_ratio" when given.
+    """
+
+    def __init__(
+        self,
+        keys: Optional[PrimaryKeys] = None,
+        max_changes: int = 10_000,
+        max_delay: float = 1.0,
+        metrics: Optional[Metrics] = None,
+    ) -> None:
+        self.keys = keys or PrimaryKeys()
+        self.max_changes = max_changes
+        self.max_delay = max_delay
+        self.metrics = metrics
+        self.pending: Dict[Hashable, CRUDMessage] = {}
+        self.unkeyed = count()
+        self.received = 0
+        self.emitted = 0
+        self.window_received = 0
+
+    @property
+    def ratio(self) -> float:
+        """Changes received per change emitted, over every window so far"""
+        if not self.received:
+            return 1.0
+        return self.received / self.emitted if self.emitted else float("inf")
+
+    def add(self, message: CRUDMessage) -> None:
+        self.received += 1
+        self.window_received += 1
+
+        if message.command == "TRUNCATE":
+            table = (message.schema, message.table)
+            for key, pending in list(self.pending.items()):
+                if (pending.schema, pending.table) == table:
+                    del self.pending[key]
+            self.pending[next(self.unkeyed)] = message
+            return
+
+        key = self.keys.key(message)
+        if len(key) == 2:  # type: ignore
+            # No key to merge on
+            self.pending[next(self.unkeyed)] = message
+            return
+
+        # Reinserted to move the row's net change after every earlier change
+        previous = self.pending.pop(key, None)
+        if previous is None:
+            self.pending[key] = message
+        elif message.command == "DELETE":
+            if previous.command == "INSERT":
+                # Inserted and deleted within the window
+                return
+            if previous.old_key is not None:
+                # The row is still under its old key until the update is applied
+                self.pending[key] = self.merged("DELETE", message, previous.old_key)
+            else:
+                self.pending[key] = message
+        elif message.command == "INSERT":
+            if previous.command == "DELETE":
+                # A delete merged from a key change removes the row under its
+                # old key, which the update must then move
+                moved = self.keys.key(previous) != key
+                self.pending[key] = self.merged(
+                    "UPDATE",
+                    message,
+                    message.columns,
+                    previous.columns if moved else None,
+                )
+            else:
+                self.pending[key] = message
+        else:
+            command = "INSERT" if previous.command == "INSERT" else "UPDATE"
+            self.pending[key] = self.merged(
+                command,
+                message,
+                merge_columns(previous.columns, message.columns),
+                previous.old_key if previous.old_key is not None else message.old_key,
+            )
+
+    @staticmethod
+    def merged(
+        command: str,
+        message: CRUDMessage,
+        columns: List[Column],
+        old_key: Optional[List[Column]] = None,
+    ) -> CRUDMessage:
+        return CRUDMessage(
+            command=command,  # type: ignore
+            schema=message.schema,
+            table=message.table,
+            columns=columns,
+            old_key=old_key if command == "UPDATE" else None,
+        )
+
+    def flush(self) -> List[CRUDMessage]:
+        """The net changes of the window, closing it"""
+        out = list(self.pending.values())
+        self.pending = {}
+        self.emitted += len(out)
+
+        if self.metrics is not None and self.window_received:
+            window_ratio = self.window_received / len(out) if out else float("inf")
+            self.metrics.emit("compaction_ratio", window_ratio)
+
+        self.window_received = 0
+        return out
+
+
+async def compact(
+    messages: AsyncIterable[Message], compactor: Optional[Compactor] = None
+) -> AsyncGenerator[Message, None]:
+    """Compact the changes of *messages*, e.g. a subscription, in windows
+
+    Windows close at transaction boundaries, so the transactions of a
+    window are delivered as one: the first BEGIN, the net changes, then the
+    last COMMIT. Acknowledging that COMMIT acknowledges the whole window.
+    A window that is full by age is delivered even when no further
+    messages arrive.
+    """
+    compactor = compactor or Compactor()
+    begin: Optional[Message] = None
+    commit: Optional[Message] = None
+
+    windows = windowed(messages, compactor.max_changes, compactor.max_delay)
+    try:
+        async for message in windows:
+            if message is None:
+                if begin is not None:
+                    yield begin
+                for change in compactor.flush():
+                    yield change
+                if commit is not None:
+                    yield commit
+                begin = commit = None
+            elif isinstance(message, CRUDMessage):
+                compactor.add(message)
+            elif message.command == "BEGIN":
+                if begin is None:
+                    begin = message
+            else:
+                commit = message
+    finally:
+        await windows.aclose()
@@ -0,0 +1,310 @@
+"""Conversion of test_decoding column text to python values
+
+Converters are registered by type name, e.g. "integer" or "timestamp with
+time zone", and resolved once per data_type string as it appears on
+columns, including type modifiers and array suffixes.
+"""
+import json
+import re
+from datetime import date, datetime, time, timedelta, timezone
+from decimal import Decimal
+from typing import TYPE_CHECKING, Any, Callable, Dict, Iterable, List, Optional
+from uuid import UUID
+
+if TYPE_CHECKING:  # pragma: no cover
+    from realtime.message import CRUDMessage
+
+__all__ = [
+    "Converter",
+    "UNCHANGED_TOAST",
+    "column_values",
+    "convert",
+    "converter_for",
+    "register_converter",
+]
+
+Converter = Callable[[str], Any]
+
+
+class UnchangedToast:
+    """Placeholder for a TOASTed value an update left unchanged"""
+
+    def __repr__(self) -> str:
+        return "UNCHANGED_TOAST"
+
+
+UNCHANGED_TOAST = UnchangedToast()
+
+
+def unescape(value: str) -> str:
+    """Undo the doubling of quotes in test_decoding's quoted values"""
+    return value.replace("''", "'")
+
+
+def boolean(value: str) -> bool:
+    # Array elements are printed t or f
+    return value == "true" or value == "t"
+
+
+def bytea(value: str) -> bytes:
+    # Hex output format: \x0a1b...
+    return bytes.fromhex(value[2:])
+
+
+def jsonb(value: str) -> Any:
+    return json.loads(value)
+
+
+def uuid(value: str) -> UUID:
+    return UUID(value)
+
+
+TIMESTAMP = re.compile(
+    r"(\d{4,})-(\d\d)-(\d\d)(?: (\d\d):(\d\d):(\d\d)(?:\.(\d+))?)?"
+    r"(?:([+-])(\d\d)(?::(\d\d))?(?::(\d\d))?)?( BC)?$"
+)
+TIME = re.compile(r"(\d\d):(\d\d):(\d\d)(?:\.(\d+))?(?:([+-])(\d\d)(?::(\d\d))?)?$")
+
+
+def offset(
+    sign: str, hours: str, minutes: Optional[str], seconds: Optional[str] = None
+) -> timezone:
+    delta = timedelta(
+        hours=int(hours), minutes=int(minutes or 0), seconds=int(seconds or 0)
+    )
+    return timezone(-delta if sign == "-" else delta)
+
+
+def micros(fraction: Optional[str]) -> int:
+    return int((fraction or "0").ljust(6, "0")[:6])
+
+
+def timestamp(value: str) -> Any:
+    """date, timestamp and timestamptz text in the ISO DateStyle"""
+    if value == "infinity":
+        return datetime.max
+    if value == "-infinity":
+        return datetime.min
+
+    match = TIMESTAMP.match(value)
+    if match is None or match.group(12):
+        raise ValueError("Unsupported timestamp: {}".format(value))
+    year, month, day, hour, minute, second, fraction, sign = match.groups()[:8]
+
+    if hour is None:
+        return date(int(year), int(month), int(day))
+
+    tzinfo = None
+    if sign is not None:
+        tzinfo = offset(sign, *match.group(9, 10, 11))
+    return datetime(
+        int(year),
+        int(month),
+        int(day),
+        int(hour),
+        int(minute),
+        int(second),
+        micros(fraction),
+        tzinfo,
+    )
+
+
+def calendar_date(value: str) -> date:
+    if value == "infinity":
+        return date.max
+    if value == "-infinity":
+        return date.min
+    return timestamp(value)  # type: ignore
+
+
+def time_of_day(value: str) -> time:
+    match = TIME.match(value)
+    if match is None:
+        raise ValueError("Unsupported time: {}".format(value))
+    hour, minute, second, fraction, sign, tz_hours, tz_minutes = match.groups()
+    tzinfo = offset(sign, tz_hours, tz_minutes) if sign is not None else None
+    return time(int(hour), int(minute), int(second), micros(fraction), tzinfo)
+
+
+def text(value: str) -> str:
+    return value
+
+
+CONVERTERS: Dict[str, Converter] = {
+    "smallint": int,
+    "integer": int,
+    "bigint": int,
+    "oid": int,
+    "real": float,
+    "double precision": float,
+    "numeric": Decimal,
+    "boolean": boolean,
+    "text": text,
+    "character varying": text,
+    "character": text,
+    "name": text,
+    "bytea": bytea,
+    "json": jsonb,
+    "jsonb": jsonb,
+    "uuid": uuid,
+    "date": calendar_date,
+    "timestamp without time zone": timestamp,
+    "timestamp with time zone": timestamp,
+    "time without time zone": time_of_day,
+    "time with time zone": time_of_day,
+}
+
+# Converters of types whose text never contains a quote
+VERBATIM = {
+    int,
+    float,
+    Decimal,
+    boolean,
+    bytea,
+    uuid,
+    calendar_date,
+    timestamp,
+    time_of_day,
+}
+
+# Converters by data_type as it appears on columns e.g. "numeric(10,2)"
+_resolved: Dict[str, Converter] = {}
+
+TYPMOD = re.compile(r"\(\d+(?:,\d+)?\)")
+
+
+def register_converter(type_name: str, converter: Converter) -> None:
+    """Convert values of *type_name* with *converter*
+
+    *type_name* is a name as test_decoding prints it, without a type
+    modifier e.g. "character varying", or with one to override that case
+    alone e.g. "numeric(10,2)". The converter receives the value's text, with
+    doubled quotes already undone, and is also used for array elements.
+    """
+    CONVERTERS[type_name] = converter
+    _resolved.clear()
+
+
+def converter_for(data_type: str) -> Converter:
+    """The converter for a column's data_type, resolved once per name"""
+    try:
+        return _resolved[data_type]
+    except KeyError:
+        pass
+
+    converter = resolve(data_type)
+    _resolved[data_type] = converter
+    return converter
+
+
+def base_converter(data_type: str) -> Converter:
+    converter = CONVERTERS.get(data_type) or CONVERTERS.get(TYPMOD.sub("", data_type))
+    # Unknown types e.g. enums and domains are left as text
+    return converter or text
+
+
+def resolve(data_type: str) -> Converter:
+    if data_type.endswith("[]"):
+        element = base_converter(data_type[:-2])
+        return lambda value: parse_array(unescape(value), element)
+
+    converter = base_converter(data_type)
+    if converter is text:
+        return unescape
+    if converter in VERBATIM:
+        return converter
+    return lambda value: converter(unescape(value))
+
+
+def convert(data_type: str, value: Optional[str]) -> Any:
+    """A column's text as a python value
+
+    Nulls convert to None and unchanged TOASTed values to UNCHANGED_TOAST.
+    """
+    if value is None:
+        return None
+    if value == "unchanged-toast-datum":
+        return UNCHANGED_TOAST
+    return converter_for(data_type)(value)
+
+
+def column_values(messages: Iterable["CRUDMessage"], name: str) -> List[Any]:
+    """Python values of column *name* across *messages*
+
+    The converter is resolved once per data_type rather than once per
+    value. Messages without the column give None.
+    """
+    out: List[Any] = []
+    append = out.append
+    data_type = None
+    converter: Converter = text
+
+    for message in messages:
+        for column in message.columns:
+            if column.column == name:
+                value = column.value
+                if column.data_type != data_type:
+                    data_type = column.data_type
+                    converter = converter_for(data_type)
+                if value is None:
+                    append(None)
+                elif value == "unchanged-toast-datum":
+                    append(UNCHANGED_TOAST)
+                else:
+                    append(converter(value))
+                break
+        else:
+            append(None)
+
+    return out
+
+
+def parse_array(value: str, element: Converter) -> List[Any]:
+    """Parse a postgres array literal e.g. {1,NULL,"a b"}, converting elements"""
+    if value[:1] == "[":
+        # Explicit dimensions e.g. [0:1]={1,2}
+        value = value[value.index("=") + 1 :]
+
+    stack: List[List[Any]] = []
+    out: List[Any] = []
+    pos = 0
+    end = len(value)
+
+    try:
+        while pos < end:
+            char = value[pos]
+            if char == "{":
+                stack.append(out)
+                out = []
+                pos += 1
+            elif char == "}":
+                done = out
+                out = stack.pop()
+                out.append(done)
+                pos += 1
+            elif char == ",":
+                pos += 1
+            elif char == '"':
+                pos += 1
+                chars = []
+                while value[pos] != '"':
+                    if value[pos] == "\\":
+                        pos += 1
+                    chars.append(value[pos])
+                    pos += 1
+                out.append(element("".join(chars)))
+                pos += 1
+            else:
+                stop = pos
+                while value[stop] not in ",}":
+                    stop += 1
+                item = value[pos:stop]
+                out.append(None if item == "NULL" else element(item))
+                pos = stop
+    except IndexError:
+        # Unbalanced braces or an unterminated element
+        stack.append(out)
+
+    if stack or len(out) != 1:
+        raise ValueError("Malformed array literal: {}".format(value))
+    return out[0]
@@ -0,0 +1,94 @@
+from typing import Any, Dict, Iterable, Optional, Sequence, Tuple
+
+from typing_extensions import Protocol
+
+from realtime.filters import ChangeFilter
+from realtime.message import Message, parse_many
+from realtime.pgoutput import PgOutputDecoder
+from realtime.wal2json import Wal2JsonDecoder
+
+__all__ = ["Decoder", "TestDecodingDecoder", "decoder_for"]
+
+
+class Decoder(Protocol):
+    """Turns a logical decoding output plugin's rows into messages
+
+    *plugin* names the output plugin a slot is created with, *options* are
+    passed to it when reading, and *binary* selects the bytea variants of
+    the pg_logical_slot_*_changes functions. Changes *where* does not want
+    are dropped before their columns are decoded.
+    """
+
+    plugin: str
+    options: Dict[str, str]
+    binary: bool
+    where: Optional[ChangeFilter]
+
+    def decode_many(self, rows: Sequence[Any]) -> Iterable[Tuple[int, Message]]:
+        """Decode the data of a fetch's rows into (row index, message) pairs
+
+        A row may decode to no messages, e.g. pgoutput's relation metadata,
+        or to several.
+        """
+        ...
+
+
+class TestDecodingDecoder:
+    """Parse the text output of the test_decoding plugin"""
+
+    __test__ = False
+
+    plugin = "test_decoding"
+    binary = False
+
+    def __init__(self) -> None:
+        self.options: Dict[str, str] = {}
+        self.where: Optional[ChangeFilter] = None
+
+    def decode_many(self, rows: Sequence[Any]) -> Iterable[Tuple[int, Message]]:
+        lines = [
+            data if isinstance(data, str) else bytes(data).decode() for data in rows
+        ]
+        # Columns are only tokenized when read
+        return self.select(parse_many(lines))
+
+    def select(self, messages: Iterable[Message]) -> Iterable[Tuple[int, Message]]:
+        """(row index, message) pairs of the parsed *messages* where wants"""
+        pairs = enumerate(messages)
+        where = self.where
+        if where is None:
+            return pairs
+        return [
+            (ix, message)
+            for ix, message in pairs
+            if message.command in ("BEGIN", "COMMIT")
+            or where.wants(
+                message.schema, message.table, message.command  # type: ignore
+            )
+        ]
+
+
+DECODERS = {
+    "test_decoding": TestDecodingDecoder,
+    "pgoutput": PgOutputDecoder,
+    "wal2json": Wal2JsonDecoder,
+}
+
+
+def decoder_for(
+    plugin: str, options: Dict[str, str], where: Optional[ChangeFilter] = None
+) -> Decoder:
+    """A decoder for *plugin* that passes it *options* in addition to its defaults
+
+    With *where*, unwanted changes are dropped and any options that filter
+    them on the server are added.
+    """
+    try:
+        decoder: Decoder = DECODERS[plugin]()
+    except KeyError:
+        raise ValueError("Unsupported output plugin: {}".format(plugin)) from None
+    if where is not None:
+        decoder.where = where
+        decoder.options.update(where.plugin_options(plugin))
+    decoder.options.update(options)
+    return decoder
@@ -0,0 +1,76 @@
+from collections import deque
+from typing import Deque, Optional, Tuple
+
+from realtime.lsn import LSN, parse_lsn
+
+__all__ = ["AckTracker"]
+
+
+class AckTracker:
+    """Acknowledgements for at-least-once delivery from a replication slot
+
+    Pass an AckTracker to subscribe to read the slot without consuming it.
+    Call ack once messages have been processed; the slot is advanced past
+    acknowledged transactions the next time subscribe fetches, so several
+    acks cost a single round trip. Transactions that were delivered but not
+    acknowledged are delivered again after a restart.
+    """
+
+    def __init__(self) -> None:
+        self.delivered_lsn: Optional[int] = None
+        self.acked_lsn: Optional[int] = None
+        self.confirmed_lsn: Optional[int] = None
+        self._rows_delivered = 0
+        self._rows_acked = 0
+        self._rows_confirmed = 0
+        # (commit lsn, rows delivered through that commit) for unconfirmed commits
+        self._commits: Deque[Tuple[int, int]] = deque()
+
+    @property
+    def rows_pending(self) -> int:
+        """Rows delivered since the slot's confirmed position"""
+        return self._rows_delivered - self._rows_confirmed
+
+    @property
+    def caught_up(self) -> bool:
+        """Whether everything delivered so far has been acknowledged"""
+        return self._rows_acked == self._rows_delivered
+
+    def ack(self, lsn: Optional[LSN] = None) -> None:
+        """Acknowledge every message delivered so far, or commits up to *lsn*"""
+        if lsn is None:
+            self._rows_acked = self._rows_delivered
+            return
+        lsn = parse_lsn(lsn)
+        if self.acked_lsn is None or lsn > self.acked_lsn:
+            self.acked_lsn = lsn
+
+    def delivered(self, lsn: LSN, commit: bool) -> None:
+        """Record that the slot row at *lsn* was handed to the consumer
+
+        Rows are counted rather than compared by LSN, since the rows of
+        interleaved transactions are not in LSN order.
+        """
+        lsn = parse_lsn(lsn)
+        self.delivered_lsn = lsn
+        self._rows_delivered += 1
+        if commit:
+            self._commits.append((lsn, self._rows_delivered))
+
+    def confirmable(self) -> Optional[int]:
+        """The last acknowledged commit the slot can be advanced to, if any
+
+        Marks it confirmed, so the caller must advance the slot.
+        """
+        target: Optional[Tuple[int, int]] = None
+        while self._commits and (
+            self._commits[0][1] <= self._rows_acked
+            or (self.acked_lsn is not None and self._commits[0][0] <= self.acked_lsn)
+        ):
+            target = self._commits.popleft()
+
+        if target is None:
+            return None
+
+        self.confirmed_lsn, self._rows_confirmed = target
+        return self.confirmed_lsn
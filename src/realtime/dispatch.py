@@ -0,0 +1,143 @@
+import asyncio
+from concurrent.futures import Executor
+from typing import Any, AsyncIterable, Awaitable, Callable, List, Optional, Union
+
+from realtime.keys import PrimaryKeys
+from realtime.message import CRUDMessage, Message
+
+__all__ = ["Dispatcher"]
+
+Handler = Callable[[CRUDMessage], Union[Awaitable[Any], Any]]
+
+
+class Dispatcher:
+    """Handle changes on *shards* workers in parallel, in order per row
+
+    Each CRUDMessage goes to the worker chosen by hashing its table and
+    primary key values (see PrimaryKeys), so changes to one row are handled
+    in the order they were committed while other rows proceed in parallel.
+    Changes to tables without a known key are ordered per table.
+
+    *handler* is awaited on the worker task when it is a coroutine function.
+    Otherwise it is called there, or run on *executor*, e.g. a thread or
+    process pool, when given; with a process pool it must be picklable.
+
+    With *barrier*, dispatching a COMMIT waits until every change before it
+    has been handled, so the transaction can be acknowledged. An UPDATE
+    that moves a row to another shard by changing its key waits until the
+    row's shard has handled the changes before it.
+
+    Example::
+
+        async with Dispatcher(apply, shards=8, keys=keys, barrier=True) as dispatcher:
+            async for message in subscribe(con, acks=acks):
+                await dispatcher.dispatch(message)
+                if message.command == "COMMIT":
+                    acks.ack()
+    """
+
+    def __init__(
+        self,
+        handler: Handler,
+        shards: int = 8,
+        keys: Optional[PrimaryKeys] = None,
+        barrier: bool = False,
+        maxsize: int = 1000,
+        executor: Optional[Executor] = None,
+    ) -> None:
+        self.handler = handler
+        self.is_coroutine = asyncio.iscoroutinefunction(handler)
+        self.n_shards = shards
+        self.keys = keys or PrimaryKeys()
+        self.barrier = barrier
+        self.maxsize = maxsize
+        self.executor = executor
+        self.queues: List["asyncio.Queue[CRUDMessage]"] = []
+        self.workers: List["asyncio.Future[None]"] = []
+        self.error: Optional[BaseException] = None
+        self.failed = asyncio.Event()
+
+    @property
+    def depths(self) -> List[int]:
+        """Changes waiting on each shard"""
+        return [queue.qsize() for queue in self.queues]
+
+    async def __aenter__(self) -> "Dispatcher":
+        self.queues = [asyncio.Queue(self.maxsize) for _ in range(self.n_shards)]
+        self.workers = [
+            asyncio.ensure_future(self.work(queue)) for queue in self.queues
+        ]
+        return self
+
+    async def __aexit__(self, exc_type: Any, *_: Any) -> None:
+        try:
+            if exc_type is None:
+                await self.join()
+        finally:
+            for worker in self.workers:
+                worker.cancel()
+            await asyncio.gather(*self.workers, return_exceptions=True)
+
+    def shard(self, message: CRUDMessage) -> int:
+        return hash(self.keys.key(message)) % self.n_shards
+
+    async def dispatch(self, message: Message) -> None:
+        """Queue a change for its shard, waiting while the shard is full"""
+        self.check()
+        if isinstance(message, CRUDMessage):
+            shard = self.shard(message)
+            if message.old_key is not None:
+                old = hash(self.keys.old_key(message)) % self.n_shards
+                if old != shard:
+                    # Later changes to the row are on its new shard
+                    await self.join([self.queues[old]])
+            await self.queues[shard].put(message)
+        elif self.barrier and message.command == "COMMIT":
+            await self.join()
+
+    async def dispatch_all(self, messages: AsyncIterable[Message]) -> None:
+        """Dispatch every message from *messages*, then wait for them all"""
+        async for message in messages:
+            await self.dispatch(message)
+        await self.join()
+
+    async def join(
+        self, queues: Optional[List["asyncio.Queue[CRUDMessage]"]] = None
+    ) -> None:
+        """Wait until every change dispatched to *queues*, or to every shard,
+        has been handled
+        """
+        # Stop waiting as soon as a handler fails
+        waits: List["asyncio.Future[Any]"] = [
+            asyncio.gather(*(queue.join() for queue in queues or self.queues)),
+            asyncio.ensure_future(self.failed.wait()),
+        ]
+        try:
+            await asyncio.wait(waits, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for wait in waits:
+                wait.cancel()
+        self.check()
+
+    def check(self) -> None:
+        if self.error is not None:
+            raise self.error
+
+    async def work(self, queue: "asyncio.Queue[CRUDMessage]") -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            message = await queue.get()
+            try:
+                if self.error is None:
+                    if self.is_coroutine:
+                        await self.handler(message)
+                    elif self.executor is not None:
+                        await loop.run_in_executor(self.executor, self.handler, message)
+                    else:
+                        self.handler(message)
+            except Exception as exc:
+                if self.error is None:
+                    self.error = exc
+                    self.failed.set()
+            finally:
+                queue.task_done()
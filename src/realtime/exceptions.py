@@ -4,3 +4,15 @@ class RealtimeException(Exception):
 
 class ParseFailureException(Exception):
     """Failure to parse a logical replication test_decoding message"""
+
+
+class ReplicationException(RealtimeException):
+    """Failure communicating over the streaming replication protocol"""
+
+
+class SubscriberDisconnected(RealtimeException):
+    """A hub subscriber fell too far behind and was disconnected"""
+
+
+class CaptureException(RealtimeException):
+    """A capture of replication rows could not be read or appended to"""
@@ -0,0 +1,205 @@
+import re
+from typing import Dict, FrozenSet, Iterable, List, Optional, Tuple, Union
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+from realtime.replication import quote_ident
+
+__all__ = ["ChangeFilter", "create_publication"]
+
+TableName = Union[str, Tuple[Optional[str], str]]
+
+COMMANDS = frozenset(["INSERT", "UPDATE", "DELETE", "TRUNCATE"])
+
+# Identifiers test_decoding prints without quotes, keywords aside
+PLAIN_IDENTIFIER = re.compile(r"^[a-z_][a-z0-9_$]*$")
+
+
+class ChangeFilter:
+    """Which changes a subscription wants, by schema, table and command
+
+    A change is wanted when its table is listed in *tables*, as "schema.table"
+    or (schema, table), or its schema in *schemas*, and its command in
+    *commands*. A table named without a schema is wanted in any schema.
+    Omitted arguments place no restriction. Transaction messages always pass.
+
+    Checks go through an index of (schema, table) to the wanted commands
+    that is filled in as tables are first seen.
+    """
+
+    def __init__(
+        self,
+        tables: Optional[Iterable[TableName]] = None,
+        schemas: Optional[Iterable[str]] = None,
+        commands: Optional[Iterable[str]] = None,
+    ) -> None:
+        self.tables: Optional[FrozenSet[Tuple[Optional[str], str]]] = None
+        if tables is not None:
+            self.tables = frozenset(split_table(table) for table in tables)
+        self.schemas = None if schemas is None else frozenset(schemas)
+        self.commands = COMMANDS if commands is None else frozenset(commands)
+
+        unknown = self.commands - COMMANDS
+        if unknown:
+            raise ValueError("Unknown commands: {}".format(", ".join(sorted(unknown))))
+
+        self.index: Dict[Tuple[Optional[str], str], FrozenSet[str]] = {}
+
+    def commands_for(self, schema: Optional[str], table: str) -> FrozenSet[str]:
+        """The commands wanted on a table, empty when it is not wanted at all"""
+        key = (schema, table)
+        try:
+            return self.index[key]
+        except KeyError:
+            pass
+
+        wanted = self.tables is None and self.schemas is None
+        if self.tables is not None and (
+            key in self.tables or (None, table) in self.tables
+        ):
+            wanted = True
+        if self.schemas is not None and schema in self.schemas:
+            wanted = True
+
+        commands = self.index[key] = self.commands if wanted else frozenset()
+        return commands
+
+    def wants(self, schema: Optional[str], table: str, command: str) -> bool:
+        return command in self.commands_for(schema, table)
+
+    def like_patterns(self) -> Optional[List[str]]:
+        """LIKE patterns matching the test_decoding rows of wanted changes
+
+        None when every row is wanted. Names are matched both bare and
+        quoted, as test_decoding quotes those that need it.
+        """
+        if self.tables is None and self.schemas is None and self.commands == COMMANDS:
+            return None
+
+        prefixes = []
+        for schema, table in sorted(self.tables or (), key=str):
+            if schema is None:
+                for name in identifier_forms(table):
+                    prefixes.append("%." + like_escape(name) + ":")
+                continue
+            for name in qualified_names(schema, table):
+                prefixes.append(like_escape(name) + ":")
+        for schema in sorted(self.schemas or ()):
+            for name in identifier_forms(schema):
+                prefixes.append(like_escape(name) + ".%:")
+        if self.tables is None and self.schemas is None:
+            prefixes.append("%:")
+
+        return [
+            "table {} {}: %".format(prefix, command)
+            for prefix in prefixes
+            for command in sorted(self.commands)
+        ]
+
+    def plugin_options(self, plugin: str) -> Dict[str, str]:
+        """Output plugin options that filter changes on the server"""
+        if plugin != "wal2json":
+            return {}
+
+        options = {}
+        if self.tables is not None or self.schemas is not None:
+            names = [
+                "{}.{}".format(
+                    wal2json_escape(schema) if schema else "*", wal2json_escape(table)
+                )
+                for schema, table in sorted(self.tables or (), key=str)
+            ]
+            names.extend(
+                "{}.*".format(wal2json_escape(schema))
+                for schema in sorted(self.schemas or ())
+            )
+            options["add-tables"] = ",".join(names)
+        if self.commands != COMMANDS:
+            options["actions"] = ",".join(
+                command.lower() for command in sorted(self.commands)
+            )
+        return options
+
+
+def split_table(table: TableName) -> Tuple[Optional[str], str]:
+    if isinstance(table, tuple):
+        return table
+    schema, dot, name = table.partition(".")
+    return (schema, name) if dot else (None, schema)
+
+
+def identifier_forms(name: str) -> List[str]:
+    quoted = quote_ident(name)
+    return [name, quoted] if PLAIN_IDENTIFIER.match(name) else [quoted]
+
+
+def qualified_names(schema: str, table: str) -> List[str]:
+    return [
+        "{}.{}".format(schema_form, table_form)
+        for schema_form in identifier_forms(schema)
+        for table_form in identifier_forms(table)
+    ]
+
+
+def like_escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def wal2json_escape(value: str) -> str:
+    # wal2json needs spaces, quotes, commas, periods and asterisks escaped
+    return re.sub(r"([\\ ',.*])", r"\\\1", value)
+
+
+async def create_publication(
+    con: AsyncConnection, publication_name: str, where: ChangeFilter
+) -> None:
+    """Create a publication for pgoutput publishing only the changes *where* wants
+
+    Tables in *where.schemas* are published with FOR TABLES IN SCHEMA, which
+    needs PostgreSQL 15+, and tables named without a schema are published in
+    every schema that has one. Does nothing if the publication already exists.
+    """
+    EXISTS = text("SELECT 1 FROM pg_publication WHERE pubname = :publication_name")
+    SCHEMAS = text(
+        "SELECT schemaname FROM pg_tables WHERE tablename = :table "
+        "AND schemaname NOT IN ('pg_catalog', 'information_schema') "
+        "ORDER BY schemaname"
+    )
+
+    cursor = await con.execute(EXISTS, dict(publication_name=publication_name))
+    if cursor.all():
+        return
+
+    tables = set()
+    for schema, table in where.tables or ():
+        if schema is not None:
+            tables.add((schema, table))
+            continue
+        cursor = await con.execute(SCHEMAS, dict(table=table))
+        found = [(schema, table) for schema, in cursor.all()]
+        if not found:
+            raise ValueError("No table named {}".format(table))
+        tables.update(found)
+
+    targets = []
+    if tables:
+        targets.append(
+            "TABLE "
+            + ", ".join(
+                "{}.{}".format(quote_ident(schema), quote_ident(table))
+                for schema, table in sorted(tables)
+            )
+        )
+    if where.schemas:
+        targets.append(
+            "TABLES IN SCHEMA "
+            + ", ".join(quote_ident(schema) for schema in sorted(where.schemas))
+        )
+
+    sql = "CREATE PUBLICATION {} FOR {} WITH (publish = '{}')".format(
+        quote_ident(publication_name),
+        ", ".join(targets) if targets else "ALL TABLES",
+        ", ".join(command.lower() for command in sorted(where.commands)),
+    )
+    await con.execute(text(sql))
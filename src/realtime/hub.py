@@ -0,0 +1,214 @@
+import asyncio
+from collections import deque
+from typing import Any, AsyncIterator, Deque, List, Literal, Optional, Tuple
+
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+from realtime.delivery import AckTracker
+from realtime.exceptions import SubscriberDisconnected
+from realtime.lsn import LSN
+from realtime.message import Message
+from realtime.subscribe import changes
+
+__all__ = ["Hub", "Subscriber"]
+
+Overflow = Literal["block", "drop_oldest", "disconnect"]
+
+
+class Subscriber:
+    """One consumer of a Hub, reading messages from a bounded queue
+
+    Iterate it for messages and call ack once they have been processed.
+    When the queue holds *maxsize* messages, *overflow* decides what
+    happens to the next one: "block" holds up the hub until there is room,
+    "drop_oldest" discards the oldest queued message and "disconnect" ends
+    the subscription with SubscriberDisconnected.
+
+    Only *required* subscribers hold back the slot.
+    """
+
+    def __init__(
+        self,
+        hub: "Hub",
+        maxsize: int = 1000,
+        overflow: Overflow = "block",
+        required: bool = True,
+    ) -> None:
+        if overflow not in ("block", "drop_oldest", "disconnect"):
+            raise ValueError("Unknown overflow policy: {}".format(overflow))
+        self.hub = hub
+        self.maxsize = maxsize
+        self.overflow = overflow
+        self.required = required
+        self.items: Deque[Tuple[int, Message]] = deque()
+        self.received = 0
+        self.acked = 0
+        self.dropped = 0
+        self.closed = False
+        self.error: Optional[BaseException] = None
+        self.not_empty = asyncio.Event()
+        self.not_full = asyncio.Event()
+
+    @property
+    def depth(self) -> int:
+        """Messages waiting in the queue"""
+        return len(self.items)
+
+    @property
+    def active(self) -> bool:
+        return not self.closed and self.error is None
+
+    async def put(self, seq: int, message: Message) -> None:
+        while len(self.items) >= self.maxsize and self.active:
+            if self.overflow == "block":
+                self.not_full.clear()
+                await self.not_full.wait()
+            elif self.overflow == "drop_oldest":
+                self.items.popleft()
+                self.dropped += 1
+            else:
+                self.fail(
+                    SubscriberDisconnected(
+                        "Subscriber queue overflowed {} messages".format(self.maxsize)
+                    )
+                )
+
+        if self.active:
+            self.items.append((seq, message))
+            self.not_empty.set()
+
+    def fail(self, error: BaseException) -> None:
+        """End the subscription, raising *error* to its reader"""
+        if self.error is None:
+            self.error = error
+            self.items.clear()
+        self.wake()
+
+    def close(self) -> None:
+        """Unsubscribe, no longer holding back the hub or its slot"""
+        self.closed = True
+        self.items.clear()
+        self.wake()
+
+    def wake(self) -> None:
+        self.not_empty.set()
+        self.not_full.set()
+        self.hub.acknowledged()
+
+    def ack(self) -> None:
+        """Acknowledge every message read from this subscriber so far"""
+        self.acked = self.received
+        self.hub.acknowledged()
+
+    def __aiter__(self) -> AsyncIterator[Message]:
+        return self
+
+    async def __anext__(self) -> Message:
+        while not self.items:
+            if self.error is not None:
+                raise self.error
+            if self.closed:
+                raise StopAsyncIteration
+            self.not_empty.clear()
+            await self.not_empty.wait()
+
+        seq, message = self.items.popleft()
+        self.received = seq
+        self.not_full.set()
+        return message
+
+
+class Hub:
+    """Fan one replication slot out to many in-process subscribers
+
+    The hub runs a single subscription with at-least-once delivery and
+    hands every message to each subscriber's queue. The slot is advanced
+    past a transaction once every required subscriber has acknowledged it,
+    so Postgres decodes the WAL once however many consumers there are.
+
+    Create subscribers with subscribe, then run the hub with ``async with``.
+    Other arguments are passed to subscribe, e.g. batch_size or plugin.
+
+    Example::
+
+        hub = Hub(con, slot_name="realtime_py")
+        audit = hub.subscribe(maxsize=100)
+        cache = hub.subscribe(overflow="drop_oldest", required=False)
+        async with hub:
+            async for message in audit:
+                ...
+                audit.ack()
+    """
+
+    def __init__(
+        self, con: AsyncConnection, slot_name: str = "realtime_py", **kwargs: Any
+    ) -> None:
+        self.con = con
+        self.slot_name = slot_name
+        self.kwargs = kwargs
+        self.acks = AckTracker()
+        self.subscribers: List[Subscriber] = []
+        self.seq = 0
+        # (seq, lsn) of distributed commits the slot has not been released past
+        self.commits: Deque[Tuple[int, LSN]] = deque()
+        self.task: Optional["asyncio.Future[None]"] = None
+
+    def subscribe(
+        self,
+        maxsize: int = 1000,
+        overflow: Overflow = "block",
+        required: bool = True,
+    ) -> Subscriber:
+        """A new subscriber, receiving messages from the next one distributed"""
+        subscriber = Subscriber(self, maxsize, overflow, required)
+        subscriber.received = subscriber.acked = self.seq
+        self.subscribers.append(subscriber)
+        return subscriber
+
+    async def __aenter__(self) -> "Hub":
+        self.task = asyncio.ensure_future(self.run())
+        return self
+
+    async def __aexit__(self, *_: Any) -> None:
+        assert self.task is not None
+        self.task.cancel()
+        try:
+            await self.task
+        except asyncio.CancelledError:
+            pass
+        for subscriber in self.subscribers:
+            subscriber.close()
+
+    async def run(self) -> None:
+        messages = changes(self.con, self.slot_name, acks=self.acks, **self.kwargs)
+        try:
+            async for lsn, message in messages:
+                self.seq += 1
+                if message.command == "COMMIT":
+                    self.commits.append((self.seq, lsn))
+                for subscriber in list(self.subscribers):
+                    if subscriber.active:
+                        await subscriber.put(self.seq, message)
+                self.acknowledged()
+        except Exception as exc:
+            for subscriber in self.subscribers:
+                subscriber.fail(exc)
+            raise
+        finally:
+            await messages.aclose()
+
+    def acknowledged(self) -> None:
+        """Release the slot past commits every required subscriber has acked"""
+        required = [s.acked for s in self.subscribers if s.required and s.active]
+        upto = min(required) if required else self.seq
+
+        lsn = None
+        while self.commits and self.commits[0][0] <= upto:
+            _, lsn = self.commits.popleft()
+        if lsn is not None:
+            self.acks.ack(lsn)
+
+    @property
+    def depths(self) -> List[int]:
+        """Queue depth of each subscriber"""
+        return [subscriber.depth for subscriber in self.subscribers]
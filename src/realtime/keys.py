@@ -0,0 +1,90 @@
+from typing import Dict, Hashable, Iterable, Mapping, Optional, Sequence, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+from realtime.message import Column, CRUDMessage
+
+__all__ = ["PrimaryKeys"]
+
+Table = Tuple[Optional[str], str]
+
+
+class PrimaryKeys:
+    """The primary key columns of tables, for identifying the row a change is to
+
+    Keys can be given up front, loaded from the database's catalog with
+    load, or taken from a decoder that reports them, e.g.
+    ``keys.update(decoder.primary_keys)`` for wal2json and pgoutput.
+    """
+
+    def __init__(self, keys: Optional[Mapping[Table, Sequence[str]]] = None) -> None:
+        self.keys: Dict[Table, Tuple[str, ...]] = {}
+        self.update(keys or {})
+
+    def update(self, keys: Mapping[Table, Sequence[str]]) -> None:
+        for table, columns in keys.items():
+            self.keys[table] = tuple(columns)
+
+    def get(self, schema: Optional[str], table: str) -> Optional[Tuple[str, ...]]:
+        return self.keys.get((schema, table))
+
+    def key(self, message: CRUDMessage) -> Hashable:
+        """(schema, table, key values...) identifying the row *message* changes
+
+        Just (schema, table) when the table's key is unknown or a key column
+        is missing from the message, e.g. for a TRUNCATE.
+        """
+        return self.key_of(message.schema, message.table, message.columns)
+
+    def old_key(self, message: CRUDMessage) -> Hashable:
+        """The key of the row *message* changes as it was before the change,
+        which differs from key for an UPDATE that changed it
+        """
+        if message.old_key is None:
+            return self.key(message)
+        return self.key_of(message.schema, message.table, message.old_key)
+
+    def key_of(
+        self, schema: Optional[str], table: str, columns: Iterable[Column]
+    ) -> Hashable:
+        names = self.keys.get((schema, table))
+        if not names:
+            return (schema, table)
+
+        values = {column.column: column.value for column in columns}
+        try:
+            return (schema, table) + tuple(values[name] for name in names)
+        except KeyError:
+            return (schema, table)
+
+    async def load(
+        self, con: AsyncConnection, tables: Optional[Iterable[Table]] = None
+    ) -> None:
+        """Read the primary keys of *tables*, or of every table, from pg_index"""
+
+        PRIMARY_KEYS = text(
+            """
+        SELECT
+            n.nspname,
+            c.relname,
+            array_agg(a.attname ORDER BY array_position(i.indkey, a.attnum))
+        FROM
+            pg_index i
+            JOIN pg_class c ON c.oid = i.indrelid
+            JOIN pg_namespace n ON n.oid = c.relnamespace
+            JOIN pg_attribute a ON a.attrelid = c.oid AND a.attnum = ANY(i.indkey)
+        WHERE
+            i.indisprimary
+            AND n.nspname NOT IN ('pg_catalog', 'information_schema')
+        GROUP BY
+            n.nspname,
+            c.relname
+        """
+        )
+
+        wanted = None if tables is None else set(tables)
+        cursor = await con.execute(PRIMARY_KEYS)
+        for schema, table, columns in cursor.all():
+            if wanted is None or (schema, table) in wanted:
+                self.keys[(schema, table)] = tuple(columns)
@@ -0,0 +1,19 @@
+from typing import Union
+
+__all__ = ["LSN", "parse_lsn", "format_lsn"]
+
+# Drivers disagree on pg_lsn: asyncpg returns an int, psycopg2 the text form
+LSN = Union[int, str]
+
+
+def parse_lsn(lsn: LSN) -> int:
+    """Convert a pg_lsn in either its integer or "16/B374D848" form to an int"""
+    if isinstance(lsn, int):
+        return lsn
+    high, _, low = lsn.partition("/")
+    return (int(high, 16) << 32) + int(low, 16)
+
+
+def format_lsn(lsn: int) -> str:
+    """Convert an integer LSN to the "16/B374D848" form Postgres accepts"""
+    return "{:X}/{:X}".format(lsn >> 32, lsn & 0xFFFFFFFF)
@@ -1,21 +1,51 @@
-from dataclasses import dataclass
-from typing import List, Literal, Optional, TypeVar, Union
+import re
+from typing import (
+    Any,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Literal,
+    Optional,
+    Tuple,
+    TypeVar,
+    Union,
+    overload,
+)
 
-import regex
 from typing_extensions import Protocol
 
+from realtime.convert import convert
 from realtime.exceptions import ParseFailureException
+from realtime.parse_utils import RawColumn, tokenize_header, tokenize_row
 
-__all__ = ["Message", "TransactionMessage", "CRUDMessage", "parse"]
+__all__ = [
+    "Message",
+    "TransactionMessage",
+    "CRUDMessage",
+    "MessageBatch",
+    "parse",
+    "parse_many",
+]
 
 T = TypeVar("T", bound="Message")
 
 
 class Message(Protocol):
-    command: Literal["BEGIN", "COMMIT", "INSERT", "UPDATE", "DELETE"]
+    __slots__ = ()
+
+    command: Literal["BEGIN", "COMMIT", "INSERT", "UPDATE", "DELETE", "TRUNCATE"]
+
+
+# Schema, table, column and type names shared by every message
+NAMES: Dict[str, str] = {}
+
+
+def intern_name(name: str) -> str:
+    """The shared copy of *name*"""
+    return NAMES.setdefault(name, name)
 
 
-@dataclass
 class TransactionMessage(Message):
     """A logical replication message communicating the start or end of a commit
 
@@ -25,109 +55,376 @@ class TransactionMessage(Message):
         COMMIT 601
     """
 
+    __slots__ = ("command", "lsn")
+
     command: Literal["BEGIN", "COMMIT"]
     lsn: int
 
+    def __init__(self, command: Literal["BEGIN", "COMMIT"], lsn: int) -> None:
+        self.command = command
+        self.lsn = lsn
+
+    def __eq__(self, other: object) -> bool:
+        if other.__class__ is not self.__class__:
+            return NotImplemented
+        return (self.command, self.lsn) == (other.command, other.lsn)  # type: ignore
+
+    __hash__ = None  # type: ignore
+
+    def __repr__(self) -> str:
+        return "TransactionMessage(command={!r}, lsn={!r})".format(
+            self.command, self.lsn
+        )
+
+
+_UNCONVERTED = object()
+
 
-@dataclass
 class Column:
-    column: str
-    data_type: str
-    value: Optional[str]
+    """A column's value as test_decoding prints it
+
+    *typed* converts the value to a python type on first access, see
+    realtime.convert.
+    """
+
+    __slots__ = ("column", "data_type", "value", "_typed")
+
+    def __init__(self, column: str, data_type: str, value: Optional[str]) -> None:
+        self.column = column
+        self.data_type = data_type
+        self.value = value
+        self._typed: Any = _UNCONVERTED
+
+    @property
+    def typed(self) -> Any:
+        if self._typed is _UNCONVERTED:
+            self._typed = convert(self.data_type, self.value)
+        return self._typed
+
+    def __reduce__(self) -> Tuple[Any, ...]:
+        # The sentinel is not the same object once unpickled, so convert again
+        return Column, (self.column, self.data_type, self.value)
+
+    def __eq__(self, other: object) -> bool:
+        if other.__class__ is not self.__class__:
+            return NotImplemented
+        return (self.column, self.data_type, self.value) == (
+            other.column,  # type: ignore
+            other.data_type,  # type: ignore
+            other.value,  # type: ignore
+        )
+
+    __hash__ = None  # type: ignore
+
+    def __repr__(self) -> str:
+        return "Column(column={!r}, data_type={!r}, value={!r})".format(
+            self.column, self.data_type, self.value
+        )
 
 
-@dataclass
 class CRUDMessage(Message):
-    """A logical replication message communicating an insert, update, or delete
+    """A logical replication message communicating an insert, update, delete or truncate
 
     Example::
 
         table public.account: INSERT: id[integer]:5 email[text]:'example@example.com' is_email_verified[boolean]:false
         table public.account: UPDATE: id[integer]:5 email[text]:'example@example.com' is_email_verified[boolean]:true
         table public.account: DELETE: id[integer]:5
+        table public.account: TRUNCATE: (no-flags)
+
+    *old_key* holds the columns an update logged for the row before it, when
+    its key changed or with REPLICA IDENTITY FULL, and is None otherwise.
+
+    Messages from parse keep the raw line, and those from a MessageBatch
+    their plain tuples, and only build their columns when *columns* or
+    *old_key* is first read, raising ParseFailureException if they are
+    malformed.
     """
 
-    command: Literal["INSERT", "UPDATE", "DELETE"]
-    schema: Optional[str]
-    table: str
-    columns: List[Column]
+    __slots__ = (
+        "command",
+        "schema",
+        "table",
+        "_columns",
+        "_old_key",
+        "_raw",
+        "_line",
+        "_pos",
+    )
+
+    command: Literal["INSERT", "UPDATE", "DELETE", "TRUNCATE"]
+
+    def __init__(
+        self,
+        command: Literal["INSERT", "UPDATE", "DELETE", "TRUNCATE"],
+        schema: Optional[str],
+        table: str,
+        columns: List[Column],
+        old_key: Optional[List[Column]] = None,
+    ) -> None:
+        self.command = command
+        self.schema = schema
+        self.table = table
+        self._columns: Optional[List[Column]] = columns
+        self._old_key = old_key
+        self._raw: Optional[Tuple[List[RawColumn], Optional[List[RawColumn]]]] = None
+        self._line = ""
+        self._pos = 0
+
+    @classmethod
+    def from_line(
+        cls,
+        command: Literal["INSERT", "UPDATE", "DELETE", "TRUNCATE"],
+        schema: Optional[str],
+        table: str,
+        line: str,
+        pos: int,
+    ) -> "CRUDMessage":
+        """A message whose columns are tokenized from *line*, starting at
+        *pos*, when first read
+        """
+        message = cls.__new__(cls)
+        message.command = command
+        message.schema = schema
+        message.table = table
+        message._columns = None
+        message._old_key = None
+        message._raw = None
+        message._line = line
+        message._pos = pos
+        return message
+
+    @classmethod
+    def from_raw(
+        cls,
+        command: Literal["INSERT", "UPDATE", "DELETE", "TRUNCATE"],
+        schema: Optional[str],
+        table: str,
+        columns: List[RawColumn],
+        old_key: Optional[List[RawColumn]] = None,
+    ) -> "CRUDMessage":
+        """A message whose columns are built from tokenized *columns* and
+        *old_key* when first read
+        """
+        message = cls.__new__(cls)
+        message.command = command
+        message.schema = schema
+        message.table = table
+        message._columns = None
+        message._old_key = None
+        message._raw = (columns, old_key)
+        message._line = ""
+        message._pos = 0
+        return message
+
+    @property
+    def columns(self) -> List[Column]:
+        if self._columns is None:
+            raw, old_key = self.raw_columns()
+            self._columns = build_columns(raw)
+            if old_key is not None:
+                self._old_key = build_columns(old_key)
+            self._raw = None
+            self._line = ""
+        return self._columns
+
+    @columns.setter
+    def columns(self, columns: List[Column]) -> None:
+        if self._columns is None:
+            self.columns  # Keeps the old key the line logged
+        self._columns = columns
+        self._line = ""
+
+    @property
+    def old_key(self) -> Optional[List[Column]]:
+        if self._columns is None:
+            self.columns  # Tokenizes both
+        return self._old_key
+
+    def raw_columns(self) -> Tuple[List[RawColumn], Optional[List[RawColumn]]]:
+        """The (column, data_type, value) tuples of *columns* and *old_key*,
+        without building Column objects when they have not been read
+        """
+        if self._columns is not None:
+            return (
+                [(c.column, c.data_type, c.value) for c in self._columns],
+                None
+                if self._old_key is None
+                else [(c.column, c.data_type, c.value) for c in self._old_key],
+            )
+        if self._raw is not None:
+            return self._raw
+        try:
+            return tokenize_row(self._line, self._pos)
+        except ValueError as exc:
+            raise ParseFailureException(
+                "Failed to parse message: {}".format(self._line)
+            ) from exc
+
+    def __eq__(self, other: object) -> bool:
+        if other.__class__ is not self.__class__:
+            return NotImplemented
+        return (self.command, self.schema, self.table, self.columns, self.old_key) == (
+            other.command,  # type: ignore
+            other.schema,  # type: ignore
+            other.table,  # type: ignore
+            other.columns,  # type: ignore
+            other.old_key,  # type: ignore
+        )
 
+    __hash__ = None  # type: ignore
 
-def parse(message: str) -> Union[TransactionMessage, CRUDMessage]:
-    from realtime.parse_utils import (
-        postprocess,
-        preprocess,
-        read,
-        read_column,
-        read_until,
+    def __repr__(self) -> str:
+        old_key = "" if self.old_key is None else ", old_key={!r}".format(self.old_key)
+        return (
+            "CRUDMessage(command={!r}, schema={!r}, table={!r}, columns={!r}{})".format(
+                self.command, self.schema, self.table, self.columns, old_key
+            )
+        )
+
+
+def build_columns(raw: List[RawColumn]) -> List[Column]:
+    return [
+        Column(intern_name(name), intern_name(type_), value)
+        for name, type_, value in raw
+    ]
+
+
+# Rough bytes held by a message and by each of its columns, beyond their text
+MESSAGE_OVERHEAD = 128
+COLUMN_OVERHEAD = 96
+
+
+def approximate_size(message: CRUDMessage) -> int:
+    """Roughly the bytes of memory *message* holds, without reading its columns"""
+    if message._raw is not None:
+        columns, old_key = message._raw
+        return MESSAGE_OVERHEAD + sum(
+            COLUMN_OVERHEAD + len(value or "")
+            for _, _, value in columns + (old_key or [])
+        )
+    if message._columns is None:
+        return MESSAGE_OVERHEAD + len(message._line)
+    return MESSAGE_OVERHEAD + sum(
+        COLUMN_OVERHEAD + len(column.value or "")
+        for column in message._columns + (message._old_key or [])
     )
 
+
+# Plain tuple forms of the messages above
+#   ("BEGIN" | "COMMIT", lsn)
+#   ("INSERT" | "UPDATE" | "DELETE", schema, table, columns, old_key | None)
+# with columns as [(column, data_type, value), ...]
+CompactMessage = Union[
+    Tuple[str, int],
+    Tuple[str, Optional[str], str, List[RawColumn], Optional[List[RawColumn]]],
+]
+
+TRANSACTION = re.compile(r"^(BEGIN|COMMIT) (\d+)$")
+
+
+def parse_compact(message: str) -> CompactMessage:
+    """Parse a test_decoding message into its plain tuple form"""
+
     # First try to parse a transaction message
     # BEGIN 601
 
     if message[0] in ("B", "C"):
-        expression = r"^(BEGIN|COMMIT) (\d+)$"
-        match = regex.match(expression, message)
+        match = TRANSACTION.match(message)
 
         if not match:
             raise ParseFailureException("Failed to parse message: {}".format(message))
 
-        command = match.captures(1)[0]
-        lsn = int(match.captures(2)[0])
-
-        return TransactionMessage(
-            command=command,
-            lsn=lsn,
-        )
+        return match.group(1), int(match.group(2))
 
     elif message[0] == "t":
 
-        # table schema.table: .....
-        remaining = preprocess(message)
-
-        # schema.table: ....
-        _, remaining = read_until(remaining, " ")
-
-        # schema.table OR table
-        schema_and_table, remaining = read_until(remaining, ": ")
-
-        if "." in schema_and_table:
-            schema_maybe_quoted, _, table_maybe_quoted = schema_and_table.partition(".")
-            # schema, _ = read_escaped(schema_maybe_quoted)
-            # table, _ = read_escaped(table_maybe_quoted)
-            schema, _ = read(schema_maybe_quoted)
-            table, _ = read(table_maybe_quoted)
-        else:
-            schema = None
-            # table, _ = read_escaped(schema_and_table)
-            table, _ = read(schema_and_table)
-
-        assert table is not None
-
-        # *schema* and *table* now set
-
-        # COMMAND: col[type]:value ...
-        command, remaining = read_until(remaining, ": ")
-
-        column, remaining = read_column(remaining)
-        columns = []
-        while column[0] != "":
-            columns.append(column)
-            column, remaining = read_column(remaining)
-            remaining = remaining.strip()
-
-        return CRUDMessage(
-            schema=postprocess(schema) if schema else None,
-            table=postprocess(table),
-            command=postprocess(command),  # type: ignore
-            columns=[
-                Column(
-                    postprocess(col_name),
-                    postprocess(type_),
-                    postprocess(value) if value is not None else None,
-                )
-                for col_name, type_, value in columns
-            ],
-        )
+        # table schema.table: COMMAND: col[type]:value ...
+        try:
+            schema, table, command, pos = tokenize_header(message)
+            columns, old_key = tokenize_row(message, pos)
+        except ValueError as exc:
+            raise ParseFailureException(
+                "Failed to parse message: {}".format(message)
+            ) from exc
+
+        return command, schema, table, columns, old_key
 
     raise ParseFailureException("Failed to parse message: {}".format(message))
+
+
+def expand(compact: CompactMessage) -> Union[TransactionMessage, CRUDMessage]:
+    """Build the message described by a plain tuple from parse_compact"""
+    if len(compact) == 2:
+        return TransactionMessage(command=compact[0], lsn=compact[1])  # type: ignore
+
+    command, schema, table, columns, old_key = compact  # type: ignore
+    # Column objects are only built if the message's columns are read
+    return CRUDMessage.from_raw(
+        command, schema, table, columns, old_key  # type: ignore
+    )
+
+
+def parse(message: str) -> Union[TransactionMessage, CRUDMessage]:
+    """Parse a test_decoding message, leaving a CRUDMessage's columns unread"""
+    if message[:1] == "t":
+        try:
+            schema, table, command, pos = tokenize_header(message)
+        except ValueError as exc:
+            raise ParseFailureException(
+                "Failed to parse message: {}".format(message)
+            ) from exc
+        return CRUDMessage.from_line(
+            intern_name(command),  # type: ignore
+            schema and intern_name(schema),
+            intern_name(table),
+            message,
+            pos,
+        )
+    return expand(parse_compact(message))
+
+
+class MessageBatch:
+    """Messages parsed from a whole fetch, held in their plain tuple form
+
+    Messages are only built when read, so a batch costs a fraction of the
+    memory of the equivalent list of messages and pickles cheaply.
+    """
+
+    __slots__ = ("items",)
+
+    def __init__(self, items: List[CompactMessage]) -> None:
+        self.items = items
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+    def __getitem__(self, ix: int) -> Union[TransactionMessage, CRUDMessage]:
+        return expand(self.items[ix])
+
+    def __iter__(self) -> Iterator[Union[TransactionMessage, CRUDMessage]]:
+        return map(expand, self.items)
+
+
+@overload
+def parse_many(
+    messages: Iterable[str], compact: Literal[False] = ...
+) -> List[Union[TransactionMessage, CRUDMessage]]:
+    ...
+
+
+@overload
+def parse_many(messages: Iterable[str], compact: Literal[True]) -> MessageBatch:
+    ...
+
+
+def parse_many(
+    messages: Iterable[str], compact: bool = False
+) -> Union[List[Union[TransactionMessage, CRUDMessage]], MessageBatch]:
+    """Parse every test_decoding message from a fetch in one call
+
+    Set *compact* to receive a MessageBatch rather than a list of messages
+    """
+    if compact:
+        return MessageBatch([parse_compact(message) for message in messages])
+    return [parse(message) for message in messages]
@@ -0,0 +1,172 @@
+import time
+from bisect import bisect_left
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+    TypeVar,
+)
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+__all__ = ["Histogram", "Hook", "Metrics", "slot_lag"]
+
+T = TypeVar("T")
+
+# hook(name, value) is called with every observation, e.g. ("fetch_rows", 512)
+Hook = Callable[[str, float], None]
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+ROW_BUCKETS = (1, 10, 100, 1000, 10_000, 100_000)
+BYTE_BUCKETS = (1024, 16 * 1024, 256 * 1024, 1024**2, 16 * 1024**2, 256 * 1024**2)
+
+
+class Histogram:
+    """Counts of observations at or below each of *bounds*, as Prometheus does"""
+
+    def __init__(self, bounds: Sequence[float]) -> None:
+        self.bounds = tuple(bounds)
+        # The last count is of observations above every bound
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def snapshot(self) -> Dict[str, Any]:
+        cumulative = []
+        total = 0
+        for count in self.counts:
+            total += count
+            cumulative.append(total)
+        buckets = dict(zip([str(b) for b in self.bounds] + ["+Inf"], cumulative))
+        return dict(buckets=buckets, count=self.count, sum=self.sum)
+
+
+class Metrics:
+    """Instrumentation of a subscription, read in-process or exported by hooks
+
+    Pass a Metrics to subscribe to record:
+
+    - rows and bytes per fetch, and fetch latency, as histograms
+    - parse latency per fetch, as a histogram
+    - messages delivered, and messages per second between fetches
+    - queue depth: rows fetched but not yet delivered
+    - slot lag: bytes of WAL between the server's current position and the
+      slot's confirmed_flush_lsn, sampled every *lag_interval* seconds
+
+    Read everything with snapshot, or pass *hooks* that are called as
+    hook(name, value) with each observation. subscribe records nothing
+    without a Metrics, so there is no cost when it is not used.
+    """
+
+    def __init__(self, hooks: Iterable[Hook] = (), lag_interval: float = 10.0) -> None:
+        self.hooks: List[Hook] = list(hooks)
+        self.lag_interval = lag_interval
+        self.fetch_rows = Histogram(ROW_BUCKETS)
+        self.fetch_bytes = Histogram(BYTE_BUCKETS)
+        self.fetch_seconds = Histogram(LATENCY_BUCKETS)
+        self.parse_seconds = Histogram(LATENCY_BUCKETS)
+        self.messages = 0
+        self.messages_per_second = 0.0
+        self.queue_depth = 0
+        self.slot_lag_bytes: Optional[int] = None
+        self.lag_sampled: Optional[float] = None
+        # (time, messages) at the previous fetch, for messages_per_second
+        self._last_fetch: Optional[Tuple[float, int]] = None
+
+    def add_hook(self, hook: Hook) -> None:
+        self.hooks.append(hook)
+
+    def emit(self, name: str, value: float) -> None:
+        for hook in self.hooks:
+            hook(name, value)
+
+    def fetched(self, rows: Sequence[Any], seconds: float) -> None:
+        """Record a fetch of (lsn, xid, data) *rows* that took *seconds*"""
+        n_bytes = sum(len(data) for _, _, data in rows)
+        self.fetch_rows.observe(len(rows))
+        self.fetch_bytes.observe(n_bytes)
+        self.fetch_seconds.observe(seconds)
+
+        now = time.monotonic()
+        if self._last_fetch is not None and now > self._last_fetch[0]:
+            elapsed = now - self._last_fetch[0]
+            self.messages_per_second = (self.messages - self._last_fetch[1]) / elapsed
+        self._last_fetch = (now, self.messages)
+
+        if self.hooks:
+            self.emit("fetch_rows", len(rows))
+            self.emit("fetch_bytes", n_bytes)
+            self.emit("fetch_seconds", seconds)
+            self.emit("messages_per_second", self.messages_per_second)
+
+    def parsed(self, seconds: float) -> None:
+        self.parse_seconds.observe(seconds)
+        if self.hooks:
+            self.emit("parse_seconds", seconds)
+
+    def track(
+        self, n_rows: int, decoded: Iterable[Tuple[int, T]]
+    ) -> Iterator[Tuple[int, T]]:
+        """Count the (row index, message) pairs of a fetch of *n_rows* rows
+        as they are delivered, keeping queue_depth up to date
+        """
+        self.queue_depth = n_rows
+        for ix, message in decoded:
+            self.queue_depth = n_rows - ix - 1
+            self.messages += 1
+            yield ix, message
+        self.queue_depth = 0
+
+    def lag_due(self) -> bool:
+        return (
+            self.lag_sampled is None
+            or time.monotonic() - self.lag_sampled >= self.lag_interval
+        )
+
+    def lag(self, n_bytes: Optional[int]) -> None:
+        self.lag_sampled = time.monotonic()
+        self.slot_lag_bytes = n_bytes
+        if n_bytes is not None and self.hooks:
+            self.emit("slot_lag_bytes", n_bytes)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Every metric as plain values, e.g. to serve as JSON"""
+        return dict(
+            fetch_rows=self.fetch_rows.snapshot(),
+            fetch_bytes=self.fetch_bytes.snapshot(),
+            fetch_seconds=self.fetch_seconds.snapshot(),
+            parse_seconds=self.parse_seconds.snapshot(),
+            messages=self.messages,
+            messages_per_second=self.messages_per_second,
+            queue_depth=self.queue_depth,
+            slot_lag_bytes=self.slot_lag_bytes,
+        )
+
+
+async def slot_lag(con: AsyncConnection, slot_name: str) -> Optional[int]:
+    """Bytes of WAL between the server's current position and the slot's
+    confirmed_flush_lsn, or None if the slot does not exist
+    """
+
+    SLOT_LAG = text(
+        "SELECT pg_wal_lsn_diff(pg_current_wal_lsn(), confirmed_flush_lsn) "
+        "FROM pg_replication_slots WHERE slot_name = :slot_name"
+    )
+
+    cursor = await con.execute(SLOT_LAG, dict(slot_name=slot_name))
+    rows = cursor.all()
+    if not rows or rows[0][0] is None:
+        return None
+    return int(rows[0][0])
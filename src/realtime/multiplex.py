@@ -0,0 +1,341 @@
+import asyncio
+import heapq
+from collections import OrderedDict
+from typing import (
+    Any,
+    Awaitable,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Set,
+    Tuple,
+)
+
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine, create_async_engine
+from sqlalchemy.pool import NullPool
+
+from realtime.decoders import Decoder, decoder_for
+from realtime.delivery import AckTracker
+from realtime.filters import ChangeFilter
+from realtime.lsn import LSN
+from realtime.message import Message
+from realtime.parallel import decode
+from realtime.subscribe import confirm, deliver, drain, peek, replication_slot
+
+__all__ = ["ConnectionPool", "Multiplexer", "Source", "Tagged"]
+
+Connect = Callable[[str], Awaitable[AsyncConnection]]
+
+
+class Source(NamedTuple):
+    """A replication slot to follow, in the database at *url*
+
+    With *acks*, the slot is only advanced past transactions acknowledged
+    through it, as for subscribe.
+    """
+
+    url: str
+    slot_name: str = "realtime_py"
+    plugin: str = "test_decoding"
+    plugin_options: Optional[Dict[str, str]] = None
+    where: Optional[ChangeFilter] = None
+    acks: Optional[AckTracker] = None
+
+
+class Tagged(NamedTuple):
+    """A message and the source it was read from"""
+
+    source: Source
+    lsn: LSN
+    message: Message
+
+
+class ConnectionPool:
+    """At most *max_connections* open connections, shared by many databases
+
+    Connections are kept open between uses. When the limit is reached and
+    a database without an idle connection needs one, the least recently
+    used idle connection to another database is closed to make room, so
+    idle databases do not each hold a connection.
+    """
+
+    def __init__(self, max_connections: int = 8, connect: Optional[Connect] = None):
+        self.max_connections = max_connections
+        self.connect = connect or self.engine_connect
+        self.engines: Dict[str, AsyncEngine] = {}
+        # (url, connection) by id, least recently used first
+        self.idle: "OrderedDict[int, Tuple[str, AsyncConnection]]" = OrderedDict()
+        self.n_open = 0
+        self.released = asyncio.Condition()
+
+    async def engine_connect(self, url: str) -> AsyncConnection:
+        try:
+            engine = self.engines[url]
+        except KeyError:
+            # Connections are pooled here rather than per engine
+            engine = self.engines[url] = create_async_engine(url, poolclass=NullPool)
+        return await engine.connect()
+
+    async def acquire(self, url: str) -> AsyncConnection:
+        async with self.released:
+            while True:
+                for key, (idle_url, con) in reversed(self.idle.items()):
+                    if idle_url == url:
+                        del self.idle[key]
+                        return con
+
+                if self.n_open < self.max_connections:
+                    self.n_open += 1
+                    break
+
+                if self.idle:
+                    _, (_, con) = self.idle.popitem(last=False)
+                    self.n_open -= 1
+                    await con.close()
+                    continue
+
+                await self.released.wait()
+
+        try:
+            return await self.connect(url)
+        except BaseException:
+            await self.discard(None)
+            raise
+
+    async def release(self, url: str, con: AsyncConnection) -> None:
+        async with self.released:
+            self.idle[id(con)] = (url, con)
+            self.released.notify()
+
+    async def discard(self, con: Optional[AsyncConnection]) -> None:
+        """Give up a connection that failed, making room for another"""
+        async with self.released:
+            self.n_open -= 1
+            self.released.notify()
+        if con is not None:
+            try:
+                await con.close()
+            except Exception:
+                pass
+
+    async def close(self) -> None:
+        while self.idle:
+            _, (_, con) = self.idle.popitem()
+            self.n_open -= 1
+            await con.close()
+        for engine in self.engines.values():
+            await engine.dispose()
+        self.engines.clear()
+
+
+class SlotState:
+    """Scheduling state of one source"""
+
+    def __init__(self, source: Source) -> None:
+        self.source = source
+        self.decoder: Decoder = decoder_for(
+            source.plugin, source.plugin_options or {}, source.where
+        )
+        self.delay = 0.0
+        self.created = False
+        # Items of a source with acks waiting in the queue
+        self.queued = 0
+        self.drained = asyncio.Event()
+        self.drained.set()
+
+
+# (source, a batch's (lsn, message) pairs to take the next one from)
+Item = Tuple[SlotState, Iterator[Tuple[LSN, Message]]]
+
+
+class Multiplexer:
+    """Follow many replication slots, in many databases, as one stream
+
+    A single scheduler polls every source over a shared ConnectionPool of
+    at most *max_connections* connections, which are only held while a
+    slot is read. Each poll reads one batch of up to *batch_size* rows. A
+    source whose batch came back full is polled again straight away, one
+    that returned some rows after *min_delay*, and each empty poll
+    multiplies its delay by *factor* up to *max_delay*, so busy slots are
+    polled far more often than idle ones.
+
+    Iterating the multiplexer yields Tagged messages, in order per source,
+    from a queue of up to *maxsize* messages. An error reading any source
+    ends the stream with that error.
+
+    Example::
+
+        sources = [Source(url, slot_name="realtime_py") for url in urls]
+        async with Multiplexer(sources, max_connections=8) as stream:
+            async for source, lsn, message in stream:
+                ...
+    """
+
+    def __init__(
+        self,
+        sources: Iterable[Source],
+        max_connections: int = 8,
+        batch_size: int = 10000,
+        min_delay: float = 0.01,
+        max_delay: float = 5.0,
+        factor: float = 2.0,
+        maxsize: int = 10000,
+        connect: Optional[Connect] = None,
+    ) -> None:
+        self.states = [SlotState(source) for source in sources]
+        self.pool = ConnectionPool(max_connections, connect)
+        self.batch_size = batch_size
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.factor = factor
+        self.queue: "asyncio.Queue[Item]" = asyncio.Queue(maxsize)
+        self.task: Optional["asyncio.Future[None]"] = None
+
+    async def __aenter__(self) -> "Multiplexer":
+        self.task = asyncio.ensure_future(self.run())
+        return self
+
+    async def __aexit__(self, *_: Any) -> None:
+        assert self.task is not None
+        self.task.cancel()
+        await asyncio.gather(self.task, return_exceptions=True)
+        try:
+            for state in self.states:
+                acks = state.source.acks
+                if state.created and acks is not None:
+                    con = await self.pool.acquire(state.source.url)
+                    await confirm(con, state.source.slot_name, acks)
+                    await con.commit()
+                    await self.pool.release(state.source.url, con)
+        finally:
+            await self.pool.close()
+
+    def __aiter__(self) -> "Multiplexer":
+        return self
+
+    async def __anext__(self) -> Tagged:
+        while True:
+            state, messages = await self.get()
+            # With acks, deliver records rows as the consumer reads them
+            delivered = next(messages, None)
+            if state.source.acks is not None:
+                state.queued -= 1
+                if not state.queued:
+                    state.drained.set()
+            if delivered is not None:
+                lsn, message = delivered
+                return Tagged(state.source, lsn, message)
+
+    async def get(self) -> Item:
+        if not self.queue.empty():
+            return self.queue.get_nowait()
+        if self.task is None:
+            raise RuntimeError("Enter the multiplexer with async with first")
+
+        get = asyncio.ensure_future(self.queue.get())
+        waiting: List["asyncio.Future[Any]"] = [get, self.task]
+        await asyncio.wait(waiting, return_when=asyncio.FIRST_COMPLETED)
+        if get.done():
+            return get.result()
+
+        get.cancel()
+        self.task.result()
+        raise StopAsyncIteration
+
+    async def run(self) -> None:
+        loop = asyncio.get_running_loop()
+        # (due, ix, state) of the sources waiting for their next poll
+        due: List[Tuple[float, int, SlotState]] = [
+            (0.0, ix, state) for ix, state in enumerate(self.states)
+        ]
+        polls: Dict["asyncio.Future[None]", Tuple[int, SlotState]] = {}
+        try:
+            while due or polls:
+                now = loop.time()
+                while due and due[0][0] <= now:
+                    _, ix, state = heapq.heappop(due)
+                    polls[asyncio.ensure_future(self.poll(state))] = (ix, state)
+
+                timeout = max(0.0, due[0][0] - now) if due else None
+                if not polls:
+                    await asyncio.sleep(timeout or 0)
+                    continue
+
+                done: Set["asyncio.Future[None]"]
+                done, _ = await asyncio.wait(
+                    list(polls), timeout=timeout, return_when=asyncio.FIRST_COMPLETED
+                )
+                for poll in done:
+                    ix, state = polls.pop(poll)
+                    poll.result()
+                    heapq.heappush(due, (loop.time() + state.delay, ix, state))
+        finally:
+            for poll in polls:
+                poll.cancel()
+            await asyncio.gather(*polls, return_exceptions=True)
+
+    async def poll(self, state: SlotState) -> None:
+        """Read one batch from a source, then hand its messages to the queue"""
+        source = state.source
+        if source.acks is not None:
+            # Rows still queued have not been delivered, so would be read again
+            await state.drained.wait()
+
+        con = await self.pool.acquire(source.url)
+        try:
+            if not state.created:
+                async with replication_slot(
+                    source.slot_name, con, drop_on_close=False, plugin=source.plugin
+                ):
+                    pass
+                state.created = True
+
+            if source.acks is None:
+                batches = drain(
+                    con, source.slot_name, self.batch_size, state.decoder, source.where
+                )
+            else:
+                batches = peek(
+                    con, source.slot_name, self.batch_size, source.acks, state.decoder
+                )
+            rows: List[Any] = []
+            try:
+                async for rows in batches:
+                    break
+            finally:
+                await batches.aclose()
+            # Leave the connection idle rather than idle in a transaction
+            await con.commit()
+        except BaseException:
+            await self.pool.discard(con)
+            raise
+        await self.pool.release(source.url, con)
+
+        if len(rows) >= self.batch_size:
+            state.delay = 0.0
+        elif rows:
+            state.delay = self.min_delay
+        else:
+            state.delay = min(
+                max(state.delay, self.min_delay) * self.factor, self.max_delay
+            )
+
+        if not rows:
+            return
+        decoded = list(await decode(state.decoder, [data for _, _, data in rows]))
+        messages: Iterator[Tuple[LSN, Message]]
+        if source.acks is None:
+            messages = ((rows[ix][0], message) for ix, message in decoded)
+            n_items = len(decoded)
+        else:
+            messages = deliver(rows, decoded, source.acks)
+            # One item more to deliver the rows after the last message
+            n_items = len(decoded) + 1
+            state.queued += n_items
+            state.drained.clear()
+        for _ in range(n_items):
+            await self.queue.put((state, messages))
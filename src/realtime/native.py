@@ -0,0 +1,72 @@
+import re
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from sqlalchemy.ext.asyncio import AsyncConnection
+from sqlalchemy.sql.elements import TextClause
+
+from realtime.lsn import parse_lsn
+
+__all__ = ["NativeQueries"]
+
+# :name bind parameters, but not :: casts
+BIND = re.compile(r"(?<![:\w]):(\w+)")
+# Parameters cast to pg_lsn, which asyncpg encodes from integers
+LSN_BIND = re.compile(r"CAST\(:(\w+) AS pg_lsn\)")
+
+
+def positional(sql: str) -> Tuple[str, List[str]]:
+    """*sql* with :name parameters as $1, $2, ... and the names in order"""
+    names: List[str] = []
+
+    def number(match: "re.Match[str]") -> str:
+        name = match.group(1)
+        if name not in names:
+            names.append(name)
+        return "${}".format(names.index(name) + 1)
+
+    return BIND.sub(number, sql), names
+
+
+class NativeQueries:
+    """Run slot queries on the asyncpg connection under *con*
+
+    Each query is prepared once per connection, and fetches return asyncpg
+    Records, which unpack like rows, without building SQLAlchemy results.
+    Parameters cast to pg_lsn are bound as integers, as asyncpg needs.
+    """
+
+    def __init__(self, con: AsyncConnection) -> None:
+        if con.dialect.driver != "asyncpg":
+            raise ValueError(
+                "The native path needs asyncpg, not {}".format(con.dialect.driver)
+            )
+        self.con = con
+        self.driver: Optional[Any] = None
+        # sql: (prepared statement, parameter names, names of LSN parameters)
+        self.statements: Dict[str, Tuple[Any, List[str], Set[str]]] = {}
+
+    async def fetch(self, statement: TextClause, params: Dict[str, Any]) -> List[Any]:
+        raw = await self.con.get_raw_connection()
+        driver = raw.driver_connection
+        if driver is not self.driver:
+            # Statements are prepared per connection
+            self.driver = driver
+            self.statements = {}
+
+        sql = statement.text
+        try:
+            prepared, names, lsns = self.statements[sql]
+        except KeyError:
+            query, names = positional(sql)
+            lsns = set(LSN_BIND.findall(sql))
+            prepared = await driver.prepare(query)
+            self.statements[sql] = (prepared, names, lsns)
+
+        return await prepared.fetch(
+            *[
+                parse_lsn(params[name])
+                if name in lsns and params[name] is not None
+                else params[name]
+                for name in names
+            ]
+        )
@@ -0,0 +1,55 @@
+import asyncio
+from concurrent.futures import Executor
+from typing import Any, Iterable, List, Optional, Sequence, Tuple
+
+from realtime.decoders import Decoder, TestDecodingDecoder
+from realtime.message import Message, MessageBatch, parse_many
+
+__all__ = ["decode", "parse_slice"]
+
+# Fetches smaller than this are parsed in-process, where they cost less
+# than shipping them to and from worker processes
+PARALLEL_MIN_ROWS = 5000
+SLICE_ROWS = 2500
+
+
+def parse_slice(lines: List[str]) -> MessageBatch:
+    """Parse test_decoding rows into a MessageBatch, run on a worker process"""
+    return parse_many(lines, compact=True)
+
+
+async def decode(
+    decoder: Decoder,
+    rows: Sequence[Any],
+    executor: Optional[Executor] = None,
+    min_rows: int = PARALLEL_MIN_ROWS,
+    slice_rows: int = SLICE_ROWS,
+) -> Iterable[Tuple[int, Message]]:
+    """decoder.decode_many, parsing large fetches on *executor*
+
+    With an executor, e.g. a ProcessPoolExecutor, test_decoding fetches of
+    at least *min_rows* rows are split into contiguous slices of
+    *slice_rows* that are tokenized in parallel. Each worker returns its
+    slice as a MessageBatch of plain tuples, which pickle cheaply, and the
+    slices are joined back in LSN order. Messages keep those tuples and only
+    build their Column objects when read. Other plugins keep state across
+    rows, so are always decoded in-process.
+    """
+    if (
+        executor is None
+        or not isinstance(decoder, TestDecodingDecoder)
+        or len(rows) < min_rows
+    ):
+        return decoder.decode_many(rows)
+
+    lines = [data if isinstance(data, str) else bytes(data).decode() for data in rows]
+    loop = asyncio.get_running_loop()
+    batches = await asyncio.gather(
+        *(
+            loop.run_in_executor(
+                executor, parse_slice, lines[start : start + slice_rows]
+            )
+            for start in range(0, len(lines), slice_rows)
+        )
+    )
+    return decoder.select(MessageBatch([item for b in batches for item in b.items]))
@@ -1,4 +1,5 @@
-from typing import Optional, Tuple
+import re
+from typing import List, Optional, Tuple
 from uuid import uuid4
 
 BRACKET = str(uuid4())
@@ -56,3 +57,182 @@ def read_column(text: str) -> Tuple[Tuple[str, str, Optional[str]], str]:
     remain = remain.strip(":")
     value, remain = read(remain)
     return (name, type_, value), remain.strip(" ")  # type: ignore
+
+
+RawColumn = Tuple[str, str, Optional[str]]
+
+
+def tokenize_crud_legacy(text: str) -> Tuple[Optional[str], str, str, List[RawColumn]]:
+    """Reference tokenizer built on preprocess, read and read_column
+
+    Copies the remainder of the line for every token. Retained to check and
+    benchmark tokenize_crud against.
+    """
+    remaining = preprocess(text)
+    _, remaining = read_until(remaining, " ")
+    schema_and_table, remaining = read_until(remaining, ": ")
+
+    schema: Optional[str]
+    if "." in schema_and_table:
+        schema_maybe_quoted, _, table_maybe_quoted = schema_and_table.partition(".")
+        schema, _ = read(schema_maybe_quoted)
+        table, _ = read(table_maybe_quoted)
+    else:
+        schema = None
+        table, _ = read(schema_and_table)
+
+    assert table is not None
+
+    command, remaining = read_until(remaining, ": ")
+
+    # old-key: ... new-tuple: ...
+    if remaining.startswith("old-key: "):
+        _, _, remaining = remaining.partition(" new-tuple: ")
+
+    column, remaining = read_column(remaining)
+    columns = []
+    while column[0] != "":
+        columns.append(column)
+        column, remaining = read_column(remaining)
+        remaining = remaining.strip()
+
+    return (
+        postprocess(schema) if schema else None,
+        postprocess(table),
+        postprocess(command),
+        [
+            (
+                postprocess(col_name),
+                postprocess(type_),
+                postprocess(value) if value is not None else None,
+            )
+            for col_name, type_, value in columns
+        ],
+    )
+
+
+# schema.table as quote_identifier prints them, quoted when necessary
+QUALIFIED_NAME = re.compile(
+    r'("(?:[^"]|"")*"|[^".]+)(?:\.("(?:[^"]|"")*"|[^".:]+))?(?=: )'
+)
+
+
+def unquote(name: str) -> str:
+    if name[:1] == '"':
+        return name[1:-1].replace('""', '"')
+    return name
+
+
+# name[type]:value followed by any padding spaces
+#   name:  "quoted ""identifier""" or bare_identifier
+#   [type]: anything up to the first "]" that is not part of an array "[]" suffix
+#   value: 'quoted with '' escapes' or a bare literal e.g. 5, true, null
+COLUMN = re.compile(
+    r"""
+    ("[^"]*(?:""[^"]*)*"|[^\[ ]+)
+    \[([^\[\]]*(?:\[\][^\[\]]*)*)\]
+    :(?:'([^']*(?:''[^']*)*)'|([^' ][^ ]*))
+    \ *
+    """,
+    re.VERBOSE,
+)
+
+
+def tokenize_crud(text: str) -> Tuple[Optional[str], str, str, List[RawColumn]]:
+    """Split a test_decoding row into its schema, table, command and columns
+
+    Walks *text* once, left to right, with a compiled pattern per column and
+    without copying the unread remainder.
+
+    Example::
+
+        table public.account: INSERT: id[integer]:5 email[text]:'e@e.c'
+
+    Quoted values are returned with their escaped quotes ('') intact and
+    the unquoted literal null is returned as None. For updates that log an
+    old-key, only the new-tuple columns are returned, see tokenize_row.
+    """
+    schema, table, command, pos = tokenize_header(text)
+    return schema, table, command, tokenize_columns(text, pos)
+
+
+def tokenize_header(text: str) -> Tuple[Optional[str], str, str, int]:
+    """Split a test_decoding row into its schema, table, command and the
+    position its columns start at
+    """
+    # table schema.table: COMMAND: ...
+    start = text.index(" ") + 1
+    if text[start] == '"' or '"' in text[start : text.index(": ", start)]:
+        match = QUALIFIED_NAME.match(text, start)
+        if match is None:
+            raise ValueError("Failed to tokenize table name")
+        schema, table = (unquote(name) for name in match.groups(""))
+        if not table:
+            schema, table = "", schema
+        sep = match.end()
+    else:
+        sep = text.index(": ", start)
+        schema, dot, table = text[start:sep].partition(".")
+        if not dot:
+            schema, table = "", schema
+
+    start = sep + 2
+    sep = text.index(": ", start)
+    command = text[start:sep]
+
+    # TRUNCATE: (no-flags) | restart_seqs | cascade
+    if command == "TRUNCATE":
+        return schema or None, table, command, len(text)
+
+    return schema or None, table, command, sep + 2
+
+
+def tokenize_columns(text: str, pos: int) -> List[RawColumn]:
+    """Tokenize the columns of a test_decoding row from *pos* to its end"""
+    return tokenize_row(text, pos)[0]
+
+
+def tokenize_row(
+    text: str, pos: int
+) -> Tuple[List[RawColumn], Optional[List[RawColumn]]]:
+    """Tokenize the columns of a test_decoding row from *pos* to its end,
+    and the old-key columns logged before them, None if there are none
+
+    Updates log an old-key when the row's key changed, or the whole old row
+    with REPLICA IDENTITY FULL.
+    """
+    # [old-key: name[type]:value ... new-tuple: ]name[type]:value ...
+    old_key: Optional[List[RawColumn]] = None
+    columns: List[RawColumn] = []
+    append = columns.append
+    match = COLUMN.match
+    length = len(text)
+
+    while pos < length:
+        if text[pos] in "on(":
+            if text.startswith("old-key: ", pos):
+                pos += 9
+                continue
+            if text.startswith("new-tuple: ", pos):
+                old_key = columns
+                columns = []
+                append = columns.append
+                pos += 11
+                continue
+            if text.startswith("(no-tuple-data)", pos):
+                break
+
+        column = match(text, pos)
+        if column is None:
+            raise ValueError("Failed to tokenize column at position {}".format(pos))
+
+        name, type_, quoted, bare = column.groups()
+        if name[0] == '"':
+            name = unquote(name)
+        if quoted is not None:
+            append((name, type_, quoted))
+        else:
+            append((name, type_, None if bare == "null" else bare))
+        pos = column.end()
+
+    return columns, old_key
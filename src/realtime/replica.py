@@ -0,0 +1,265 @@
+from typing import (
+    Any,
+    AsyncIterable,
+    Dict,
+    Hashable,
+    Iterable,
+    List,
+    Mapping,
+    Optional,
+    Sequence,
+    Tuple,
+)
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+from realtime.convert import UNCHANGED_TOAST, convert
+from realtime.delivery import AckTracker
+from realtime.filters import ChangeFilter
+from realtime.keys import PrimaryKeys
+from realtime.message import CRUDMessage
+from realtime.replication import ReplicationConnection, quote_ident, quote_literal
+from realtime.subscribe import connection_params, subscribe_transactions
+from realtime.transaction import Transaction
+
+__all__ = ["LocalTable"]
+
+Row = Dict[str, Any]
+
+
+class LocalTable:
+    """A live in-memory copy of one table
+
+    The table is bootstrapped from the snapshot exported when its slot is
+    created, then kept up to date by applying the slot's transactions as
+    they commit. Only transactions committed after the snapshot's
+    consistent point are applied, as the snapshot already holds the others.
+
+    Rows are dicts of column name to python value, held by primary key, and
+    *indexes* names columns to keep secondary hash indexes on. Lookups are
+    served from memory without querying the database. Each transaction is
+    applied at once, so readers in the same event loop never see part of
+    one.
+
+    Example::
+
+        accounts = LocalTable("public.account", indexes=["email"])
+        await accounts.bootstrap(con, slot_name="account_cache")
+        asyncio.create_task(accounts.follow(con, slot_name="account_cache"))
+        ...
+        accounts.get(42)
+        accounts.lookup("email", "a@b.c")
+    """
+
+    def __init__(
+        self,
+        name: str,
+        key: Optional[Sequence[str]] = None,
+        indexes: Iterable[str] = (),
+    ) -> None:
+        schema, dot, table = name.partition(".")
+        self.schema, self.table = (schema, table) if dot else ("public", schema)
+        self.key_columns: Optional[Tuple[str, ...]] = (
+            None if key is None else tuple(key)
+        )
+        self.rows: Dict[Hashable, Row] = {}
+        self.indexes: Dict[str, Dict[Hashable, Dict[Hashable, Row]]] = {
+            column: {} for column in indexes
+        }
+        self.snapshot_lsn: Optional[int] = None
+        self.applied_lsn: Optional[int] = None
+
+    @property
+    def name(self) -> str:
+        return "{}.{}".format(self.schema, self.table)
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self.rows
+
+    def get(self, *key: Any) -> Optional[Row]:
+        """The row with primary key *key*, e.g. get(42) or get(org, person)"""
+        return self.rows.get(key[0] if len(key) == 1 else key)
+
+    def lookup(self, column: str, value: Any) -> List[Row]:
+        """The rows where indexed *column* is *value*"""
+        try:
+            index = self.indexes[column]
+        except KeyError:
+            raise ValueError("{} is not indexed".format(column)) from None
+        return list(index.get(value, {}).values())
+
+    def row_key(self, row: Mapping[str, Any]) -> Hashable:
+        if not self.key_columns:
+            raise ValueError("No primary key for {}".format(self.name))
+        if len(self.key_columns) == 1:
+            return row[self.key_columns[0]]
+        return tuple(row[column] for column in self.key_columns)
+
+    def put(self, key: Hashable, row: Row) -> None:
+        self.remove(key)
+        self.rows[key] = row
+        for column, index in self.indexes.items():
+            index.setdefault(row.get(column), {})[key] = row
+
+    def remove(self, key: Hashable) -> None:
+        row = self.rows.pop(key, None)
+        if row is None:
+            return
+        for column, index in self.indexes.items():
+            value = row.get(column)
+            entries = index[value]
+            del entries[key]
+            if not entries:
+                del index[value]
+
+    def clear(self) -> None:
+        self.rows.clear()
+        for index in self.indexes.values():
+            index.clear()
+
+    def load(self, rows: Iterable[Mapping[str, Any]], lsn: int) -> None:
+        """Replace the contents with *rows*, a snapshot as of *lsn*"""
+        self.clear()
+        for row in rows:
+            values = dict(row)
+            self.put(self.row_key(values), values)
+        self.snapshot_lsn = lsn
+        self.applied_lsn = lsn
+
+    def apply_change(self, change: CRUDMessage) -> None:
+        if change.command == "TRUNCATE":
+            self.clear()
+            return
+
+        values = {column.column: column.typed for column in change.columns}
+        key = self.row_key(values)
+        if change.command == "DELETE":
+            self.remove(key)
+            return
+
+        if change.old_key is not None:
+            # Held under its old key, which differs when the key changed
+            old = self.row_key(
+                {column.column: column.typed for column in change.old_key}
+            )
+            previous = self.rows.get(old)
+            self.remove(old)
+        else:
+            previous = self.rows.get(key)
+        for column, value in values.items():
+            if value is UNCHANGED_TOAST:
+                values[column] = None if previous is None else previous.get(column)
+        self.put(key, values)
+
+    def apply(self, transaction: Transaction) -> bool:
+        """Apply the changes to this table in *transaction*, returning whether
+        it was applied rather than skipped as already held
+        """
+        lsn = transaction.commit_lsn
+        if lsn is not None and self.applied_lsn is not None and lsn <= self.applied_lsn:
+            return False
+
+        for change in transaction:
+            if change.schema == self.schema and change.table == self.table:
+                self.apply_change(change)
+        if lsn is not None:
+            self.applied_lsn = lsn
+        return True
+
+    async def bootstrap(
+        self,
+        con: AsyncConnection,
+        slot_name: str = "realtime_py",
+        plugin: str = "test_decoding",
+    ) -> None:
+        """Create *slot_name* and load the table from the snapshot it exports
+
+        *con* must not be in a transaction. The slot must not exist yet, and
+        is left for follow to read from. Values are read as text and
+        converted as they are for changes, so snapshot and streamed rows
+        hold the same python types.
+        """
+
+        COLUMNS = text(
+            "SELECT attname, format_type(atttypid, atttypmod) FROM pg_attribute "
+            "WHERE attrelid = CAST(:table AS regclass) "
+            "AND attnum > 0 AND NOT attisdropped ORDER BY attnum"
+        )
+
+        table = "{}.{}".format(quote_ident(self.schema), quote_ident(self.table))
+        replication = await ReplicationConnection.connect(**connection_params(con))
+        try:
+            lsn, snapshot = await replication.create_slot(slot_name, plugin)
+            try:
+                # Both must come before any query in the transaction
+                await con.execute(
+                    text("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ")
+                )
+                await con.execute(
+                    text("SET TRANSACTION SNAPSHOT {}".format(quote_literal(snapshot)))
+                )
+                if self.key_columns is None:
+                    keys = PrimaryKeys()
+                    await keys.load(con, [(self.schema, self.table)])
+                    self.key_columns = keys.get(self.schema, self.table)
+
+                columns = (await con.execute(COLUMNS, dict(table=table))).all()
+                result = await con.execute(
+                    text(
+                        "SELECT {} FROM {}".format(
+                            ", ".join(
+                                "CAST({} AS text)".format(quote_ident(name))
+                                for name, _ in columns
+                            ),
+                            table,
+                        )
+                    )
+                )
+                self.load(
+                    (
+                        {
+                            name: convert(data_type, value)
+                            for (name, data_type), value in zip(columns, row)
+                        }
+                        for row in result
+                    ),
+                    lsn,
+                )
+            finally:
+                await con.rollback()
+        finally:
+            await replication.close()
+
+    async def follow(
+        self,
+        con: AsyncConnection,
+        slot_name: str = "realtime_py",
+        acks: Optional[AckTracker] = None,
+        **kwargs: Any,
+    ) -> None:
+        """Apply the transactions in *slot_name* until cancelled
+
+        Other arguments are as for subscribe_transactions.
+        """
+        kwargs.setdefault("where", ChangeFilter(tables=[(self.schema, self.table)]))
+        await self.apply_all(
+            subscribe_transactions(con, slot_name=slot_name, acks=acks, **kwargs),
+            acks=acks,
+        )
+
+    async def apply_all(
+        self,
+        transactions: AsyncIterable[Transaction],
+        acks: Optional[AckTracker] = None,
+    ) -> None:
+        """Apply every transaction in *transactions*, acknowledging each in
+        *acks*
+        """
+        async for transaction in transactions:
+            self.apply(transaction)
+            if acks is not None:
+                acks.ack()
@@ -0,0 +1,358 @@
+import asyncio
+import base64
+import hashlib
+import hmac
+import os
+import struct
+import time
+from typing import AsyncGenerator, Dict, List, Optional, Tuple
+
+from realtime.delivery import AckTracker
+from realtime.exceptions import ReplicationException
+from realtime.lsn import parse_lsn
+
+__all__ = ["ReplicationConnection", "stream"]
+
+PROTOCOL_VERSION = 196608
+
+# Microseconds between the unix and postgres (2000-01-01) epochs
+POSTGRES_EPOCH_US = 946684800 * 1000000
+
+XLOG_DATA = struct.Struct("!QQQ")
+KEEPALIVE = struct.Struct("!QQ?")
+STANDBY_STATUS = struct.Struct("!cQQQQ?")
+
+
+def postgres_now() -> int:
+    """Microseconds since the postgres epoch"""
+    return int(time.time() * 1000000) - POSTGRES_EPOCH_US
+
+
+def quote_ident(name: str) -> str:
+    return '"{}"'.format(name.replace('"', '""'))
+
+
+def quote_literal(value: str) -> str:
+    return "'{}'".format(value.replace("'", "''"))
+
+
+class ReplicationConnection:
+    """A minimal client for the PostgreSQL logical streaming replication protocol
+
+    Speaks just enough of the frontend/backend protocol to authenticate
+    (trust, password, md5 or SCRAM-SHA-256) over TCP or a unix socket, run
+    replication commands such as CREATE_REPLICATION_SLOT and
+    START_REPLICATION, and exchange CopyBoth frames.
+    """
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.reader = reader
+        self.writer = writer
+
+    @classmethod
+    async def connect(
+        cls,
+        host: str = "localhost",
+        port: int = 5432,
+        user: str = "postgres",
+        password: Optional[str] = None,
+        database: str = "postgres",
+    ) -> "ReplicationConnection":
+        if host.startswith("/"):
+            reader, writer = await asyncio.open_unix_connection(
+                os.path.join(host, ".s.PGSQL.{}".format(port))
+            )
+        else:
+            reader, writer = await asyncio.open_connection(host, port)
+
+        con = cls(reader, writer)
+        try:
+            await con.startup(user, password, database)
+        except BaseException:
+            await con.close()
+            raise
+        return con
+
+    async def startup(self, user: str, password: Optional[str], database: str) -> None:
+        params = {"user": user, "database": database, "replication": "database"}
+        body = struct.pack("!i", PROTOCOL_VERSION)
+        for key, value in params.items():
+            body += key.encode() + b"\x00" + value.encode() + b"\x00"
+        body += b"\x00"
+        self.writer.write(struct.pack("!i", len(body) + 4) + body)
+
+        scram: Optional[ScramSha256] = None
+
+        while True:
+            kind, payload = await self.read_message()
+
+            if kind == b"R":
+                (code,) = struct.unpack_from("!i", payload)
+                if code == 0:
+                    continue
+                if password is None:
+                    raise ReplicationException("Server requested a password")
+                if code == 3:
+                    self.send(b"p", password.encode() + b"\x00")
+                elif code == 5:
+                    inner = hashlib.md5((password + user).encode()).hexdigest()
+                    outer = hashlib.md5(inner.encode() + payload[4:8]).hexdigest()
+                    self.send(b"p", b"md5" + outer.encode() + b"\x00")
+                elif code == 10:
+                    if b"SCRAM-SHA-256\x00" not in payload[4:]:
+                        raise ReplicationException("No supported SASL mechanism")
+                    scram = ScramSha256(password)
+                    first = scram.client_first()
+                    self.send(
+                        b"p",
+                        b"SCRAM-SHA-256\x00" + struct.pack("!i", len(first)) + first,
+                    )
+                elif code == 11 and scram is not None:
+                    self.send(b"p", scram.client_final(payload[4:]))
+                elif code == 12 and scram is not None:
+                    scram.verify(payload[4:])
+                else:
+                    raise ReplicationException(
+                        "Unsupported authentication method {}".format(code)
+                    )
+            elif kind == b"Z":
+                return
+
+    async def read_message(self) -> Tuple[bytes, bytes]:
+        """Read one backend message, raising on an ErrorResponse"""
+        while True:
+            header = await self.reader.readexactly(5)
+            kind = header[:1]
+            (length,) = struct.unpack_from("!i", header, 1)
+            payload = await self.reader.readexactly(length - 4)
+
+            if kind == b"E":
+                raise ReplicationException(error_message(payload))
+            # NoticeResponse, ParameterStatus, BackendKeyData
+            if kind in (b"N", b"S", b"K"):
+                continue
+            return kind, payload
+
+    def send(self, kind: bytes, payload: bytes) -> None:
+        self.writer.write(kind + struct.pack("!i", len(payload) + 4) + payload)
+
+    async def start_replication(
+        self,
+        slot_name: str,
+        start_lsn: int = 0,
+        options: Optional[Dict[str, str]] = None,
+    ) -> None:
+        """Put the connection into CopyBoth mode streaming from *slot_name*"""
+        query = "START_REPLICATION SLOT {} LOGICAL {:X}/{:X}".format(
+            quote_ident(slot_name), start_lsn >> 32, start_lsn & 0xFFFFFFFF
+        )
+        if options:
+            query += " ({})".format(
+                ", ".join(
+                    "{} {}".format(quote_ident(key), quote_literal(value))
+                    for key, value in options.items()
+                )
+            )
+        self.send(b"Q", query.encode() + b"\x00")
+
+        kind, _ = await self.read_message()
+        if kind != b"W":
+            raise ReplicationException(
+                "Expected CopyBothResponse, received {!r}".format(kind)
+            )
+
+    async def query(self, query: str) -> List[Tuple[Optional[str], ...]]:
+        """Run a replication command, returning its rows as text"""
+        self.send(b"Q", query.encode() + b"\x00")
+
+        rows: List[Tuple[Optional[str], ...]] = []
+        error: Optional[ReplicationException] = None
+        while True:
+            try:
+                kind, payload = await self.read_message()
+            except ReplicationException as e:
+                # The server is ready for another command after an error
+                error = e
+                continue
+            if kind == b"D":
+                (n_fields,) = struct.unpack_from("!h", payload)
+                offset = 2
+                row: List[Optional[str]] = []
+                for _ in range(n_fields):
+                    (length,) = struct.unpack_from("!i", payload, offset)
+                    offset += 4
+                    if length < 0:
+                        row.append(None)
+                    else:
+                        row.append(payload[offset : offset + length].decode())
+                        offset += length
+                rows.append(tuple(row))
+            elif kind == b"Z":
+                if error is not None:
+                    raise error
+                return rows
+
+    async def create_slot(
+        self, slot_name: str, plugin: str = "test_decoding"
+    ) -> Tuple[int, str]:
+        """Create a logical replication slot exporting a snapshot
+
+        Returns the slot's consistent point and the snapshot's name. The
+        snapshot can be imported with SET TRANSACTION SNAPSHOT until the
+        next command is run on this connection or it is closed.
+        """
+        rows = await self.query(
+            "CREATE_REPLICATION_SLOT {} LOGICAL {} EXPORT_SNAPSHOT".format(
+                quote_ident(slot_name), quote_ident(plugin)
+            )
+        )
+        _, consistent_point, snapshot_name, _ = rows[0]
+        if consistent_point is None or snapshot_name is None:
+            raise ReplicationException("No snapshot was exported")
+        return parse_lsn(consistent_point), snapshot_name
+
+    def send_status(self, received: int, flushed: int, reply: bool = False) -> None:
+        """Send a standby status update reporting WAL positions"""
+        self.send(
+            b"d",
+            STANDBY_STATUS.pack(
+                b"r", received, flushed, flushed, postgres_now(), reply
+            ),
+        )
+
+    async def close(self) -> None:
+        if not self.writer.is_closing():
+            try:
+                # Terminate
+                self.send(b"X", b"")
+            except ConnectionError:
+                pass
+            self.writer.close()
+        try:
+            await self.writer.wait_closed()
+        except ConnectionError:
+            pass
+
+
+class ScramSha256:
+    """Client side of a SCRAM-SHA-256 exchange without channel binding"""
+
+    def __init__(self, password: str) -> None:
+        self.password = password
+        self.nonce = base64.b64encode(os.urandom(18)).decode()
+        self.client_first_bare = "n=,r={}".format(self.nonce)
+        self.server_signature = b""
+
+    def client_first(self) -> bytes:
+        return ("n,," + self.client_first_bare).encode()
+
+    def client_final(self, server_first: bytes) -> bytes:
+        fields = dict(
+            item.split("=", 1) for item in server_first.decode().split(",") if item
+        )
+        if not fields["r"].startswith(self.nonce):
+            raise ReplicationException("SCRAM server nonce mismatch")
+
+        salted = hashlib.pbkdf2_hmac(
+            "sha256",
+            self.password.encode(),
+            base64.b64decode(fields["s"]),
+            int(fields["i"]),
+        )
+        client_key = hmac.digest(salted, b"Client Key", "sha256")
+        stored_key = hashlib.sha256(client_key).digest()
+        without_proof = "c=biws,r={}".format(fields["r"])
+        auth_message = ",".join(
+            [self.client_first_bare, server_first.decode(), without_proof]
+        ).encode()
+        signature = hmac.digest(stored_key, auth_message, "sha256")
+        proof = bytes(x ^ y for x, y in zip(client_key, signature))
+
+        server_key = hmac.digest(salted, b"Server Key", "sha256")
+        self.server_signature = hmac.digest(server_key, auth_message, "sha256")
+
+        return "{},p={}".format(
+            without_proof, base64.b64encode(proof).decode()
+        ).encode()
+
+    def verify(self, server_final: bytes) -> None:
+        fields = dict(
+            item.split("=", 1) for item in server_final.decode().split(",") if item
+        )
+        if base64.b64decode(fields.get("v", "")) != self.server_signature:
+            raise ReplicationException("SCRAM server signature mismatch")
+
+
+def error_message(payload: bytes) -> str:
+    fields = {
+        field[:1]: field[1:].decode(errors="replace")
+        for field in payload.split(b"\x00")
+        if field
+    }
+    return "{}: {}".format(fields.get(b"S", "ERROR"), fields.get(b"M", ""))
+
+
+async def stream(
+    con: ReplicationConnection,
+    slot_name: str,
+    acks: Optional[AckTracker] = None,
+    status_interval: float = 10.0,
+    options: Optional[Dict[str, str]] = None,
+) -> AsyncGenerator[Tuple[int, bytes], None]:
+    """Stream (lsn, data) pairs from a logical replication slot as they are pushed
+
+    Standby status updates are sent every *status_interval* seconds and
+    whenever the server asks for one. Without *acks*, changes are reported
+    flushed once they have been read. With *acks*, only acknowledged
+    transactions are reported flushed.
+    """
+    await con.start_replication(slot_name, options=options)
+
+    received = 0
+    flushed = 0
+
+    def flush_position() -> int:
+        nonlocal flushed
+        if acks is None:
+            flushed = received
+        else:
+            confirmed = acks.confirmable()
+            if confirmed is not None:
+                flushed = max(flushed, confirmed)
+        return flushed
+
+    async def report() -> None:
+        while True:
+            await asyncio.sleep(status_interval)
+            con.send_status(received, flush_position())
+
+    reporter = asyncio.ensure_future(report())
+    try:
+        while True:
+            kind, payload = await con.read_message()
+
+            if kind == b"c":
+                # CopyDone: the server ended the stream
+                return
+            if kind != b"d":
+                raise ReplicationException("Unexpected message {!r}".format(kind))
+
+            if payload[:1] == b"w":
+                start, _, _ = XLOG_DATA.unpack_from(payload, 1)
+                received = max(received, start)
+                yield start, payload[1 + XLOG_DATA.size :]
+
+            elif payload[:1] == b"k":
+                wal_end, _, reply = KEEPALIVE.unpack_from(payload, 1)
+                # Everything read so far has been delivered, so when it is all
+                # acknowledged the slot may move to the server's WAL end
+                if acks is None or acks.caught_up:
+                    received = max(received, wal_end)
+                    if acks is not None:
+                        flushed = max(flushed, wal_end)
+                if reply:
+                    con.send_status(received, flush_position())
+    finally:
+        reporter.cancel()
+        if not con.writer.is_closing():
+            con.send_status(received, flush_position())
@@ -0,0 +1,97 @@
+import asyncio
+from contextlib import asynccontextmanager
+from typing import Any, AsyncGenerator, Optional
+
+from sqlalchemy.ext.asyncio import AsyncConnection
+from typing_extensions import Protocol
+
+__all__ = ["PollScheduler", "FixedDelay", "Backoff", "notifications"]
+
+
+class PollScheduler(Protocol):
+    """Decides how long subscribe waits between polls of a replication slot
+
+    subscribe keeps fetching without waiting while batches come back full,
+    and calls wait with the number of rows read once the slot is drained.
+    """
+
+    async def wait(self, rows: int) -> None:
+        ...
+
+
+async def sleep(delay: float, wake: Optional[asyncio.Event]) -> None:
+    """Sleep for *delay* seconds or until *wake* is set, whichever is first"""
+    if wake is None:
+        await asyncio.sleep(delay)
+        return
+
+    try:
+        await asyncio.wait_for(wake.wait(), timeout=delay)
+    except asyncio.TimeoutError:
+        pass
+    wake.clear()
+
+
+class FixedDelay:
+    """Wait the same *delay* seconds between every poll"""
+
+    def __init__(self, delay: float = 0.1, wake: Optional[asyncio.Event] = None):
+        self.delay = delay
+        self.wake = wake
+
+    async def wait(self, rows: int) -> None:
+        await sleep(self.delay, self.wake)
+
+
+class Backoff:
+    """Poll quickly while changes arrive and back off exponentially when idle
+
+    Waits *min_delay* after a poll that found changes, and multiplies the
+    wait by *factor*, up to *max_delay*, for each consecutive empty poll.
+    When *wake* is set, e.g. by notifications, the current wait ends early.
+    """
+
+    def __init__(
+        self,
+        min_delay: float = 0.01,
+        max_delay: float = 5.0,
+        factor: float = 2.0,
+        wake: Optional[asyncio.Event] = None,
+    ):
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.factor = factor
+        self.wake = wake
+        self.delay = min_delay
+
+    async def wait(self, rows: int) -> None:
+        if rows:
+            self.delay = self.min_delay
+        else:
+            self.delay = min(self.delay * self.factor, self.max_delay)
+        await sleep(self.delay, self.wake)
+
+
+@asynccontextmanager
+async def notifications(
+    con: AsyncConnection, channel: str
+) -> AsyncGenerator[asyncio.Event, None]:
+    """LISTEN on *channel* and set the yielded event for every NOTIFY
+
+    Notifications are only delivered outside of transactions, so *con* must
+    be a connection (asyncpg) dedicated to listening, not the one passed to
+    subscribe. Pair with a scheduler's *wake* to poll as soon as a trigger
+    announces a change.
+    """
+    event = asyncio.Event()
+
+    def notify(*_: Any) -> None:
+        event.set()
+
+    raw = await con.get_raw_connection()
+    driver = raw.driver_connection
+    await driver.add_listener(channel, notify)
+    try:
+        yield event
+    finally:
+        await driver.remove_listener(channel, notify)
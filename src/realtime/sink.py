@@ -0,0 +1,222 @@
+from itertools import groupby
+from typing import (
+    Any,
+    AsyncIterable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Mapping,
+    Optional,
+    Sequence,
+    Tuple,
+)
+
+from sqlalchemy import MetaData, Table, and_, tuple_
+from sqlalchemy.engine import Connection
+from sqlalchemy.ext.asyncio import AsyncConnection
+from sqlalchemy.sql import bindparam
+from sqlalchemy.util import await_only
+
+from realtime.convert import UNCHANGED_TOAST
+from realtime.delivery import AckTracker
+from realtime.keys import PrimaryKeys
+from realtime.message import CRUDMessage, Message
+
+__all__ = ["Sink"]
+
+TableKey = Tuple[Optional[str], str]
+
+# Rows per DELETE ... WHERE key IN (...) statement
+DELETE_CHUNK = 500
+
+
+def runs(
+    changes: Iterable[CRUDMessage],
+) -> Iterator[Tuple[TableKey, str, List[CRUDMessage]]]:
+    """Consecutive changes with the same table and command, in order"""
+    for (schema, table, command), run in groupby(
+        changes, lambda change: (change.schema, change.table, change.command)
+    ):
+        yield (schema, table), command, list(run)
+
+
+class Sink:
+    """Apply the changes of a subscription to tables in another database
+
+    Each source transaction is applied as one transaction on *target*, with
+    consecutive changes to a table grouped into runs:
+
+    - INSERT runs are written with one multi-row executemany, or with COPY
+      when *target* uses asyncpg and *copy* is set
+    - UPDATE runs are written with one executemany of an UPDATE keyed on
+      the table's replica identity, per set of changed columns
+    - DELETE runs are written with DELETE ... WHERE key IN (...)
+    - TRUNCATE deletes every row
+
+    *tables* maps source tables, as "schema.table", to target tables, as
+    "table" or "schema.table". Only mapped tables are applied when given,
+    otherwise changes are applied to the table of the same name in the
+    target's default schema. Target tables are reflected when first used,
+    and source columns they do not have are left out.
+
+    Rows are identified by the source's key columns in *keys*, defaulting
+    to the target table's primary key. Updates are matched on the values of
+    the key before the update, from their old key when it changed.
+
+    Example::
+
+        sink = Sink(target, tables={"public.account": "account"})
+        await sink.apply(subscribe(source, acks=acks), acks=acks)
+    """
+
+    def __init__(
+        self,
+        target: AsyncConnection,
+        tables: Optional[Mapping[str, str]] = None,
+        keys: Optional[PrimaryKeys] = None,
+        copy: bool = True,
+    ) -> None:
+        self.target = target
+        self.mapping: Optional[Dict[TableKey, str]] = None
+        if tables is not None:
+            self.mapping = {}
+            for source, target_name in tables.items():
+                schema, dot, table = source.partition(".")
+                self.mapping[(schema, table) if dot else (None, schema)] = target_name
+        self.keys = keys or PrimaryKeys()
+        self.copy = copy
+        self.metadata = MetaData()
+        self.tables: Dict[str, Table] = {}
+
+    async def apply(
+        self, messages: AsyncIterable[Message], acks: Optional[AckTracker] = None
+    ) -> None:
+        """Apply every transaction in *messages*, acknowledging each in *acks*
+        once it has been committed on the target
+        """
+        changes: List[CRUDMessage] = []
+        async for message in messages:
+            if isinstance(message, CRUDMessage):
+                changes.append(message)
+            elif message.command == "COMMIT":
+                await self.apply_transaction(changes)
+                changes = []
+                if acks is not None:
+                    acks.ack()
+
+    async def apply_transaction(self, changes: Sequence[CRUDMessage]) -> None:
+        """Apply the changes of one source transaction in one target transaction"""
+        if changes:
+            await self.target.run_sync(self.write, changes)
+
+    def write(self, con: Connection, changes: Sequence[CRUDMessage]) -> None:
+        try:
+            for source, command, run in runs(changes):
+                table = self.table(con, source)
+                if table is None:
+                    continue
+                if command == "INSERT":
+                    self.insert(con, table, run)
+                elif command == "UPDATE":
+                    self.update(con, source, table, run)
+                elif command == "DELETE":
+                    self.delete(con, source, table, run)
+                elif command == "TRUNCATE":
+                    con.execute(table.delete())
+            con.commit()
+        except BaseException:
+            con.rollback()
+            raise
+
+    def table(self, con: Connection, source: TableKey) -> Optional[Table]:
+        if self.mapping is None:
+            name: Optional[str] = source[1]
+        else:
+            name = self.mapping.get(source)
+        if name is None:
+            return None
+
+        try:
+            return self.tables[name]
+        except KeyError:
+            pass
+
+        schema, dot, table_name = name.partition(".")
+        table = Table(
+            table_name if dot else schema,
+            self.metadata,
+            schema=schema if dot else None,
+            autoload_with=con,
+        )
+        self.tables[name] = table
+        return table
+
+    def key_columns(self, source: TableKey, table: Table) -> Tuple[str, ...]:
+        columns = self.keys.get(*source) or tuple(c.name for c in table.primary_key)
+        if not columns:
+            raise ValueError("No key to apply changes to {} with".format(table))
+        return columns
+
+    def rows(self, table: Table, run: List[CRUDMessage]) -> List[Dict[str, Any]]:
+        """Typed values of the columns *table* has, per change"""
+        names = table.c
+        return [
+            {
+                column.column: column.typed
+                for column in change.columns
+                if column.column in names and column.typed is not UNCHANGED_TOAST
+            }
+            for change in run
+        ]
+
+    def insert(self, con: Connection, table: Table, run: List[CRUDMessage]) -> None:
+        rows = self.rows(table, run)
+        if self.copy and con.dialect.driver == "asyncpg":
+            columns = list(rows[0])
+            if all(list(row) == columns for row in rows):
+                driver = con.connection.driver_connection  # type: ignore
+                await_only(
+                    driver.copy_records_to_table(
+                        table.name,
+                        schema_name=table.schema,
+                        columns=columns,
+                        records=[tuple(row.values()) for row in rows],
+                    )
+                )
+                return
+        con.execute(table.insert(), rows)
+
+    def update(
+        self, con: Connection, source: TableKey, table: Table, run: List[CRUDMessage]
+    ) -> None:
+        key = self.key_columns(source, table)
+        params = []
+        for change, row in zip(run, self.rows(table, run)):
+            before = row
+            if change.old_key is not None:
+                before = {column.column: column.typed for column in change.old_key}
+            params.append(dict(row, **{"key_" + name: before[name] for name in key}))
+
+        # One statement per set of columns, as unchanged TOAST values are left out
+        statement = table.update().where(
+            and_(*(table.c[name] == bindparam("key_" + name) for name in key))
+        )
+        for _, group in groupby(params, lambda row: list(row)):
+            con.execute(statement, list(group))
+
+    def delete(
+        self, con: Connection, source: TableKey, table: Table, run: List[CRUDMessage]
+    ) -> None:
+        key = self.key_columns(source, table)
+        rows = self.rows(table, run)
+        if len(key) == 1:
+            column = table.c[key[0]]
+            values: List[Any] = [row[key[0]] for row in rows]
+        else:
+            column = tuple_(*(table.c[name] for name in key))
+            values = [tuple(row[name] for name in key) for row in rows]
+
+        for start in range(0, len(values), DELETE_CHUNK):
+            chunk = values[start : start + DELETE_CHUNK]
+            con.execute(table.delete().where(column.in_(chunk)))
@@ -1,11 +1,37 @@
-import asyncio
+from concurrent.futures import Executor
 from contextlib import asynccontextmanager
-from typing import AsyncGenerator
+from time import perf_counter
+from typing import (
+    Any,
+    AsyncGenerator,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Literal,
+    Optional,
+    Sequence,
+    Tuple,
+)
+from uuid import uuid4
 
 from sqlalchemy import text
+from sqlalchemy.engine import Row
 from sqlalchemy.ext.asyncio import AsyncConnection
+from sqlalchemy.sql.elements import TextClause
 
-from realtime.message import Message, parse
+from realtime.capture import Recorder
+from realtime.decoders import Decoder, TestDecodingDecoder, decoder_for
+from realtime.delivery import AckTracker
+from realtime.filters import ChangeFilter
+from realtime.lsn import LSN, format_lsn, parse_lsn
+from realtime.message import Message
+from realtime.metrics import Metrics, slot_lag
+from realtime.native import NativeQueries
+from realtime.parallel import decode
+from realtime.replication import ReplicationConnection, stream
+from realtime.scheduler import FixedDelay, PollScheduler
+from realtime.transaction import Transaction
 
 
 async def subscribe(
@@ -13,30 +39,474 @@ async def subscribe(
     slot_name: str = "realtime_py",
     poll_delay: float = 0.1,
     drop_on_close: bool = True,
+    batch_size: Optional[int] = 10000,
+    acks: Optional[AckTracker] = None,
+    transport: Literal["poll", "stream"] = "poll",
+    scheduler: Optional[PollScheduler] = None,
+    plugin: str = "test_decoding",
+    plugin_options: Optional[Dict[str, str]] = None,
+    where: Optional[ChangeFilter] = None,
+    parse_executor: Optional[Executor] = None,
+    metrics: Optional[Metrics] = None,
+    record: Optional[str] = None,
+    native: bool = False,
+    start_lsn: Optional[LSN] = None,
+    end_lsn: Optional[LSN] = None,
 ) -> AsyncGenerator[Message, None]:
-    """Subscribe to a PostgreSQL +9.4 database for changes"""
+    """Subscribe to a PostgreSQL +9.4 database for changes
+
+    Changes are read from the slot *batch_size* rows at a time, and the next
+    batch is only fetched once the previous one has been consumed. Set
+    *batch_size* to None to read everything waiting in the slot at once.
+
+    By default changes are consumed from the slot as they are read. Pass
+    *acks* for at-least-once delivery, where the slot (PostgreSQL 11+) only
+    advances past transactions acknowledged through the AckTracker. Close
+    the subscription with aclose() to flush the final acknowledgements.
+
+    The "poll" transport queries the slot every *poll_delay* seconds, or as
+    decided by *scheduler* e.g. Backoff. The "stream" transport opens a
+    replication connection with *con*'s credentials and receives changes as
+    soon as the server sends them.
+
+    *plugin* selects the output plugin the slot decodes with, test_decoding,
+    pgoutput or wal2json, and *plugin_options* are passed to it e.g.
+    {"publication_names": "realtime_py"}.
+
+    *where* restricts the changes received to some tables and commands. It
+    is applied on the server where possible: a LIKE filter on the rows read
+    for test_decoding without *acks*, and add-tables and actions options for
+    wal2json. For pgoutput, see create_publication. Other changes are
+    dropped before their columns are parsed.
+
+    Pass a ProcessPoolExecutor as *parse_executor* to parse large
+    test_decoding fetches, e.g. while catching up on a backlog, on several
+    cores. Small fetches are still parsed in-process.
+
+    Pass *metrics* to record fetch sizes, fetch and parse latencies,
+    throughput, queue depth and slot lag, see Metrics.
+
+    Pass a directory as *record* to append the raw rows read to a capture
+    there, which realtime.capture.replay plays back without a database.
+    Only the "poll" transport records. With *acks*, transactions delivered
+    again after a restart are recorded again.
+
+    Set *native* to poll with a prepared statement on *con*'s asyncpg
+    connection, fetching raw records rather than SQLAlchemy rows.
+
+    Pass *start_lsn* and/or *end_lsn* to read the transactions committed
+    after *start_lsn*, up to and including *end_lsn*, and then stop. Both
+    are commit LSNs as delivered, e.g. a Transaction's commit_lsn. The
+    window is read from a temporary copy of the slot (PostgreSQL 12+), so a
+    live subscription to the slot carries on undisturbed, on another
+    connection. Without *end_lsn* it ends at the current end of WAL.
+    Windows are read without *acks* and the slot is never dropped.
+
+    A window can not replay changes the slot has already consumed: the copy
+    starts where the slot is, and a *start_lsn* before the slot's last
+    confirmed transaction raises ValueError. To re-run consumed changes,
+    *record* them and replay the capture, or follow the slot with *acks*
+    and only acknowledge transactions once it is safe to lose them.
+    """
+    messages = changes(
+        con,
+        slot_name=slot_name,
+        poll_delay=poll_delay,
+        drop_on_close=drop_on_close,
+        batch_size=batch_size,
+        acks=acks,
+        transport=transport,
+        scheduler=scheduler,
+        plugin=plugin,
+        plugin_options=plugin_options,
+        where=where,
+        parse_executor=parse_executor,
+        metrics=metrics,
+        record=record,
+        native=native,
+        start_lsn=start_lsn,
+        end_lsn=end_lsn,
+    )
+    try:
+        async for _, message in messages:
+            yield message
+    finally:
+        await messages.aclose()
+
+
+async def subscribe_transactions(
+    con: AsyncConnection,
+    slot_name: str = "realtime_py",
+    memory_budget: int = 64 * 1024 * 1024,
+    spill_dir: Optional[str] = None,
+    **kwargs: Any,
+) -> AsyncGenerator[Transaction, None]:
+    """Subscribe to a PostgreSQL +9.4 database for whole transactions
+
+    Yields a Transaction per commit holding its xid, commit LSN and
+    changes. Changes beyond roughly *memory_budget* bytes per transaction
+    are spilled to a temporary file in *spill_dir* and read back when the
+    transaction is iterated. A transaction's spill file is removed once the
+    next transaction is requested, so apply each one before moving on.
+
+    Other arguments are as for subscribe. With *acks*, acknowledge a
+    transaction once it has been applied.
+    """
+    messages = changes(con, slot_name=slot_name, **kwargs)
+    transaction: Optional[Transaction] = None
+    try:
+        async for lsn, message in messages:
+            if message.command == "BEGIN":
+                transaction = Transaction(
+                    xid=message.lsn,  # type: ignore
+                    memory_budget=memory_budget,
+                    spill_dir=spill_dir,
+                )
+            elif message.command == "COMMIT":
+                if transaction is None:
+                    continue
+                transaction.commit_lsn = parse_lsn(lsn)
+                try:
+                    yield transaction
+                finally:
+                    transaction.close()
+                    transaction = None
+            else:
+                if transaction is None:
+                    # Plugins may be configured without transaction messages
+                    transaction = Transaction(
+                        xid=None, memory_budget=memory_budget, spill_dir=spill_dir
+                    )
+                transaction.append(message)  # type: ignore
+    finally:
+        if transaction is not None:
+            transaction.close()
+        await messages.aclose()
+
+
+async def changes(
+    con: AsyncConnection,
+    slot_name: str = "realtime_py",
+    poll_delay: float = 0.1,
+    drop_on_close: bool = True,
+    batch_size: Optional[int] = 10000,
+    acks: Optional[AckTracker] = None,
+    transport: Literal["poll", "stream"] = "poll",
+    scheduler: Optional[PollScheduler] = None,
+    plugin: str = "test_decoding",
+    plugin_options: Optional[Dict[str, str]] = None,
+    where: Optional[ChangeFilter] = None,
+    parse_executor: Optional[Executor] = None,
+    metrics: Optional[Metrics] = None,
+    record: Optional[str] = None,
+    native: bool = False,
+    start_lsn: Optional[LSN] = None,
+    end_lsn: Optional[LSN] = None,
+) -> AsyncGenerator[Tuple[LSN, Message], None]:
+    """Subscribe to (lsn, message) pairs, see subscribe"""
+
+    scheduler = scheduler or FixedDelay(poll_delay)
+    decoder = decoder_for(plugin, plugin_options or {}, where)
+
+    if record is not None and transport != "poll":
+        raise ValueError('Only the "poll" transport can record')
+    window = start_lsn is not None or end_lsn is not None
+    if window and (transport != "poll" or acks is not None):
+        raise ValueError('A window is read with the "poll" transport, without acks')
+    recorder = None if record is None else Recorder(record, plugin, decoder.options)
+    queries = NativeQueries(con) if native and transport == "poll" else None
+
+    try:
+        if window:
+            copy = window_slot(con, slot_name, plugin, start_lsn, end_lsn)
+            async with copy as (copy_name, upto_lsn):
+                started = perf_counter()
+                async for rows in drain(
+                    con, copy_name, batch_size, decoder, where, queries, upto_lsn
+                ):
+                    if recorder is not None:
+                        recorder.write(rows)
+                    decoded = await decode_fetch(
+                        decoder, rows, parse_executor, metrics, started
+                    )
+                    for ix, message in decoded:
+                        yield rows[ix][0], message
+                    started = perf_counter()
+            return
+
+        async with replication_slot(
+            slot_name=slot_name, con=con, drop_on_close=drop_on_close, plugin=plugin
+        ):
+
+            if transport == "stream":
+                replication = await ReplicationConnection.connect(
+                    **connection_params(con)
+                )
+                try:
+                    started = perf_counter()
+                    async for lsn, data in stream(
+                        replication, slot_name, acks=acks, options=decoder.options
+                    ):
+                        rows = [(lsn, None, data)]
+                        decoded = await decode_fetch(
+                            decoder, rows, None, metrics, started
+                        )
+                        if acks is None:
+                            for _, message in decoded:
+                                yield lsn, message
+                        else:
+                            for pair in deliver(rows, decoded, acks):
+                                yield pair
+                        if metrics is not None and metrics.lag_due():
+                            metrics.lag(await slot_lag(con, slot_name))
+                        started = perf_counter()
+                finally:
+                    await replication.close()
+
+            elif acks is None:
+                while True:
+                    if metrics is not None and metrics.lag_due():
+                        metrics.lag(await slot_lag(con, slot_name))
+                    n_rows = 0
+                    started = perf_counter()
+                    async for rows in drain(
+                        con, slot_name, batch_size, decoder, where, queries
+                    ):
+                        n_rows += len(rows)
+                        if recorder is not None:
+                            recorder.write(rows)
+                        decoded = await decode_fetch(
+                            decoder, rows, parse_executor, metrics, started
+                        )
+                        for ix, message in decoded:
+                            yield rows[ix][0], message
+                        started = perf_counter()
+
+                    await scheduler.wait(n_rows)
+
+            else:
+                try:
+                    while True:
+                        if metrics is not None and metrics.lag_due():
+                            metrics.lag(await slot_lag(con, slot_name))
+                        n_rows = 0
+                        started = perf_counter()
+                        async for rows in peek(
+                            con, slot_name, batch_size, acks, decoder, queries
+                        ):
+                            n_rows += len(rows)
+                            if recorder is not None:
+                                recorder.write(rows)
+                            decoded = await decode_fetch(
+                                decoder, rows, parse_executor, metrics, started
+                            )
+                            for pair in deliver(rows, decoded, acks):
+                                yield pair
+                            started = perf_counter()
+
+                        await scheduler.wait(n_rows)
+                finally:
+                    await confirm(con, slot_name, acks)
+    finally:
+        if recorder is not None:
+            recorder.close()
+
+
+async def decode_fetch(
+    decoder: Decoder,
+    rows: Sequence[Tuple[LSN, Any, Any]],
+    executor: Optional[Executor],
+    metrics: Optional[Metrics],
+    started: float,
+) -> Iterable[Tuple[int, Message]]:
+    """Decode a fetch of (lsn, xid, data) rows requested at *started*,
+    recording it in *metrics*
+    """
+    if metrics is None:
+        return await decode(decoder, [data for _, _, data in rows], executor)
+
+    parsing = perf_counter()
+    metrics.fetched(rows, parsing - started)
+    decoded = await decode(decoder, [data for _, _, data in rows], executor)
+    metrics.parsed(perf_counter() - parsing)
+    return metrics.track(len(rows), decoded)
+
+
+def deliver(
+    rows: Sequence[Tuple[LSN, Any, Any]],
+    decoded: Iterable[Tuple[int, Message]],
+    acks: AckTracker,
+) -> Iterator[Tuple[LSN, Message]]:
+    """Yield (lsn, message) for *decoded* rows, recording deliveries in *acks*"""
+    delivered = 0
+    for ix, message in decoded:
+        # Rows that decode to nothing are delivered along with the next message
+        while delivered < ix:
+            acks.delivered(rows[delivered][0], commit=False)
+            delivered += 1
+        if delivered == ix:
+            acks.delivered(rows[ix][0], commit=message.command == "COMMIT")
+            delivered += 1
+        yield rows[ix][0], message
+
+    for lsn, _, _ in rows[delivered:]:
+        acks.delivered(lsn, commit=False)
+
+
+def connection_params(con: AsyncConnection) -> Dict[str, Any]:
+    """Arguments for ReplicationConnection.connect matching *con*'s database"""
+    url = con.engine.url
+    host = url.query.get("host") or url.host or "localhost"
+    return dict(
+        host=host if isinstance(host, str) else host[0],
+        port=url.port or 5432,
+        user=url.username or "postgres",
+        password=url.password,
+        database=url.database or "postgres",
+    )
+
+
+async def drain(
+    con: AsyncConnection,
+    slot_name: str,
+    batch_size: Optional[int],
+    decoder: Optional[Decoder] = None,
+    where: Optional[ChangeFilter] = None,
+    native: Optional[NativeQueries] = None,
+    upto_lsn: Optional[LSN] = None,
+) -> AsyncGenerator[List[Row], None]:
+    """Consume the changes waiting in a replication slot in bounded batches
+
+    Yields lists of (lsn, xid, data) rows until the slot has been emptied.
+    Postgres only checks *batch_size* at the end of each transaction, so a
+    batch may overrun it by up to one transaction's worth of rows.
+
+    With *where* and test_decoding, rows of unwanted changes are filtered
+    out by the query. Transaction rows are kept, so a batch is only empty
+    once the slot is. With *native*, the query runs on asyncpg directly.
+    With *upto_lsn*, only transactions committed by then are consumed.
+    """
+
+    decoder = decoder or TestDecodingDecoder()
+    patterns = None
+    if where is not None and decoder.plugin == "test_decoding":
+        patterns = where.like_patterns()
 
     GET_UPDATES = text(
-        "SELECT lsn, xid, data from pg_logical_slot_get_changes(:slot_name, NULL, NULL)"
+        "SELECT lsn, xid, data "
+        "from pg_logical_slot_get{}_changes("
+        ":slot_name, {}, CAST(:upto AS integer), VARIADIC CAST(:options AS text[])"
+        "){}".format(
+            "_binary" if decoder.binary else "",
+            "NULL" if upto_lsn is None else "CAST(:upto_lsn AS pg_lsn)",
+            ""
+            if patterns is None
+            else " WHERE data NOT LIKE 'table %' "
+            "OR data LIKE ANY(CAST(:patterns AS text[]))",
+        )
+    )
+
+    params = dict(
+        slot_name=slot_name,
+        upto=batch_size,
+        options=flatten(decoder.options),
+        patterns=patterns,
     )
+    if upto_lsn is not None:
+        params["upto_lsn"] = parse_lsn(upto_lsn)
+
+    while True:
+        rows = await fetch(con, GET_UPDATES, params, native)
+
+        if rows:
+            yield rows
+
+        if batch_size is None or not rows:
+            return
+        # Without a filter, a short batch means the slot has been emptied
+        if patterns is None and len(rows) < batch_size:
+            return
+
+
+async def peek(
+    con: AsyncConnection,
+    slot_name: str,
+    batch_size: Optional[int],
+    acks: AckTracker,
+    decoder: Optional[Decoder] = None,
+    native: Optional[NativeQueries] = None,
+) -> AsyncGenerator[List[Row], None]:
+    """Read the changes waiting in a replication slot without consuming them
+
+    Like drain, but rows already delivered through *acks* are skipped and the
+    slot is advanced past acknowledged transactions before every read.
+    Unacknowledged rows are decoded again by each read, so ack promptly.
+    """
+
+    decoder = decoder or TestDecodingDecoder()
+
+    GET_UPDATES = text(
+        "SELECT lsn, xid, data "
+        "from pg_logical_slot_peek{}_changes("
+        ":slot_name, NULL, CAST(:upto AS integer), VARIADIC CAST(:options AS text[])"
+        ") OFFSET :offset".format("_binary" if decoder.binary else "")
+    )
+
+    while True:
+        await confirm(con, slot_name, acks)
+
+        offset = acks.rows_pending
+        params = dict(
+            slot_name=slot_name,
+            upto=None if batch_size is None else offset + batch_size,
+            options=flatten(decoder.options),
+            offset=offset,
+        )
+        rows = await fetch(con, GET_UPDATES, params, native)
 
-    async with replication_slot(
-        slot_name=slot_name, con=con, drop_on_close=drop_on_close
-    ):
+        if rows:
+            yield rows
 
-        while True:
-            cursor = await con.execute(GET_UPDATES, {"slot_name": slot_name})
+        if batch_size is None or len(rows) < batch_size:
+            return
 
-            for _, _, data in cursor:
-                yield parse(data)
 
-            # Sleep for 0.25 seconds before polling again
-            await asyncio.sleep(poll_delay)
+async def fetch(
+    con: AsyncConnection,
+    statement: TextClause,
+    params: Dict[str, Any],
+    native: Optional[NativeQueries],
+) -> List[Row]:
+    if native is not None:
+        return await native.fetch(statement, params)
+    cursor = await con.execute(statement, params)
+    return cursor.all()
+
+
+async def confirm(con: AsyncConnection, slot_name: str, acks: AckTracker) -> None:
+    """Advance a replication slot past the transactions acknowledged in *acks*"""
+
+    ADVANCE_SLOT = text(
+        "SELECT pg_replication_slot_advance(:slot_name, CAST(:lsn AS pg_lsn))"
+    )
+
+    lsn = acks.confirmable()
+    if lsn is not None:
+        # asyncpg binds pg_lsn parameters as integers
+        await con.execute(ADVANCE_SLOT, dict(slot_name=slot_name, lsn=lsn))
+
+
+def flatten(options: Dict[str, str]) -> List[str]:
+    """Plugin options as the key, value, ... array pg_logical_slot_*_changes takes"""
+    return [item for pair in options.items() for item in pair]
 
 
 @asynccontextmanager
 async def replication_slot(
-    slot_name: str, con: AsyncConnection, drop_on_close: bool
+    slot_name: str,
+    con: AsyncConnection,
+    drop_on_close: bool,
+    plugin: str = "test_decoding",
 ) -> AsyncGenerator[None, None]:
 
     CREATE_SLOT = text(
@@ -59,7 +529,7 @@ async def replication_slot(
                 FROM
                     pg_create_logical_replication_slot(
                         :slot_name,
-                        'test_decoding'
+                        :plugin
                     )
             )
         END as res
@@ -72,9 +542,61 @@ async def replication_slot(
 
     params = dict(slot_name=slot_name)
 
-    await con.execute(CREATE_SLOT, params)
+    await con.execute(CREATE_SLOT, dict(params, plugin=plugin))
     try:
         yield
     finally:
         if drop_on_close:
             await con.execute(DROP_SLOT, params)
+
+
+@asynccontextmanager
+async def window_slot(
+    con: AsyncConnection,
+    slot_name: str,
+    plugin: str,
+    start_lsn: Optional[LSN],
+    end_lsn: Optional[LSN],
+) -> AsyncGenerator[Tuple[str, LSN], None]:
+    """A temporary copy of a replication slot, positioned to read the
+    transactions committed after *start_lsn*
+
+    Yields the copy's name and the LSN to read it up to: *end_lsn*, or the
+    current end of WAL.
+    """
+
+    COPY_SLOT = text(
+        "SELECT pg_copy_logical_replication_slot("
+        ":slot_name, :copy_name, true, :plugin)"
+    )
+    POSITION = text(
+        "SELECT CAST(confirmed_flush_lsn AS text), CAST(pg_current_wal_lsn() AS text) "
+        "FROM pg_replication_slots WHERE slot_name = :slot_name"
+    )
+    ADVANCE_SLOT = text(
+        "SELECT pg_replication_slot_advance(:slot_name, CAST(:lsn AS pg_lsn))"
+    )
+    DROP_SLOT = text("SELECT pg_drop_replication_slot(:slot_name);")
+
+    # Slot names are limited to 63 characters
+    copy_name = "{}_window_{}".format(slot_name[:40], uuid4().hex[:12])
+    params = dict(slot_name=copy_name)
+    await con.execute(
+        COPY_SLOT, dict(slot_name=slot_name, copy_name=copy_name, plugin=plugin)
+    )
+    try:
+        confirmed, current = (await con.execute(POSITION, params)).all()[0]
+        if start_lsn is not None:
+            start = parse_lsn(start_lsn)
+            if start < parse_lsn(confirmed):
+                raise ValueError(
+                    "Slot {} has consumed the transactions up to {}, "
+                    "so can not be read after {}".format(
+                        slot_name, confirmed, format_lsn(start)
+                    )
+                )
+            # Skips the transactions whose commit record starts before start
+            await con.execute(ADVANCE_SLOT, dict(params, lsn=start))
+        yield copy_name, current if end_lsn is None else end_lsn
+    finally:
+        await con.execute(DROP_SLOT, params)
@@ -0,0 +1,78 @@
+import pickle
+import tempfile
+from typing import IO, Iterator, List, Optional
+
+from realtime.message import CRUDMessage, approximate_size
+
+__all__ = ["Transaction"]
+
+
+class Transaction:
+    """The changes of one committed transaction
+
+    Changes are held in memory up to roughly *memory_budget* bytes, then
+    appended to a temporary file in *spill_dir* and read back one at a time
+    when the transaction is iterated. *commit_lsn* is set once the
+    transaction's COMMIT has been read.
+    """
+
+    def __init__(
+        self,
+        xid: Optional[int],
+        memory_budget: int = 64 * 1024 * 1024,
+        spill_dir: Optional[str] = None,
+    ) -> None:
+        self.xid = xid
+        self.commit_lsn: Optional[int] = None
+        self.memory_budget = memory_budget
+        self.spill_dir = spill_dir
+        self.memory_used = 0
+        self.changes: List[CRUDMessage] = []
+        self.spilled = 0
+        self.spill_file: Optional[IO[bytes]] = None
+
+    def append(self, message: CRUDMessage) -> None:
+        if self.spill_file is None:
+            size = approximate_size(message)
+            if self.memory_used + size <= self.memory_budget:
+                self.memory_used += size
+                self.changes.append(message)
+                return
+            self.spill_file = tempfile.TemporaryFile(dir=self.spill_dir)
+
+        self.spill_file.seek(0, 2)
+        pickle.dump(message, self.spill_file, pickle.HIGHEST_PROTOCOL)
+        self.spilled += 1
+
+    def __len__(self) -> int:
+        return len(self.changes) + self.spilled
+
+    def __iter__(self) -> Iterator[CRUDMessage]:
+        yield from self.changes
+
+        spill_file = self.spill_file
+        if spill_file is None:
+            return
+        if spill_file.closed:
+            raise ValueError("Transaction has been closed")
+
+        # Iterating again starts over from the top of the file
+        spill_file.seek(0)
+        for _ in range(self.spilled):
+            yield pickle.load(spill_file)
+
+    def close(self) -> None:
+        """Remove the spill file"""
+        if self.spill_file is not None:
+            self.spill_file.close()
+
+    def __enter__(self) -> "Transaction":
+        return self
+
+    def __exit__(self, *_: object) -> None:
+        self.close()
+
+    def __repr__(self) -> str:
+        return "Transaction(xid={!r}, commit_lsn={!r}, changes={})".format(
+            self.xid, self.commit_lsn, len(self)
+        )
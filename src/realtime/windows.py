@@ -0,0 +1,68 @@
+import asyncio
+import time
+from typing import Any, AsyncGenerator, AsyncIterable, Optional
+
+from realtime.message import CRUDMessage, Message
+
+__all__ = ["windowed"]
+
+
+async def windowed(
+    messages: AsyncIterable[Message], max_changes: int, max_delay: float
+) -> AsyncGenerator[Optional[Message], None]:
+    """The messages of *messages*, e.g. a subscription, with None after the
+    last message of each window
+
+    A window closes at a transaction boundary once it holds *max_changes*
+    changes or has been open for *max_delay* seconds, including while
+    *messages* is idle, and when *messages* ends.
+    """
+    iterator = messages.__aiter__()
+    opened: Optional[float] = None
+    n_changes = 0
+    in_transaction = False
+    reading: Optional["asyncio.Future[Any]"] = None
+
+    try:
+        while True:
+            if reading is None:
+                reading = asyncio.ensure_future(iterator.__anext__())
+            timeout = None
+            if opened is not None and not in_transaction:
+                timeout = max(0.0, max_delay - (time.monotonic() - opened))
+            done, _ = await asyncio.wait([reading], timeout=timeout)
+            if not done:
+                opened, n_changes = None, 0
+                yield None
+                continue
+
+            try:
+                message = reading.result()
+            except StopAsyncIteration:
+                break
+            finally:
+                reading = None
+
+            if opened is None:
+                opened = time.monotonic()
+            if isinstance(message, CRUDMessage):
+                n_changes += 1
+            else:
+                in_transaction = message.command == "BEGIN"
+            yield message
+
+            if not in_transaction and (
+                n_changes >= max_changes or time.monotonic() - opened >= max_delay
+            ):
+                opened, n_changes = None, 0
+                yield None
+
+        if opened is not None:
+            yield None
+    finally:
+        if reading is not None:
+            reading.cancel()
+            await asyncio.gather(reading, return_exceptions=True)
+        aclose = getattr(iterator, "aclose", None)
+        if aclose is not None:
+            await aclose()
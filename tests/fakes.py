@@ -0,0 +1,360 @@
+import asyncio
+import base64
+import hashlib
+import hmac
+import re
+import struct
+from typing import Any, AsyncIterator, Dict, List, Optional, Sequence, Tuple, Union
+
+from realtime.lsn import parse_lsn
+from realtime.message import Message, parse
+
+TextRow = Tuple[str, int, str]
+# Binary slots, e.g. pgoutput, return bytes data
+FakeRow = Tuple[str, int, Union[str, bytes]]
+
+# Parameters asyncpg binds as pg_lsn, which it encodes from integers
+LSN_PARAMS = re.compile(r"CAST\(:(\w+) AS pg_lsn\)")
+
+
+def is_commit(data: Union[str, bytes]) -> bool:
+    if isinstance(data, bytes):
+        # pgoutput's Commit message
+        return data[:1] == b"C"
+    return data.startswith("COMMIT")
+
+
+class FakeResult:
+    def __init__(self, rows: List[Any]) -> None:
+        self.rows = rows
+
+    def all(self) -> List[Any]:
+        return self.rows
+
+    def mappings(self) -> List[Any]:
+        return self.rows
+
+    def __iter__(self) -> Any:
+        return iter(self.rows)
+
+
+def like(pattern: str, value: str) -> bool:
+    """Postgres LIKE with the default backslash escape"""
+    regex = ""
+    for token in re.findall(r"\\.|[%_]|[^\\%_]+", pattern):
+        if token == "%":
+            regex += ".*"
+        elif token == "_":
+            regex += "."
+        else:
+            regex += re.escape(token[-1] if token.startswith("\\") else token)
+    return re.fullmatch(regex, value, re.DOTALL) is not None
+
+
+class FakeConnection:
+    """Stands in for an AsyncConnection reading a test_decoding slot
+
+    Rows appended to *changes* are returned by pg_logical_slot_get_changes
+    and pg_logical_slot_peek_changes with the same batching rules as Postgres.
+    A *patterns* parameter filters rows as drain's WHERE clause does, and
+    the slot's lag is reported as *lag* bytes. Copies of the slot are kept
+    in *copies* by name, and start from *confirmed_flush*. As with asyncpg,
+    parameters cast to pg_lsn must be integers.
+
+    Statements other than these succeed without rows, so the benchmarks
+    also run subscribe against it to measure the library alone.
+    """
+
+    def __init__(self, changes: Optional[Sequence[FakeRow]] = None) -> None:
+        self.changes: List[FakeRow] = list(changes or [])
+        self.statements: List[Tuple[str, Dict[str, Any]]] = []
+        self.lag: Optional[int] = None
+        self.closed = False
+        self.copies: Dict[str, List[FakeRow]] = {}
+        self.confirmed_flush = "0/0"
+
+    def slot(self, params: Dict[str, Any]) -> List[FakeRow]:
+        return self.copies.get(params.get("slot_name", ""), self.changes)
+
+    @staticmethod
+    def take(
+        changes: List[FakeRow], upto: Optional[int], upto_lsn: Optional[str] = None
+    ) -> List[FakeRow]:
+        if upto_lsn is not None:
+            # Only transactions that committed by upto_lsn
+            end = 0
+            for ix, (lsn, _, data) in enumerate(changes, start=1):
+                if is_commit(data) and parse_lsn(lsn) <= parse_lsn(upto_lsn):
+                    end = ix
+            changes = changes[:end]
+        # upto is only checked at transaction boundaries
+        count = 0
+        for count, (_, _, data) in enumerate(changes, start=1):
+            if upto is not None and count >= upto and is_commit(data):
+                break
+        else:
+            count = len(changes)
+        return changes[:count]
+
+    async def execute(
+        self, statement: Any, params: Optional[Dict[str, Any]] = None
+    ) -> FakeResult:
+        sql = str(statement)
+        params = params or {}
+        self.statements.append((sql, params))
+        for name in LSN_PARAMS.findall(sql):
+            if not isinstance(params[name], (int, type(None))):
+                raise TypeError("pg_lsn parameter {} is not an int".format(name))
+
+        if "pg_logical_slot_get_" in sql:
+            slot = self.slot(params)
+            rows = self.take(slot, params.get("upto"), params.get("upto_lsn"))
+            del slot[: len(rows)]
+            if params.get("patterns"):
+                rows = [
+                    (lsn, xid, data)
+                    for lsn, xid, data in rows
+                    if not isinstance(data, str)
+                    or not data.startswith("table ")
+                    or any(like(pattern, data) for pattern in params["patterns"])
+                ]
+            return FakeResult(rows)
+
+        if "pg_logical_slot_peek_" in sql:
+            rows = self.take(self.slot(params), params.get("upto"))
+            return FakeResult(rows[params.get("offset", 0) :])
+
+        if "pg_replication_slot_advance" in sql:
+            slot = self.slot(params)
+            upto = parse_lsn(params["lsn"])
+            while slot and parse_lsn(slot[0][0]) <= upto:
+                slot.pop(0)
+            return FakeResult([])
+
+        if "pg_wal_lsn_diff" in sql:
+            return FakeResult([] if self.lag is None else [(self.lag,)])
+
+        if "pg_copy_logical_replication_slot" in sql:
+            self.copies[params["copy_name"]] = list(self.changes)
+            return FakeResult([])
+
+        if "confirmed_flush_lsn" in sql:
+            current = self.changes[-1][0] if self.changes else self.confirmed_flush
+            return FakeResult([(self.confirmed_flush, current)])
+
+        if "pg_drop_replication_slot" in sql:
+            self.copies.pop(params["slot_name"], None)
+            return FakeResult([])
+
+        return FakeResult([])
+
+    async def commit(self) -> None:
+        self.statements.append(("COMMIT", {}))
+
+    async def close(self) -> None:
+        self.closed = True
+
+
+def transactions(n: int, rows_per_transaction: int = 1) -> List[TextRow]:
+    """test_decoding rows for *n* transactions inserting into public.account"""
+    out: List[TextRow] = []
+    lsn = 0
+    for xid in range(1, n + 1):
+        lsn += 1
+        out.append(("0/{:X}".format(lsn), xid, "BEGIN {}".format(xid)))
+        for _ in range(rows_per_transaction):
+            lsn += 1
+            out.append(
+                (
+                    "0/{:X}".format(lsn),
+                    xid,
+                    "table public.account: INSERT: id[integer]:{}".format(lsn),
+                )
+            )
+        lsn += 1
+        out.append(("0/{:X}".format(lsn), xid, "COMMIT {}".format(xid)))
+    return out
+
+
+def transaction(xid: int, *changes: Union[str, Message]) -> List[Union[str, Message]]:
+    """Transaction *xid* making *changes*, as test_decoding lines or messages"""
+    return ["BEGIN {}".format(xid), *changes, "COMMIT {}".format(xid)]
+
+
+async def stream(
+    *messages: Union[str, Message], idle: float = 0
+) -> AsyncIterator[Message]:
+    """*messages*, parsing test_decoding lines, as a subscription delivers
+    them, then idle for *idle* seconds
+    """
+    for message in messages:
+        yield parse(message) if isinstance(message, str) else message
+    await asyncio.sleep(idle)
+
+
+PASSWORD = "pytest_password"
+
+
+def data_row(fields: Tuple[Optional[str], ...]) -> bytes:
+    payload = struct.pack("!h", len(fields))
+    for field in fields:
+        if field is None:
+            payload += struct.pack("!i", -1)
+        else:
+            payload += struct.pack("!i", len(field)) + field.encode()
+    return payload
+
+
+class FakeReplicationServer:
+    """Speaks the server side of the streaming replication protocol
+
+    Answers CREATE_REPLICATION_SLOT with *slot*'s fields, then on
+    START_REPLICATION sends *frames* as XLogData followed by a keepalive
+    requesting a reply, and records the standby status updates it receives.
+    """
+
+    def __init__(
+        self,
+        frames: List[Tuple[int, bytes]],
+        auth: str = "trust",
+        slot: Tuple[Optional[str], ...] = (
+            "test_slot",
+            "0/1000",
+            "00000003-00000002-1",
+            "test_decoding",
+        ),
+    ) -> None:
+        self.frames = frames
+        self.slot = slot
+        self.auth = auth
+        self.startup: Dict[str, str] = {}
+        self.queries: List[str] = []
+        self.statuses: List[Tuple[int, int, bool]] = []
+        self.port = 0
+
+    async def __aenter__(self) -> "FakeReplicationServer":
+        self.finished = asyncio.Event()
+        self.server = await asyncio.start_server(self.handle, "127.0.0.1", 0)
+        self.port = self.server.sockets[0].getsockname()[1]
+        return self
+
+    async def __aexit__(self, *_: Any) -> None:
+        # Let the connection finish processing what the client sent
+        await asyncio.wait_for(self.finished.wait(), timeout=1)
+        self.server.close()
+        await self.server.wait_closed()
+
+    @staticmethod
+    def send(writer: asyncio.StreamWriter, kind: bytes, payload: bytes) -> None:
+        writer.write(kind + struct.pack("!i", len(payload) + 4) + payload)
+
+    @staticmethod
+    async def receive(reader: asyncio.StreamReader) -> Tuple[bytes, bytes]:
+        header = await reader.readexactly(5)
+        (length,) = struct.unpack_from("!i", header, 1)
+        return header[:1], await reader.readexactly(length - 4)
+
+    async def authenticate(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> bool:
+        if self.auth == "md5":
+            salt = b"salt"
+            self.send(writer, b"R", struct.pack("!i", 5) + salt)
+            _, payload = await self.receive(reader)
+            inner = hashlib.md5((PASSWORD + self.startup["user"]).encode()).hexdigest()
+            outer = hashlib.md5(inner.encode() + salt).hexdigest()
+            return payload == b"md5" + outer.encode() + b"\x00"
+
+        if self.auth == "scram":
+            self.send(writer, b"R", struct.pack("!i", 10) + b"SCRAM-SHA-256\x00\x00")
+            _, payload = await self.receive(reader)
+            client_first = payload[payload.index(b"\x00") + 5 :].decode()
+            client_first_bare = client_first[3:]
+            nonce = client_first_bare.split("r=", 1)[1] + "server"
+            salt = b"0123456789abcdef"
+            server_first = "r={},s={},i=4096".format(
+                nonce, base64.b64encode(salt).decode()
+            )
+            self.send(writer, b"R", struct.pack("!i", 11) + server_first.encode())
+
+            _, payload = await self.receive(reader)
+            without_proof, _, proof = payload.decode().rpartition(",p=")
+            salted = hashlib.pbkdf2_hmac("sha256", PASSWORD.encode(), salt, 4096)
+            client_key = hmac.digest(salted, b"Client Key", "sha256")
+            stored_key = hashlib.sha256(client_key).digest()
+            auth_message = ",".join(
+                [client_first_bare, server_first, without_proof]
+            ).encode()
+            signature = hmac.digest(stored_key, auth_message, "sha256")
+            recovered = bytes(x ^ y for x, y in zip(base64.b64decode(proof), signature))
+            if hashlib.sha256(recovered).digest() != stored_key:
+                return False
+            server_key = hmac.digest(salted, b"Server Key", "sha256")
+            server_signature = hmac.digest(server_key, auth_message, "sha256")
+            self.send(
+                writer,
+                b"R",
+                struct.pack("!i", 12)
+                + "v={}".format(base64.b64encode(server_signature).decode()).encode(),
+            )
+        return True
+
+    async def handle(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        try:
+            await self.serve(reader, writer)
+        finally:
+            writer.close()
+            self.finished.set()
+
+    async def serve(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        (length,) = struct.unpack("!i", await reader.readexactly(4))
+        body = await reader.readexactly(length - 4)
+        items = body[4:].split(b"\x00")
+        self.startup = {
+            items[ix].decode(): items[ix + 1].decode()
+            for ix in range(0, len(items) - 2, 2)
+        }
+
+        if not await self.authenticate(reader, writer):
+            self.send(
+                writer, b"E", b"SFATAL\x00Mpassword authentication failed\x00\x00"
+            )
+            return
+
+        self.send(writer, b"R", struct.pack("!i", 0))
+        self.send(writer, b"S", b"server_version\x0014.0\x00")
+        self.send(writer, b"K", struct.pack("!ii", 1, 2))
+        self.send(writer, b"Z", b"I")
+
+        while True:
+            kind, query = await self.receive(reader)
+            if kind == b"X":
+                return
+            self.queries.append(query.rstrip(b"\x00").decode())
+            if not self.queries[-1].startswith("CREATE_REPLICATION_SLOT"):
+                break
+            self.send(writer, b"T", b"")
+            self.send(writer, b"D", data_row(self.slot))
+            self.send(writer, b"C", b"CREATE_REPLICATION_SLOT\x00")
+            self.send(writer, b"Z", b"I")
+
+        self.send(writer, b"W", struct.pack("!bh", 0, 0))
+
+        for lsn, data in self.frames:
+            self.send(writer, b"d", b"w" + struct.pack("!QQQ", lsn, lsn, 0) + data)
+        self.send(writer, b"d", b"k" + struct.pack("!QQ?", 20, 0, True))
+
+        try:
+            while True:
+                kind, payload = await self.receive(reader)
+                if kind == b"X":
+                    break
+                if kind == b"d" and payload[:1] == b"r":
+                    write, flush, _, _, reply = struct.unpack_from("!QQQQ?", payload, 1)
+                    self.statuses.append((write, flush, reply))
+        except asyncio.IncompleteReadError:
+            pass
@@ -0,0 +1,147 @@
+import os
+from typing import List, Optional
+
+import pytest
+from fakes import FakeConnection, transactions
+from test_pgoutput import BEGIN, COMMIT, INSERT, RELATION
+
+from realtime import capture
+from realtime.capture import Capture, Recorder, replay
+from realtime.exceptions import CaptureException
+from realtime.lsn import LSN
+from realtime.message import Message, parse
+from realtime.subscribe import subscribe
+
+
+async def replayed(path: str, from_lsn: Optional[LSN] = None) -> List[Message]:
+    return [message async for message in replay(path, from_lsn=from_lsn)]
+
+
+@pytest.mark.asyncio
+async def test_record_and_replay(tmp_path: str) -> None:
+    rows = transactions(10, rows_per_transaction=2)
+    path = os.path.join(tmp_path, "capture")
+    with Recorder(path) as recorder:
+        recorder.write(rows[:12])
+        recorder.write(rows[12:])
+
+    assert await replayed(path) == [parse(data) for _, _, data in rows]
+    with Capture(path) as reader:
+        assert [record[0] for record in reader.rows()] == list(range(1, 41))
+        assert [record[1] for record in reader.rows()][:5] == [1, 1, 1, 1, 2]
+
+
+@pytest.mark.asyncio
+async def test_replay_from_lsn(tmp_path: str, monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(capture, "INDEX_INTERVAL", 100)
+    rows = transactions(50, rows_per_transaction=2)
+    path = os.path.join(tmp_path, "capture")
+    with Recorder(path, segment_size=1000) as recorder:
+        recorder.write(rows)
+
+    assert len([name for name in os.listdir(path) if name.endswith(".seg")]) > 1
+
+    with Capture(path) as reader:
+        # The index skips to near the transaction, in a later segment
+        assert reader.seek(150) > (1, 0)
+        assert reader.seek(1) == (0, 0)
+
+    # Transaction 38 is lsns 149-152, committing at 152
+    messages = await replayed(path, from_lsn="0/96")
+    assert messages[0] == parse("BEGIN 38")
+    assert messages == [parse(data) for _, _, data in rows[37 * 4 :]]
+    assert await replayed(path, from_lsn=201) == []
+
+
+@pytest.mark.asyncio
+async def test_replay_interleaved(tmp_path: str) -> None:
+    path = os.path.join(tmp_path, "capture")
+    with Recorder(path) as recorder:
+        # Transaction 2 began before transaction 1 but committed after it
+        recorder.write(
+            [
+                (10, 1, "BEGIN 1"),
+                (12, 1, "table public.a: INSERT: id[integer]:1"),
+                (13, 1, "COMMIT 1"),
+                (11, 2, "BEGIN 2"),
+                (11, 2, "table public.a: INSERT: id[integer]:2"),
+                (20, 2, "COMMIT 2"),
+            ]
+        )
+
+    messages = await replayed(path, from_lsn=14)
+    assert [m.command for m in messages] == ["BEGIN", "INSERT", "COMMIT"]
+    assert messages[0] == parse("BEGIN 2")
+
+
+@pytest.mark.asyncio
+async def test_recorder_appends(tmp_path: str) -> None:
+    rows = transactions(4)
+    path = os.path.join(tmp_path, "capture")
+    with Recorder(path) as recorder:
+        recorder.write(rows[:6])
+    with Recorder(path) as recorder:
+        assert recorder.max_lsn == 6
+        recorder.write(rows[6:])
+
+    assert sorted(os.listdir(path)) == [
+        "00000000.idx",
+        "00000000.seg",
+        "00000001.idx",
+        "00000001.seg",
+        "capture.json",
+    ]
+    assert len(await replayed(path, from_lsn=7)) == 6
+
+    with pytest.raises(CaptureException):
+        Recorder(path, plugin="wal2json")
+
+
+@pytest.mark.asyncio
+async def test_replay_truncated(tmp_path: str) -> None:
+    path = os.path.join(tmp_path, "capture")
+    with Recorder(path) as recorder:
+        recorder.write(transactions(2))
+    segment = os.path.join(path, "00000000.seg")
+    os.truncate(segment, os.path.getsize(segment) - 3)
+
+    assert [m.command for m in await replayed(path)] == [
+        "BEGIN",
+        "INSERT",
+        "COMMIT",
+        "BEGIN",
+        "INSERT",
+    ]
+
+
+@pytest.mark.asyncio
+async def test_replay_pgoutput(tmp_path: str) -> None:
+    path = os.path.join(tmp_path, "capture")
+    with Recorder(path, plugin="pgoutput") as recorder:
+        recorder.write([(1, 501, RELATION), (2, 501, BEGIN), (3, 501, INSERT)])
+        recorder.write([(4, 501, COMMIT), (5, 502, BEGIN), (6, 502, INSERT)])
+        recorder.write([(7, 502, COMMIT)])
+
+    messages = await replayed(path, from_lsn=5)
+    assert [m.command for m in messages] == ["BEGIN", "INSERT", "COMMIT"]
+    assert messages[1].table == "account"  # type: ignore
+
+
+@pytest.mark.asyncio
+@pytest.mark.timeout(5)
+async def test_subscribe_record(tmp_path: str) -> None:
+    path = os.path.join(tmp_path, "capture")
+    con = FakeConnection(transactions(5))
+    delivered = []
+    async for message in subscribe(con, "slot", record=path):  # type: ignore
+        delivered.append(message)
+        if len(delivered) == 15:
+            break
+
+    assert await replayed(path) == delivered
+
+    with pytest.raises(ValueError):
+        async for message in subscribe(
+            con, "slot", transport="stream", record=path  # type: ignore
+        ):
+            pass
@@ -0,0 +1,128 @@
+import asyncio
+from array import array
+from datetime import datetime, timezone
+from decimal import Decimal
+from typing import List
+
+import pytest
+from fakes import stream, transaction
+
+from realtime.columnar import ColumnarBatch, columnar, subscribe_columnar
+from realtime.convert import UNCHANGED_TOAST
+from realtime.message import parse, parse_many
+
+LINES = [
+    "BEGIN 1",
+    "table public.account: INSERT: id[integer]:1 score[double precision]:1.5 "
+    "active[boolean]:true name[text]:'it''s' balance[numeric]:1.10 "
+    "created[timestamp with time zone]:'2023-01-02 03:04:05+00'",
+    "table public.other: INSERT: id[bigint]:7",
+    "table public.account: INSERT: id[integer]:2 score[double precision]:null "
+    "active[boolean]:false name[text]:null balance[numeric]:null",
+    "table public.account: UPDATE: id[integer]:2 name[text]:unchanged-toast-datum",
+    "COMMIT 1",
+]
+
+
+def by_table(batches: List[ColumnarBatch]) -> List[str]:
+    return ["{}.{} {} {}".format(b.schema, b.table, b.command, len(b)) for b in batches]
+
+
+@pytest.mark.parametrize("compact", [False, True])
+def test_columnar(compact: bool) -> None:
+    batches = columnar(parse_many(LINES, compact=compact))  # type: ignore
+    assert by_table(batches) == [
+        "public.account INSERT 2",
+        "public.other INSERT 1",
+        "public.account UPDATE 1",
+    ]
+
+    inserts = batches[0]
+    assert inserts.columns["id"] == array("i", [1, 2])
+    assert inserts.columns["score"] == array("d", [1.5, 0])
+    assert inserts.columns["active"] == array("B", [1, 0])
+    assert inserts.columns["name"] == ["it's", None]
+    assert inserts.columns["balance"] == [Decimal("1.10"), None]
+    # The second insert has no created column
+    assert inserts.columns["created"] == [
+        datetime(2023, 1, 2, 3, 4, 5, tzinfo=timezone.utc),
+        None,
+    ]
+    assert {name: list(mask) for name, mask in inserts.nulls.items()} == {
+        "id": [0, 0],
+        "score": [0, 1],
+        "active": [0, 0],
+        "name": [0, 1],
+        "balance": [0, 1],
+        "created": [0, 1],
+    }
+    assert inserts.unchanged == {}
+
+    assert batches[1].columns["id"] == array("q", [7])
+    assert batches[2].columns["name"] == [UNCHANGED_TOAST]
+    assert batches[2].unchanged == {"name": bytearray([1])}
+
+
+def test_columnar_read_messages() -> None:
+    messages = [parse(line) for line in LINES]
+    # Columns already read are used as they are
+    messages[1].columns  # type: ignore
+    assert by_table(columnar(messages)) == by_table(columnar(parse_many(LINES)))
+    assert columnar(messages)[0].columns["name"] == ["it's", None]
+
+
+def test_to_numpy() -> None:
+    numpy = pytest.importorskip("numpy")
+    columns = columnar(parse_many(LINES))[0].to_numpy()
+    assert columns["id"].dtype == numpy.intc
+    assert columns["active"].dtype == numpy.bool_
+    assert columns["score"].mask.tolist() == [False, True]
+    assert columns["score"].sum() == 1.5
+
+
+def test_to_arrow() -> None:
+    pytest.importorskip("pyarrow")
+    batch = columnar(parse_many(LINES))[0].to_arrow()
+    assert batch.num_rows == 2
+    assert batch.column("score").null_count == 1
+    assert batch.column("name").to_pylist() == ["it's", None]
+
+
+def inserts(xid: int) -> List[str]:
+    return [
+        "table public.other: INSERT: id[bigint]:{}".format(xid),
+        "table public.other: INSERT: id[bigint]:{}".format(-xid),
+    ]
+
+
+@pytest.mark.asyncio
+@pytest.mark.timeout(5)
+async def test_subscribe_columnar() -> None:
+    lines = [line for xid in range(1, 6) for line in transaction(xid, *inserts(xid))]
+    out = [
+        batches
+        async for batches in subscribe_columnar(
+            stream(*lines), max_rows=3, max_delay=60
+        )
+    ]
+    # Cut at the first commit after 3 rows
+    assert [[len(batch) for batch in batches] for batches in out] == [[4], [4], [2]]
+    assert list(out[2][0].columns["id"]) == [5, -5]
+
+
+@pytest.mark.asyncio
+@pytest.mark.timeout(5)
+async def test_subscribe_columnar_by_age() -> None:
+    out: List[List[ColumnarBatch]] = []
+
+    async def consume() -> None:
+        async for batches in subscribe_columnar(
+            stream(*transaction(1, *inserts(1)), idle=10), max_delay=0.05
+        ):
+            out.append(batches)
+
+    task = asyncio.ensure_future(consume())
+    await asyncio.sleep(0.2)
+    assert [[len(batch) for batch in batches] for batches in out] == [[2]]
+    task.cancel()
+    await asyncio.gather(task, return_exceptions=True)
@@ -0,0 +1,191 @@
+import asyncio
+from typing import List, Tuple
+
+import pytest
+from fakes import stream, transaction
+
+from realtime.compaction import Compactor, compact
+from realtime.keys import PrimaryKeys
+from realtime.message import Column, CRUDMessage, Message, parse
+from realtime.metrics import Metrics
+
+KEYS = PrimaryKeys({("public", "counter"): ["id"]})
+
+
+def change(command: str, id: int, n: str = "") -> CRUDMessage:
+    line = "table public.counter: {}: id[integer]:{}".format(command, id)
+    if n:
+        line += " n[integer]:{} note[text]:'x'".format(n)
+    return parse(line)  # type: ignore
+
+
+def net(*changes: CRUDMessage) -> List[str]:
+    compactor = Compactor(KEYS)
+    for message in changes:
+        compactor.add(message)
+    return [
+        " ".join(
+            [m.command, m.table]
+            + ["{}={}".format(c.column, c.value) for c in m.columns]
+        )
+        for m in compactor.flush()
+    ]
+
+
+def test_merge_rules() -> None:
+    assert net(change("INSERT", 1, "1"), change("UPDATE", 1, "2")) == [
+        "INSERT counter id=1 n=2 note=x"
+    ]
+    assert net(change("INSERT", 1, "1"), change("DELETE", 1)) == []
+    assert net(
+        change("UPDATE", 1, "1"), change("UPDATE", 1, "2"), change("UPDATE", 1, "3")
+    ) == ["UPDATE counter id=1 n=3 note=x"]
+    assert net(change("UPDATE", 1, "1"), change("DELETE", 1)) == ["DELETE counter id=1"]
+    assert net(change("DELETE", 1), change("INSERT", 1, "5")) == [
+        "UPDATE counter id=1 n=5 note=x"
+    ]
+    # Other rows are kept apart, in the order last changed
+    assert net(
+        change("UPDATE", 1, "1"), change("UPDATE", 2, "1"), change("UPDATE", 1, "2")
+    ) == ["UPDATE counter id=2 n=1 note=x", "UPDATE counter id=1 n=2 note=x"]
+
+
+def test_merge_keeps_order_across_keys() -> None:
+    log = parse("table public.log: INSERT: msg[text]:'a'")
+    assert isinstance(log, CRUDMessage)
+    assert net(
+        change("INSERT", 1, "1"),
+        change("INSERT", 2, "1"),
+        log,
+        change("UPDATE", 1, "2"),
+        change("DELETE", 3),
+        change("UPDATE", 2, "2"),
+        change("INSERT", 3, "1"),
+        change("DELETE", 1),
+    ) == [
+        "INSERT log msg=a",
+        "INSERT counter id=2 n=2 note=x",
+        "UPDATE counter id=3 n=1 note=x",
+    ]
+    assert net(
+        change("UPDATE", 1, "1"),
+        change("UPDATE", 2, "1"),
+        change("UPDATE", 3, "1"),
+        change("UPDATE", 1, "2"),
+        change("UPDATE", 3, "2"),
+    ) == [
+        "UPDATE counter id=2 n=1 note=x",
+        "UPDATE counter id=1 n=2 note=x",
+        "UPDATE counter id=3 n=2 note=x",
+    ]
+
+
+def test_merge_key_changes() -> None:
+    moved = parse(
+        "table public.counter: UPDATE: old-key: id[integer]:1 new-tuple: "
+        "id[integer]:2 n[integer]:1 note[text]:'x'"
+    )
+    assert isinstance(moved, CRUDMessage)
+
+    compactor = Compactor(KEYS)
+    compactor.add(moved)
+    compactor.add(change("UPDATE", 2, "5"))
+    (update,) = compactor.flush()
+    # Still applied to the row under its old key
+    assert update.old_key == [Column("id", "integer", "1")]
+    assert [c.value for c in update.columns] == ["2", "5", "x"]
+
+    # Deleted under the key it had before the window
+    assert net(moved, change("DELETE", 2)) == ["DELETE counter id=1"]
+    compactor.add(moved)
+    compactor.add(change("DELETE", 2))
+    compactor.add(change("INSERT", 2, "7"))
+    (update,) = compactor.flush()
+    # Replaced under its new key, so still moved from its old one
+    assert update.command == "UPDATE"
+    assert update.old_key == [Column("id", "integer", "1")]
+    assert [c.value for c in update.columns] == ["2", "7", "x"]
+    assert net(change("INSERT", 1, "1"), moved) == [
+        "INSERT counter id=1 n=1 note=x",
+        "UPDATE counter id=2 n=1 note=x",
+    ]
+
+
+def test_merge_unchanged_toast() -> None:
+    toast = parse(
+        "table public.counter: UPDATE: id[integer]:1 n[integer]:3 "
+        "note[text]:unchanged-toast-datum"
+    )
+    assert isinstance(toast, CRUDMessage)
+    assert net(change("INSERT", 1, "1"), toast) == ["INSERT counter id=1 n=3 note=x"]
+
+
+def test_truncate_and_unkeyed() -> None:
+    other = parse("table public.log: INSERT: line[text]:'a'")
+    truncate = parse("table public.counter: TRUNCATE: (no-flags)")
+    assert net(
+        change("INSERT", 1, "1"),
+        other,  # type: ignore
+        other,  # type: ignore
+        truncate,  # type: ignore
+        change("INSERT", 1, "2"),
+    ) == [
+        "INSERT log line=a",
+        "INSERT log line=a",
+        "TRUNCATE counter",
+        "INSERT counter id=1 n=2 note=x",
+    ]
+
+
+def test_ratio() -> None:
+    events: List[Tuple[str, float]] = []
+    compactor = Compactor(
+        KEYS, metrics=Metrics(hooks=[lambda *event: events.append(event)])
+    )
+    assert compactor.ratio == 1.0
+    for n in range(10):
+        compactor.add(change("UPDATE", n % 2, str(n)))
+    compactor.flush()
+    assert compactor.ratio == 5.0
+    assert events == [("compaction_ratio", 5.0)]
+
+
+@pytest.mark.asyncio
+@pytest.mark.timeout(5)
+async def test_compact_windows_by_count() -> None:
+    messages = []
+    for xid in range(1, 7):
+        messages.extend(transaction(xid, change("UPDATE", 1, str(xid))))
+
+    compactor = Compactor(KEYS, max_changes=3, max_delay=60)
+    out = [m async for m in compact(stream(*messages), compactor)]
+    assert [(m.command, getattr(m, "lsn", None)) for m in out] == [
+        ("BEGIN", 1),
+        ("UPDATE", None),
+        ("COMMIT", 3),
+        ("BEGIN", 4),
+        ("UPDATE", None),
+        ("COMMIT", 6),
+    ]
+    assert out[4].columns[1].value == "6"  # type: ignore
+    assert compactor.ratio == 3.0
+
+
+@pytest.mark.asyncio
+@pytest.mark.timeout(5)
+async def test_compact_window_by_age() -> None:
+    messages = transaction(1, change("UPDATE", 1, "1"), change("UPDATE", 1, "2"))
+    compactor = Compactor(KEYS, max_delay=0.05)
+
+    out: List[Message] = []
+
+    async def consume() -> None:
+        async for message in compact(stream(*messages, idle=10), compactor):
+            out.append(message)
+
+    task = asyncio.ensure_future(consume())
+    await asyncio.sleep(0.2)
+    # Delivered while the source was idle
+    assert [m.command for m in out] == ["BEGIN", "UPDATE", "COMMIT"]
+    task.cancel()
+    await asyncio.gather(task, return_exceptions=True)
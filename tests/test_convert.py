@@ -0,0 +1,145 @@
+import pickle
+from datetime import date, datetime, time, timedelta, timezone
+from decimal import Decimal
+from typing import Any, List, Optional
+from uuid import UUID
+
+import pytest
+
+from realtime import convert as convert_module
+from realtime.convert import (
+    UNCHANGED_TOAST,
+    column_values,
+    convert,
+    converter_for,
+    register_converter,
+)
+from realtime.message import Column, parse
+
+
+@pytest.mark.parametrize(
+    "data_type,value,expected",
+    [
+        ("integer", "5", 5),
+        ("bigint", "-9223372036854775808", -9223372036854775808),
+        ("double precision", "1.5", 1.5),
+        ("numeric(10,2)", "1.50", Decimal("1.50")),
+        ("boolean", "true", True),
+        ("boolean", "false", False),
+        ("text", "it''s", "it's"),
+        ("character varying(255)", "''''", "''"),
+        ("mood", "happy", "happy"),
+        ("bytea", "\\x0aff", b"\n\xff"),
+        (
+            "uuid",
+            "0ad4d3d4-8d4b-4c4f-a2c0-2b8a6cbd0b7a",
+            UUID(int=0xAD4D3D48D4B4C4FA2C02B8A6CBD0B7A),
+        ),
+        ("jsonb", '{"k": "it\'\'s"}', {"k": "it's"}),
+        ("date", "2021-02-03", date(2021, 2, 3)),
+        ("date", "infinity", date.max),
+        (
+            "timestamp without time zone",
+            "2021-02-03 04:05:06.7",
+            datetime(2021, 2, 3, 4, 5, 6, 700000),
+        ),
+        (
+            "timestamp(3) with time zone",
+            "2021-02-03 04:05:06+05:30",
+            datetime(
+                2021, 2, 3, 4, 5, 6, tzinfo=timezone(timedelta(hours=5, minutes=30))
+            ),
+        ),
+        (
+            "timestamp with time zone",
+            "2021-02-03 04:05:06.123456-08",
+            datetime(2021, 2, 3, 4, 5, 6, 123456, timezone(timedelta(hours=-8))),
+        ),
+        ("time without time zone", "04:05:06", time(4, 5, 6)),
+        ("integer[]", "{1,NULL,3}", [1, None, 3]),
+        ("integer[]", "{{1,2},{3,4}}", [[1, 2], [3, 4]]),
+        ("integer[]", "[0:1]={1,2}", [1, 2]),
+        ("boolean[]", "{t,f}", [True, False]),
+        (
+            "text[]",
+            r'{a,"b c","d\"e",' "\"f''''g\",NULL,\"NULL\"}",
+            ["a", "b c", 'd"e', "f''g", None, "NULL"],
+        ),
+        ("text[]", "{}", []),
+    ],
+)
+def test_convert(data_type: str, value: str, expected: Any) -> None:
+    assert convert(data_type, value) == expected
+
+
+def test_convert_null_and_toast() -> None:
+    assert convert("integer", None) is None
+    assert convert("text", "unchanged-toast-datum") is UNCHANGED_TOAST
+
+
+def test_convert_failure() -> None:
+    with pytest.raises(ValueError):
+        convert("timestamp with time zone", "2021-02-03 04:05:06 BC")
+    with pytest.raises(ValueError):
+        convert("integer[]", "{1,2")
+
+
+def test_converter_resolved_once(monkeypatch: pytest.MonkeyPatch) -> None:
+    calls = []
+    resolve = convert_module.resolve
+
+    def counting(data_type: str) -> Any:
+        calls.append(data_type)
+        return resolve(data_type)
+
+    monkeypatch.setattr(convert_module, "_resolved", {})
+    monkeypatch.setattr(convert_module, "resolve", counting)
+    for _ in range(3):
+        converter_for("numeric(10,2)")
+    assert calls == ["numeric(10,2)"]
+
+
+def test_register_converter(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(convert_module, "CONVERTERS", dict(convert_module.CONVERTERS))
+    monkeypatch.setattr(convert_module, "_resolved", {})
+
+    assert convert("mood[]", "{happy}") == ["happy"]
+    register_converter("mood", str.upper)
+    assert convert("mood", "it''s") == "IT'S"
+    assert convert("mood[]", "{happy}") == ["HAPPY"]
+
+
+def test_column_typed_is_lazy(monkeypatch: pytest.MonkeyPatch) -> None:
+    message = parse("table public.t: INSERT: id[integer]:5 at[date]:'2021-02-03'")
+    calls: List[str] = []
+
+    def counted(data_type: str, value: Optional[str]) -> Any:
+        calls.append(data_type)
+        return convert(data_type, value)
+
+    monkeypatch.setattr("realtime.message.convert", counted)
+
+    id_column = message.columns[0]  # type: ignore
+    assert id_column.typed == 5
+    assert id_column.typed == 5
+    assert calls == ["integer"]
+    assert id_column == Column("id", "integer", "5")
+
+
+@pytest.mark.parametrize("read", [False, True])
+def test_column_typed_after_pickling(read: bool) -> None:
+    column = Column("id", "integer", "5")
+    if read:
+        column.typed
+    assert pickle.loads(pickle.dumps(column)).typed == 5
+
+
+def test_column_values() -> None:
+    messages = [
+        parse("table public.t: INSERT: id[integer]:{} v[text]:'x'".format(ix))
+        for ix in range(3)
+    ]
+    messages.append(parse("table public.t: INSERT: v[text]:'x'"))
+    messages.append(parse("table public.t: INSERT: id[integer]:null"))
+
+    assert column_values(messages, "id") == [0, 1, 2, None, None]  # type: ignore
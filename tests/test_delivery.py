@@ -0,0 +1,76 @@
+import pytest
+from fakes import FakeConnection, transactions
+
+from realtime.delivery import AckTracker
+from realtime.lsn import format_lsn, parse_lsn
+from realtime.subscribe import subscribe
+
+
+@pytest.mark.parametrize(
+    "text,value", [("0/0", 0), ("0/1A", 26), ("16/B374D848", 0x16B374D848)]
+)
+def test_lsn_round_trip(text: str, value: int) -> None:
+    assert parse_lsn(text) == value
+    assert parse_lsn(value) == value
+    assert format_lsn(value) == text
+
+
+def test_ack_tracker_confirms_commits_only() -> None:
+    acks = AckTracker()
+    for lsn, commit in [(1, False), (2, False), (3, True), (4, False), (5, False)]:
+        acks.delivered(lsn, commit)
+
+    # Nothing acknowledged yet
+    assert acks.confirmable() is None
+
+    # Acknowledging part of a transaction confirms up to the previous commit
+    acks.ack(4)
+    assert acks.confirmable() == 3
+    assert acks.rows_pending == 2
+    assert acks.confirmable() is None
+
+    acks.delivered(6, True)
+    acks.ack()
+    assert acks.confirmable() == 6
+    assert acks.rows_pending == 0
+
+
+@pytest.mark.asyncio
+@pytest.mark.timeout(5)
+async def test_subscribe_at_least_once() -> None:
+    con = FakeConnection(transactions(10))
+    acks = AckTracker()
+
+    ix = 0
+    async for _ in subscribe(con, "slot", batch_size=6, acks=acks):  # type: ignore
+        ix += 1
+        if ix == 9:
+            # 3 transactions processed; the 4th fails halfway
+            break
+        if ix % 3 == 0:
+            acks.ack()
+
+    # Unacknowledged changes stay in the slot
+    assert len(con.changes) == 30 - 6
+
+    advances = [
+        sql for sql, _ in con.statements if "pg_replication_slot_advance" in sql
+    ]
+    assert len(advances) == 1
+
+    # ... and are delivered again
+    acks = AckTracker()
+    messages = []
+    subscription = subscribe(con, "slot", batch_size=6, acks=acks)  # type: ignore
+    async for message in subscription:
+        messages.append(message)
+        acks.ack()
+        if len(messages) == 24:
+            break
+
+    # Closing flushes the final acknowledgements
+    await subscription.aclose()
+
+    assert messages[0].command == "BEGIN"
+    assert messages[0].lsn == 3  # type: ignore
+    assert con.changes == []
@@ -0,0 +1,162 @@
+import asyncio
+import random
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import AsyncIterator, Dict, List
+
+import pytest
+
+from realtime.dispatch import Dispatcher
+from realtime.keys import PrimaryKeys
+from realtime.message import Column, CRUDMessage, Message, TransactionMessage
+from realtime.pgoutput import PgOutputDecoder
+
+
+def change(id: int, version: int, table: str = "account") -> CRUDMessage:
+    return CRUDMessage(
+        command="UPDATE",
+        schema="public",
+        table=table,
+        columns=[
+            Column(column="id", data_type="integer", value=str(id)),
+            Column(column="version", data_type="integer", value=str(version)),
+        ],
+    )
+
+
+KEYS = PrimaryKeys({("public", "account"): ["id"]})
+
+
+def test_key() -> None:
+    assert KEYS.key(change(5, 1)) == ("public", "account", "5")
+    # Unknown table
+    assert KEYS.key(change(5, 1, table="other")) == ("public", "other")
+    # Missing key column
+    truncate = CRUDMessage(
+        command="TRUNCATE", schema="public", table="account", columns=[]
+    )
+    assert KEYS.key(truncate) == ("public", "account")
+
+
+def test_keys_from_pgoutput() -> None:
+    from test_pgoutput import RELATION
+
+    decoder = PgOutputDecoder()
+    decoder.decode_many([RELATION])
+    keys = PrimaryKeys()
+    keys.update(decoder.primary_keys)
+    assert keys.get("public", "account") == ("id",)
+
+
+@pytest.mark.asyncio
+@pytest.mark.timeout(5)
+async def test_dispatch_ordered_per_key() -> None:
+    seen: Dict[int, List[int]] = defaultdict(list)
+    running = 0
+    most_running = 0
+
+    async def handler(message: CRUDMessage) -> None:
+        nonlocal running, most_running
+        running += 1
+        most_running = max(most_running, running)
+        await asyncio.sleep(random.random() / 1000)
+        id, version = [column.typed for column in message.columns]
+        seen[id].append(version)
+        running -= 1
+
+    async def messages() -> AsyncIterator[Message]:
+        for version in range(20):
+            for id in range(10):
+                yield change(id, version)
+
+    async with Dispatcher(handler, shards=4, keys=KEYS) as dispatcher:
+        await dispatcher.dispatch_all(messages())
+        assert dispatcher.depths == [0, 0, 0, 0]
+
+    assert len(seen) == 10
+    for versions in seen.values():
+        assert versions == list(range(20))
+    assert most_running > 1
+
+
+@pytest.mark.asyncio
+@pytest.mark.timeout(5)
+async def test_dispatch_key_change() -> None:
+    handled: List[List[str]] = []
+
+    async def handler(message: CRUDMessage) -> None:
+        if message.columns[0].value == "1":
+            await asyncio.sleep(0.01)
+        handled.append([column.value or "" for column in message.columns])
+
+    async with Dispatcher(handler, shards=4, keys=KEYS) as dispatcher:
+        # A new key on another shard than the row's old one
+        new_id = next(
+            id
+            for id in range(2, 100)
+            if dispatcher.shard(change(id, 0)) != dispatcher.shard(change(1, 0))
+        )
+        moved = CRUDMessage(
+            command="UPDATE",
+            schema="public",
+            table="account",
+            columns=change(new_id, 3).columns,
+            old_key=[Column(column="id", data_type="integer", value="1")],
+        )
+
+        for message in [change(1, 1), change(1, 2), moved, change(new_id, 4)]:
+            await dispatcher.dispatch(message)
+
+    assert handled == [["1", "1"], ["1", "2"], [str(new_id), "3"], [str(new_id), "4"]]
+    assert KEYS.old_key(moved) == ("public", "account", "1")
+    assert KEYS.old_key(change(1, 1)) == KEYS.key(change(1, 1))
+
+
+@pytest.mark.asyncio
+@pytest.mark.timeout(5)
+async def test_dispatch_barrier() -> None:
+    handled: List[CRUDMessage] = []
+
+    async def handler(message: CRUDMessage) -> None:
+        await asyncio.sleep(0.01)
+        handled.append(message)
+
+    async with Dispatcher(handler, shards=2, keys=KEYS, barrier=True) as dispatcher:
+        await dispatcher.dispatch(TransactionMessage(command="BEGIN", lsn=1))
+        for id in range(4):
+            await dispatcher.dispatch(change(id, 1))
+        assert len(handled) < 4
+        await dispatcher.dispatch(TransactionMessage(command="COMMIT", lsn=1))
+        assert len(handled) == 4
+
+
+@pytest.mark.asyncio
+@pytest.mark.timeout(5)
+async def test_dispatch_error() -> None:
+    async def handler(message: CRUDMessage) -> None:
+        if message.columns[0].value == "3":
+            raise ValueError("bad row")
+
+    with pytest.raises(ValueError, match="bad row"):
+        async with Dispatcher(handler, shards=2, keys=KEYS) as dispatcher:
+            for id in range(10):
+                await dispatcher.dispatch(change(id, 1))
+            await dispatcher.join()
+
+
+@pytest.mark.asyncio
+@pytest.mark.timeout(5)
+async def test_dispatch_executor() -> None:
+    seen: List[str] = []
+
+    def handler(message: CRUDMessage) -> None:
+        seen.append(message.columns[1].value or "")
+
+    with ThreadPoolExecutor(2) as executor:
+        async with Dispatcher(
+            handler, shards=2, keys=KEYS, executor=executor
+        ) as dispatcher:
+            for version in range(5):
+                await dispatcher.dispatch(change(1, version))
+
+    assert seen == ["0", "1", "2", "3", "4"]
@@ -0,0 +1,262 @@
+import struct
+from typing import Any, List, Optional
+
+import pytest
+from fakes import FakeConnection, like, transactions
+
+from realtime.decoders import decoder_for
+from realtime.delivery import AckTracker
+from realtime.filters import ChangeFilter, create_publication
+from realtime.message import CRUDMessage
+from realtime.pgoutput import PgOutputDecoder
+from realtime.subscribe import subscribe
+
+ROWS = [
+    "BEGIN 1",
+    "table public.account: INSERT: id[integer]:1",
+    "table public.account: DELETE: id[integer]:1",
+    "table public.audit_log: INSERT: id[integer]:1",
+    'table public."user": INSERT: id[integer]:1',
+    'table "Billing"."Invoice": UPDATE: id[integer]:1',
+    "table billing.invoice: TRUNCATE: (no-flags)",
+    "table public.other: INSERT: id[integer:broken",
+    "COMMIT 1",
+]
+
+
+def test_wants() -> None:
+    where = ChangeFilter(
+        tables=["public.account", ("public", "user")],
+        schemas=["Billing"],
+        commands=["INSERT", "UPDATE"],
+    )
+    assert where.wants("public", "account", "INSERT")
+    assert not where.wants("public", "account", "DELETE")
+    assert where.wants("public", "user", "INSERT")
+    assert where.wants("Billing", "Invoice", "UPDATE")
+    assert not where.wants("public", "other", "INSERT")
+    assert where.index[("public", "other")] == frozenset()
+
+
+def test_wants_bare_table_names() -> None:
+    where = ChangeFilter(tables=["account"])
+    # In any schema, as wal2json's *.account and the LIKE patterns
+    assert where.wants("public", "account", "INSERT")
+    assert where.wants("billing", "account", "INSERT")
+    assert not where.wants("public", "other", "INSERT")
+    assert where.plugin_options("wal2json") == {"add-tables": "*.account"}
+
+
+def test_wants_everything() -> None:
+    where = ChangeFilter()
+    assert where.wants(None, "account", "TRUNCATE")
+    assert where.like_patterns() is None
+    assert where.plugin_options("wal2json") == {}
+
+
+def test_unknown_command() -> None:
+    with pytest.raises(ValueError):
+        ChangeFilter(commands=["UPSERT"])
+
+
+@pytest.mark.parametrize(
+    "where,expected",
+    [
+        (
+            ChangeFilter(tables=["public.account"]),
+            [1, 2],
+        ),
+        (
+            ChangeFilter(tables=["public.user", "Billing.Invoice"]),
+            [4, 5],
+        ),
+        (
+            ChangeFilter(tables=["account", "user", "Invoice"]),
+            [1, 2, 4, 5],
+        ),
+        (
+            ChangeFilter(schemas=["billing", "Billing"], commands=["TRUNCATE"]),
+            [6],
+        ),
+        (
+            ChangeFilter(commands=["DELETE"]),
+            [2],
+        ),
+    ],
+)
+def test_like_patterns(where: ChangeFilter, expected: list) -> None:
+    patterns = where.like_patterns()
+    assert patterns is not None
+    matched = [
+        ix
+        for ix, row in enumerate(ROWS)
+        if any(like(pattern, row) for pattern in patterns)
+    ]
+    assert matched == expected
+
+    # Agrees with the client side index
+    decoder = decoder_for("test_decoding", {}, where)
+    assert [ix for ix, _ in decoder.decode_many(ROWS)] == [0] + expected + [8]
+
+
+def test_like_escapes_wildcards() -> None:
+    patterns = ChangeFilter(tables=["public.a_b"]).like_patterns() or []
+    assert any(like(p, "table public.a_b: INSERT: id[integer]:1") for p in patterns)
+    assert not any(like(p, "table public.aXb: INSERT: id[integer]:1") for p in patterns)
+
+
+def test_unwanted_columns_are_not_parsed() -> None:
+    decoder = decoder_for("test_decoding", {}, ChangeFilter(tables=["public.account"]))
+    messages = [message for _, message in decoder.decode_many(ROWS)]
+    # The broken row was never tokenized
+    for message in messages:
+        getattr(message, "columns", None)
+    assert len(messages) == 4
+
+
+def test_wal2json_options() -> None:
+    where = ChangeFilter(
+        tables=["public.account", "my schema.a.b"],
+        schemas=["audit"],
+        commands=["INSERT"],
+    )
+    decoder = decoder_for("wal2json", {"include-lsn": "1"}, where)
+    assert decoder.options["add-tables"] == ("my\\ schema.a\\.b,public.account,audit.*")
+    assert decoder.options["actions"] == "insert"
+    assert decoder.options["include-lsn"] == "1"
+
+    rows = [
+        '{"action":"I","schema":"public","table":"account","columns":[]}',
+        '{"action":"I","schema":"public","table":"other","columns":[]}',
+        '{"action":"T","schema":"public","table":"account"}',
+    ]
+    assert [ix for ix, _ in decoder.decode_many(rows)] == [0]
+
+
+def test_pgoutput_filter() -> None:
+    decoder = decoder_for("pgoutput", {}, ChangeFilter(tables=["public.account"]))
+    assert isinstance(decoder, PgOutputDecoder)
+
+    def relation(oid: int, table: str) -> bytes:
+        return (
+            b"R"
+            + struct.pack("!I", oid)
+            + b"public\x00"
+            + table.encode()
+            + b"\x00d"
+            + struct.pack("!h", 1)
+            + b"\x01id\x00"
+            + struct.pack("!Ii", 23, -1)
+        )
+
+    def insert(oid: int) -> bytes:
+        return b"I" + struct.pack("!I", oid) + b"N" + struct.pack("!h", 1) + b"t\x00"
+
+    # The unwanted relation's tuple is malformed, but never read
+    frames = [relation(1, "account"), relation(2, "other"), insert(2), insert(1)]
+    frames[3] += struct.pack("!i", 1) + b"5"
+    messages = decoder.decode_many(frames)
+    assert [(ix, m.table) for ix, m in messages] == [(3, "account")]  # type: ignore
+
+
+@pytest.mark.asyncio
+@pytest.mark.timeout(5)
+async def test_subscribe_where() -> None:
+    rows = transactions(3)
+    rows[4] = (rows[4][0], rows[4][1], "table public.other: INSERT: id[integer]:5")
+    con = FakeConnection(rows)
+
+    messages = []
+    subscription = subscribe(
+        con,  # type: ignore
+        "slot",
+        batch_size=3,
+        where=ChangeFilter(tables=["public.account"]),
+    )
+    async for message in subscription:
+        messages.append(message)
+        if len(messages) == 8:
+            break
+    await subscription.aclose()
+
+    crud = [m for m in messages if isinstance(m, CRUDMessage)]
+    assert [m.table for m in crud] == ["account", "account"]
+    sql, params = con.statements[1]
+    assert "LIKE ANY" in sql
+    assert params["patterns"]
+
+
+@pytest.mark.asyncio
+@pytest.mark.timeout(5)
+async def test_subscribe_where_with_acks() -> None:
+    rows = transactions(2)
+    rows[1] = (rows[1][0], rows[1][1], "table public.other: INSERT: id[integer]:5")
+    con = FakeConnection(rows)
+    acks = AckTracker()
+
+    messages = []
+    subscription = subscribe(
+        con,  # type: ignore
+        "slot",
+        acks=acks,
+        where=ChangeFilter(tables=["public.account"]),
+    )
+    async for message in subscription:
+        messages.append(message)
+        acks.ack()
+        if len(messages) == 5:
+            break
+    await subscription.aclose()
+
+    assert [m.command for m in messages] == [
+        "BEGIN",
+        "COMMIT",
+        "BEGIN",
+        "INSERT",
+        "COMMIT",
+    ]
+    # Filtered rows still count towards the acknowledged transaction
+    assert con.changes == []
+
+
+@pytest.mark.asyncio
+async def test_create_publication() -> None:
+    con = FakeConnection()
+    where = ChangeFilter(
+        tables=["public.account"], schemas=["audit"], commands=["INSERT", "UPDATE"]
+    )
+    await create_publication(con, "realtime_py", where)  # type: ignore
+
+    assert con.statements[-1][0] == (
+        'CREATE PUBLICATION "realtime_py" FOR TABLE "public"."account", '
+        "TABLES IN SCHEMA \"audit\" WITH (publish = 'insert, update')"
+    )
+
+
+class TablesConnection(FakeConnection):
+    """Finds the tables named without a schema in *schemas*"""
+
+    def __init__(self, schemas: List[str]) -> None:
+        super().__init__()
+        self.schemas = schemas
+
+    async def execute(self, statement: Any, params: Optional[dict] = None) -> Any:
+        result = await super().execute(statement, params)
+        if "pg_tables" in str(statement):
+            result.rows = [(schema,) for schema in self.schemas]
+        return result
+
+
+@pytest.mark.asyncio
+async def test_create_publication_bare_table_names() -> None:
+    con = TablesConnection(["billing", "public"])
+    where = ChangeFilter(tables=["account"])
+    await create_publication(con, "realtime_py", where)  # type: ignore
+
+    assert con.statements[-1][0] == (
+        'CREATE PUBLICATION "realtime_py" FOR TABLE "billing"."account", '
+        '"public"."account" WITH (publish = \'delete, insert, truncate, update\')'
+    )
+
+    with pytest.raises(ValueError):
+        await create_publication(TablesConnection([]), "realtime_py", where)  # type: ignore
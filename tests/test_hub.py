@@ -0,0 +1,140 @@
+import asyncio
+from typing import List
+
+import pytest
+from fakes import FakeConnection, transactions
+
+from realtime.exceptions import SubscriberDisconnected
+from realtime.hub import Hub, Subscriber
+from realtime.message import Message
+
+
+async def take(subscriber: Subscriber, n: int) -> List[Message]:
+    out = []
+    async for message in subscriber:
+        out.append(message)
+        if len(out) == n:
+            break
+    return out
+
+
+async def settle() -> None:
+    """Let the hub distribute everything it has read and poll again"""
+    await asyncio.sleep(0.05)
+
+
+@pytest.mark.asyncio
+@pytest.mark.timeout(5)
+async def test_hub_fans_out() -> None:
+    con = FakeConnection(transactions(2))
+    hub = Hub(con, "slot", poll_delay=0.01)  # type: ignore
+    fast = hub.subscribe()
+    slow = hub.subscribe()
+
+    async with hub:
+        first = await take(fast, 6)
+        fast.ack()
+        assert await take(slow, 3) == first[:3]
+        slow.ack()
+        await settle()
+        # Only the transaction both subscribers acknowledged was released
+        assert [row[2] for row in con.changes] == [
+            "BEGIN 2",
+            con.changes[1][2],
+            "COMMIT 2",
+        ]
+
+        assert await take(slow, 3) == first[3:]
+        slow.ack()
+        await settle()
+        assert con.changes == []
+
+    assert [m.command for m in first] == ["BEGIN", "INSERT", "COMMIT"] * 2
+
+
+@pytest.mark.asyncio
+@pytest.mark.timeout(5)
+async def test_hub_optional_subscriber() -> None:
+    con = FakeConnection(transactions(2))
+    hub = Hub(con, "slot", poll_delay=0.01)  # type: ignore
+    required = hub.subscribe()
+    hub.subscribe(required=False)
+
+    async with hub:
+        await take(required, 6)
+        required.ack()
+        await settle()
+        assert con.changes == []
+
+
+@pytest.mark.asyncio
+@pytest.mark.timeout(5)
+async def test_hub_drop_oldest() -> None:
+    con = FakeConnection(transactions(3))
+    hub = Hub(con, "slot", poll_delay=0.01)  # type: ignore
+    lossy = hub.subscribe(maxsize=2, overflow="drop_oldest")
+    other = hub.subscribe()
+
+    async with hub:
+        await take(other, 9)
+        await settle()
+        assert lossy.depth == 2
+        assert lossy.dropped == 7
+        assert [m.command for m in await take(lossy, 2)] == ["INSERT", "COMMIT"]
+
+
+@pytest.mark.asyncio
+@pytest.mark.timeout(5)
+async def test_hub_block() -> None:
+    con = FakeConnection(transactions(3))
+    hub = Hub(con, "slot", poll_delay=0.01)  # type: ignore
+    blocking = hub.subscribe(maxsize=2, overflow="block")
+    other = hub.subscribe()
+
+    async with hub:
+        await settle()
+        # The hub waits on the full queue, holding back every subscriber
+        assert hub.depths == [2, 2]
+        await take(blocking, 9)
+        assert len(await take(other, 9)) == 9
+
+
+@pytest.mark.asyncio
+@pytest.mark.timeout(5)
+async def test_hub_disconnect() -> None:
+    con = FakeConnection(transactions(3))
+    hub = Hub(con, "slot", poll_delay=0.01)  # type: ignore
+    dropped = hub.subscribe(maxsize=2, overflow="disconnect")
+    other = hub.subscribe()
+
+    async with hub:
+        await take(other, 9)
+        other.ack()
+        await settle()
+
+        with pytest.raises(SubscriberDisconnected):
+            await take(dropped, 1)
+        # A disconnected subscriber no longer holds back the slot
+        assert con.changes == []
+
+
+@pytest.mark.asyncio
+@pytest.mark.timeout(5)
+async def test_hub_close_subscriber() -> None:
+    con = FakeConnection(transactions(1))
+    hub = Hub(con, "slot", poll_delay=0.01)  # type: ignore
+    leaving = hub.subscribe()
+    staying = hub.subscribe()
+
+    async with hub:
+        leaving.close()
+        assert await take(leaving, 1) == []
+        await take(staying, 3)
+        staying.ack()
+        await settle()
+        assert con.changes == []
+
+
+def test_unknown_overflow() -> None:
+    with pytest.raises(ValueError):
+        Hub(FakeConnection()).subscribe(overflow="spill")  # type: ignore
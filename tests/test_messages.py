@@ -1,6 +1,19 @@
+import pickle
+from typing import List
+
 import pytest
 
-from realtime.message import Column, CRUDMessage, TransactionMessage, parse
+import realtime.message
+from realtime.exceptions import ParseFailureException
+from realtime.message import (
+    Column,
+    CRUDMessage,
+    MessageBatch,
+    TransactionMessage,
+    parse,
+    parse_many,
+)
+from realtime.parse_utils import RawColumn
 
 
 @pytest.mark.parametrize(
@@ -46,3 +59,118 @@ def test_parse_crud_hard() -> None:
             Column(column="somearr", data_type="integer[]", value="{4,3}"),
         ],
     )
+
+
+def test_parse_many() -> None:
+    messages = [
+        "BEGIN 501",
+        "table public.account: INSERT: id[integer]:5 email[text]:'e@e.c'",
+        "COMMIT 501",
+    ]
+    assert parse_many(messages) == [parse(message) for message in messages]
+
+
+def test_parse_many_compact() -> None:
+    messages = [
+        "BEGIN 501",
+        "table public.account: DELETE: id[integer]:5",
+        "table public.account: UPDATE: old-key: id[integer]:5 new-tuple: id[integer]:6",
+        "COMMIT 501",
+    ]
+    batch = parse_many(messages, compact=True)
+    assert isinstance(batch, MessageBatch)
+    assert len(batch) == 4
+    assert batch[1] == parse(messages[1])
+    assert list(batch) == [parse(message) for message in messages]
+    assert pickle.loads(pickle.dumps(batch)).items == batch.items
+
+
+def test_parse_many_failure() -> None:
+    with pytest.raises(ParseFailureException):
+        parse_many(["BEGIN 501", "BEGIN"])
+
+
+def test_parse_old_key() -> None:
+    message = parse(
+        "table public.account: UPDATE: old-key: id[integer]:5 email[text]:'a' "
+        "new-tuple: id[integer]:6 email[text]:'b'"
+    )
+    assert isinstance(message, CRUDMessage)
+    assert message.old_key == [
+        Column("id", "integer", "5"),
+        Column("email", "text", "a"),
+    ]
+    assert message.columns == [
+        Column("id", "integer", "6"),
+        Column("email", "text", "b"),
+    ]
+    assert message != parse(
+        "table public.account: UPDATE: id[integer]:6 email[text]:'b'"
+    )
+    assert "old_key=[Column(column='id'" in repr(message)
+
+    unchanged = parse("table public.account: UPDATE: id[integer]:6")
+    assert unchanged.old_key is None  # type: ignore
+
+
+def test_parse_columns_are_lazy() -> None:
+    message = parse("table public.account: INSERT: id[integer]:5 email[text:'e'")
+    assert isinstance(message, CRUDMessage)
+    assert (message.command, message.schema, message.table) == (
+        "INSERT",
+        "public",
+        "account",
+    )
+
+    # Malformed columns are only found when read
+    with pytest.raises(ParseFailureException):
+        message.columns
+
+
+def test_batch_columns_are_lazy(monkeypatch: pytest.MonkeyPatch) -> None:
+    line = (
+        "table public.account: UPDATE: old-key: id[integer]:5 new-tuple: id[integer]:6"
+    )
+    built: List[List[RawColumn]] = []
+
+    def build_columns(raw: List[RawColumn]) -> List[Column]:
+        built.append(raw)
+        return [Column(*column) for column in raw]
+
+    monkeypatch.setattr(realtime.message, "build_columns", build_columns)
+    (message,) = parse_many([line], compact=True)
+    assert isinstance(message, CRUDMessage)
+    assert built == []
+
+    assert message.raw_columns() == ([("id", "integer", "6")], [("id", "integer", "5")])
+    assert built == []
+
+    # Built from the tokenized tuples, without tokenizing again
+    assert message == parse(line)
+    assert message.old_key == [Column("id", "integer", "5")]
+    assert built == [[("id", "integer", "6")], [("id", "integer", "5")]] * 2
+
+
+def test_parse_interns_names() -> None:
+    first, second = [
+        parse("table public.{}: INSERT: id[integer]:{}".format("account", ix))
+        for ix in range(2)
+    ]
+    assert first.table is second.table  # type: ignore
+    assert first.columns[0].column is second.columns[0].column  # type: ignore
+    assert first.columns[0].data_type is second.columns[0].data_type  # type: ignore
+
+
+def test_messages_are_slotted() -> None:
+    message = parse("table public.account: INSERT: id[integer]:5")
+    for obj in (message, message.columns[0], parse("BEGIN 1")):  # type: ignore
+        assert not hasattr(obj, "__dict__")
+
+    assert pickle.loads(pickle.dumps(message)) == message
+    assert repr(message) == (
+        "CRUDMessage(command='INSERT', schema='public', table='account', "
+        "columns=[Column(column='id', data_type='integer', value='5')])"
+    )
+
+    message.columns = []  # type: ignore
+    assert message == CRUDMessage("INSERT", "public", "account", [])
@@ -0,0 +1,61 @@
+from typing import List, Tuple
+
+import pytest
+from fakes import FakeConnection, transactions
+
+from realtime.delivery import AckTracker
+from realtime.metrics import Histogram, Metrics
+from realtime.subscribe import subscribe
+
+
+def test_histogram() -> None:
+    histogram = Histogram([1, 10])
+    for value in [0.5, 1, 5, 50]:
+        histogram.observe(value)
+    assert histogram.snapshot() == {
+        "buckets": {"1": 2, "10": 3, "+Inf": 4},
+        "count": 4,
+        "sum": 56.5,
+    }
+
+
+@pytest.mark.asyncio
+@pytest.mark.timeout(5)
+@pytest.mark.parametrize("acks", [None, AckTracker()])
+async def test_subscribe_metrics(acks: AckTracker) -> None:
+    con = FakeConnection(transactions(10))
+    con.lag = 4096
+    events: List[Tuple[str, float]] = []
+    metrics = Metrics(hooks=[lambda name, value: events.append((name, value))])
+
+    depths = []
+    async for message in subscribe(
+        con, "slot", batch_size=15, acks=acks, metrics=metrics  # type: ignore
+    ):
+        depths.append(metrics.queue_depth)
+        if len(depths) == 30:
+            break
+
+    snapshot = metrics.snapshot()
+    assert snapshot["messages"] == 30
+    assert snapshot["fetch_rows"]["count"] == 2
+    assert snapshot["fetch_rows"]["buckets"]["100"] == 2
+    assert snapshot["fetch_bytes"]["sum"] == sum(
+        len(data) for _, _, data in transactions(10)
+    )
+    assert snapshot["parse_seconds"]["count"] == 2
+    assert snapshot["slot_lag_bytes"] == 4096
+    # Rows of the current fetch not yet delivered
+    assert depths[:3] == [14, 13, 12]
+    assert depths[14] == 0
+
+    names = {name for name, _ in events}
+    assert names == {
+        "fetch_rows",
+        "fetch_bytes",
+        "fetch_seconds",
+        "parse_seconds",
+        "messages_per_second",
+        "slot_lag_bytes",
+    }
+    assert ("fetch_rows", 15) in events
@@ -0,0 +1,166 @@
+import asyncio
+from typing import List, Mapping, Sequence, Tuple
+
+import pytest
+from fakes import FakeConnection, FakeRow, transactions
+
+from realtime.delivery import AckTracker
+from realtime.filters import ChangeFilter
+from realtime.multiplex import ConnectionPool, Multiplexer, Source, Tagged
+
+
+class Databases:
+    """Fake databases by url, counting the connections open to them"""
+
+    def __init__(self, slots: Mapping[str, Sequence[FakeRow]]) -> None:
+        self.slots = {url: list(rows) for url, rows in slots.items()}
+        self.connections: List[Tuple[str, FakeConnection]] = []
+        self.most_open = 0
+
+    @property
+    def n_open(self) -> int:
+        return sum(1 for _, con in self.connections if not con.closed)
+
+    async def connect(self, url: str) -> FakeConnection:
+        if url not in self.slots:
+            raise ConnectionRefusedError(url)
+        con = FakeConnection()
+        # Share the slot between connections to the same database
+        con.changes = self.slots[url]
+        self.connections.append((url, con))
+        self.most_open = max(self.most_open, self.n_open)
+        return con
+
+    def polls(self, url: str) -> int:
+        return sum(
+            1
+            for con_url, con in self.connections
+            if con_url == url
+            for sql, _ in con.statements
+            if "pg_logical_slot_" in sql
+        )
+
+
+async def collect(stream: Multiplexer, n: int) -> List[Tagged]:
+    out = []
+    async for tagged in stream:
+        out.append(tagged)
+        if len(out) == n:
+            break
+    return out
+
+
+@pytest.mark.asyncio
+@pytest.mark.timeout(5)
+async def test_multiplexer_merges_sources() -> None:
+    urls = ["postgresql://db{}/app".format(ix) for ix in range(4)]
+    databases = Databases({url: transactions(3) for url in urls})
+    sources = [Source(url, slot_name="realtime_py") for url in urls]
+
+    async with Multiplexer(
+        sources,
+        max_connections=2,
+        batch_size=3,
+        connect=databases.connect,  # type: ignore
+    ) as stream:
+        out = await collect(stream, 4 * 9)
+
+    for source in sources:
+        lsns = [tagged.lsn for tagged in out if tagged.source == source]
+        assert lsns == [row[0] for row in transactions(3)]
+    assert databases.most_open <= 2
+    assert databases.n_open == 0
+
+
+@pytest.mark.asyncio
+@pytest.mark.timeout(5)
+async def test_multiplexer_polls_busy_slots_more() -> None:
+    databases = Databases({"busy": transactions(200), "idle": []})
+    async with Multiplexer(
+        [Source("busy"), Source("idle")],
+        max_connections=1,
+        batch_size=3,
+        min_delay=0.01,
+        max_delay=1.0,
+        connect=databases.connect,  # type: ignore
+    ) as stream:
+        await collect(stream, 600)
+
+    assert databases.polls("busy") >= 200
+    assert databases.polls("idle") < 10
+
+
+@pytest.mark.asyncio
+@pytest.mark.timeout(5)
+async def test_multiplexer_acks() -> None:
+    databases = Databases({"db": transactions(2)})
+    acks = AckTracker()
+    async with Multiplexer(
+        [Source("db", acks=acks)], connect=databases.connect  # type: ignore
+    ) as stream:
+        out = await collect(stream, 3)
+        acks.ack()
+
+    assert [tagged.message.command for tagged in out] == ["BEGIN", "INSERT", "COMMIT"]
+    # The slot was advanced past the acknowledged transaction on close
+    assert [row[0] for row in databases.slots["db"]] == ["0/4", "0/5", "0/6"]
+
+
+@pytest.mark.asyncio
+@pytest.mark.timeout(5)
+async def test_multiplexer_acks_filtered_rows() -> None:
+    databases = Databases({"db": transactions(3)})
+    acks = AckTracker()
+    source = Source("db", acks=acks, where=ChangeFilter(tables=["public.other"]))
+    async with Multiplexer(
+        [source], connect=databases.connect  # type: ignore
+    ) as stream:
+        first = await stream.__anext__()
+        # Only the rows read so far count as delivered
+        assert (first.message.command, acks.rows_pending) == ("BEGIN", 1)
+        out = await collect(stream, 3)
+        assert acks.rows_pending == 6
+        acks.ack()
+
+    assert [tagged.message.command for tagged in out] == ["COMMIT", "BEGIN", "COMMIT"]
+    # The filtered inserts were acknowledged with their transactions
+    assert [row[0] for row in databases.slots["db"]] == ["0/7", "0/8", "0/9"]
+
+
+@pytest.mark.asyncio
+@pytest.mark.timeout(5)
+async def test_multiplexer_error() -> None:
+    databases = Databases({"db": transactions(1)})
+    with pytest.raises(ConnectionRefusedError):
+        async with Multiplexer(
+            [Source("db"), Source("down")], connect=databases.connect  # type: ignore
+        ) as stream:
+            await collect(stream, 10)
+
+
+@pytest.mark.asyncio
+@pytest.mark.timeout(5)
+async def test_pool_closes_least_recently_used() -> None:
+    databases = Databases({"a": [], "b": [], "c": []})
+    pool = ConnectionPool(2, connect=databases.connect)  # type: ignore
+    a = await pool.acquire("a")
+    b = await pool.acquire("b")
+    await pool.release("a", a)
+    await pool.release("b", b)
+    assert await pool.acquire("b") is b
+    await pool.release("b", b)
+
+    c = await pool.acquire("c")
+    assert a.closed and not b.closed  # type: ignore
+    assert await pool.acquire("b") is b
+
+    # Full, with nothing idle: wait for a release
+    waiting = asyncio.ensure_future(pool.acquire("c"))
+    await asyncio.sleep(0.01)
+    assert not waiting.done()
+    await pool.release("c", c)
+    assert await waiting is c
+    await pool.release("c", c)
+    await pool.release("b", b)
+    await pool.close()
+    assert databases.n_open == 0
@@ -0,0 +1,151 @@
+from types import SimpleNamespace
+from typing import Any, List
+
+import pytest
+from fakes import FakeConnection, transactions
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+from realtime.delivery import AckTracker
+from realtime.native import NativeQueries, positional
+from realtime.subscribe import replication_slot, subscribe
+
+
+class FakeStatement:
+    def __init__(self, con: "AsyncpgConnection", sql: str) -> None:
+        self.con = con
+        self.sql = sql
+
+    async def fetch(self, *args: Any) -> List[Any]:
+        self.con.fetches.append(args)
+        if "pg_logical_slot" not in self.sql:
+            return []
+        # $1 slot_name, [upto_lsn,] upto, options, then offset or patterns
+        names = ["slot_name", "upto", "options"]
+        if "pg_lsn" in self.sql:
+            names.insert(1, "upto_lsn")
+        names.append("offset" if "OFFSET" in self.sql else "patterns")
+        result = await FakeConnection.execute(
+            self.con, self.sql, dict(zip(names, args))
+        )
+        return result.all()
+
+
+class AsyncpgConnection(FakeConnection):
+    """A FakeConnection whose slot queries are prepared on a fake asyncpg"""
+
+    def __init__(self, *args: Any) -> None:
+        super().__init__(*args)
+        self.dialect = SimpleNamespace(driver="asyncpg")
+        self.prepared: List[str] = []
+        self.fetches: List[Any] = []
+
+    async def get_raw_connection(self) -> Any:
+        return SimpleNamespace(driver_connection=self)
+
+    async def prepare(self, sql: str) -> FakeStatement:
+        self.prepared.append(sql)
+        return FakeStatement(self, sql)
+
+    async def execute(self, statement: Any, params: Any = None) -> Any:
+        assert "pg_logical_slot" not in str(statement)
+        return await super().execute(statement, params)
+
+
+def test_positional() -> None:
+    assert positional(
+        "SELECT * FROM f(:slot_name, CAST(:upto AS integer)) WHERE x = :slot_name::text"
+    ) == (
+        "SELECT * FROM f($1, CAST($2 AS integer)) WHERE x = $1::text",
+        ["slot_name", "upto"],
+    )
+
+
+def test_native_needs_asyncpg() -> None:
+    con = SimpleNamespace(dialect=SimpleNamespace(driver="psycopg2"))
+    with pytest.raises(ValueError):
+        NativeQueries(con)  # type: ignore
+
+
+@pytest.mark.asyncio
+async def test_native_binds_lsns_as_integers() -> None:
+    con = AsyncpgConnection()
+    statement = text(
+        "SELECT pg_replication_slot_advance(:slot_name, CAST(:lsn AS pg_lsn))"
+    )
+    await NativeQueries(con).fetch(  # type: ignore
+        statement, dict(slot_name="test_slot", lsn="0/1A")
+    )
+    assert con.fetches == [("test_slot", 26)]
+
+
+@pytest.mark.asyncio
+@pytest.mark.timeout(5)
+@pytest.mark.parametrize("acks", [None, AckTracker()])
+async def test_subscribe_native(acks: Any) -> None:
+    con = AsyncpgConnection(transactions(6))
+    subscription = subscribe(
+        con,  # type: ignore
+        "test_slot",
+        batch_size=3,
+        poll_delay=0.01,
+        acks=acks,
+        native=True,
+    )
+    seen = []
+    async for message in subscription:
+        seen.append(message)
+        if acks is not None:
+            acks.ack()
+        if len(seen) == 18:
+            break
+    await subscription.aclose()
+
+    assert [m.command for m in seen] == ["BEGIN", "INSERT", "COMMIT"] * 6
+    # Prepared once, fetched once per batch
+    assert len(con.prepared) == 1
+    assert len(con.fetches) >= 6
+    assert con.fetches[0][:3] == ("test_slot", 3, [])
+
+
+@pytest.mark.asyncio
+@pytest.mark.timeout(5)
+async def test_native_on_database(sync_engine: Engine, conn: AsyncConnection) -> None:
+
+    SLOT_NAME = "test_native_slot"
+    COMMITS = text(
+        "SELECT lsn FROM pg_logical_slot_peek_changes(:slot_name, NULL, NULL) "
+        "WHERE data LIKE 'COMMIT%'"
+    )
+    params = dict(slot_name=SLOT_NAME)
+
+    sync_engine.execute(text("create table natively(id integer primary key);"))
+    async with replication_slot(slot_name=SLOT_NAME, con=conn, drop_on_close=False):
+        pass
+    for id in range(3):
+        sync_engine.execute(text("insert into natively(id) values ({});".format(id)))
+    commits = [lsn for lsn, in (await conn.execute(COMMITS, params)).all()]
+
+    window = subscribe(
+        conn, SLOT_NAME, start_lsn=commits[0], end_lsn=commits[1], native=True
+    )
+    assert [message.command async for message in window] == [
+        "BEGIN",
+        "INSERT",
+        "COMMIT",
+    ]
+
+    acks = AckTracker()
+    subscription = subscribe(
+        conn, SLOT_NAME, drop_on_close=False, acks=acks, native=True
+    )
+    async for message in subscription:
+        if message.command == "COMMIT":
+            acks.ack()
+            break
+    await subscription.aclose()
+
+    # The slot was advanced past the acknowledged transaction
+    assert [lsn for lsn, in (await conn.execute(COMMITS, params)).all()] == commits[1:]
+    await conn.execute(text("SELECT pg_drop_replication_slot(:slot_name)"), params)
@@ -0,0 +1,72 @@
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterator
+
+import pytest
+from fakes import FakeConnection, transactions
+
+from realtime.decoders import TestDecodingDecoder
+from realtime.delivery import AckTracker
+from realtime.filters import ChangeFilter
+from realtime.message import CRUDMessage
+from realtime.parallel import decode
+from realtime.subscribe import subscribe
+
+ROWS = [data for _, _, data in transactions(20, rows_per_transaction=3)] + [
+    "table public.other: DELETE: id[integer]:1 note[text]:'it''s'"
+]
+
+
+@pytest.fixture(scope="module")
+def executor() -> Iterator[ProcessPoolExecutor]:
+    with ProcessPoolExecutor(2) as executor:
+        yield executor
+
+
+@pytest.mark.asyncio
+async def test_decode_matches_in_process(executor: ProcessPoolExecutor) -> None:
+    decoder = TestDecodingDecoder()
+    parallel = await decode(decoder, ROWS, executor, min_rows=1, slice_rows=7)
+    assert list(parallel) == list(decoder.decode_many(ROWS))
+
+
+@pytest.mark.asyncio
+async def test_decode_where(executor: ProcessPoolExecutor) -> None:
+    decoder = TestDecodingDecoder()
+    decoder.where = ChangeFilter(tables=["public.other"])
+    parallel = list(await decode(decoder, ROWS, executor, min_rows=1, slice_rows=7))
+    assert parallel == list(decoder.decode_many(ROWS))
+    assert [ix for ix, m in parallel if m.command == "DELETE"] == [len(ROWS) - 1]
+
+
+@pytest.mark.asyncio
+async def test_decode_small_batch_in_process() -> None:
+    class Unusable(ProcessPoolExecutor):
+        def submit(self, *args, **kwargs):  # type: ignore
+            raise AssertionError("Small batches are parsed in-process")
+
+    decoder = TestDecodingDecoder()
+    messages = await decode(decoder, ROWS, Unusable(1), min_rows=len(ROWS) + 1)
+    assert len(list(messages)) == len(ROWS)
+
+
+@pytest.mark.asyncio
+@pytest.mark.timeout(30)
+@pytest.mark.parametrize("acks", [None, AckTracker()])
+async def test_subscribe_parse_executor(
+    executor: ProcessPoolExecutor, acks: AckTracker
+) -> None:
+    rows = transactions(2000)
+    con = FakeConnection(list(rows))
+
+    messages = []
+    async for message in subscribe(
+        con, "slot", batch_size=None, acks=acks, parse_executor=executor  # type: ignore
+    ):
+        messages.append(message)
+        if len(messages) == len(rows):
+            break
+
+    assert [m.command for m in messages] == ["BEGIN", "INSERT", "COMMIT"] * 2000
+    insert = messages[-2]
+    assert isinstance(insert, CRUDMessage)
+    assert insert.columns[0].value == rows[-2][2].rsplit(":", 1)[1]
@@ -0,0 +1,111 @@
+import random
+from typing import List
+
+import pytest
+
+from realtime.parse_utils import tokenize_crud, tokenize_crud_legacy, tokenize_row
+
+LINES = [
+    "table public.account: INSERT: id[integer]:5 email[text]:'e@e.c' is_e_vd[boolean]:false",
+    "table public.account: UPDATE: id[integer]:5 email[text]:null is_e_vd[boolean]:true",
+    "table public.account: DELETE: id[integer]:5",
+    "table account: INSERT: id[integer]:1",
+    "table public.note: INSERT: id[bigint]:7 body[text]:'it''s a ''quoted'' note'",
+    "table public.note: INSERT: id[bigint]:7 body[text]:'ends with a quote'''",
+    "table public.note: INSERT: id[bigint]:7 body[text]:'has [brackets] and: colons'",
+    "table public.arr: INSERT: a[integer[]]:'{4,3}' c[integer]:null b[text[]]:'{\"x y\",z}'",
+    "table public.ts: INSERT: xxx[timestamp without time zone]:'2021-01-11 10:00:00'",
+    "table public.ts: INSERT: v[character varying(255)]:'abc' n[numeric(10,2)]:1.50",
+    "table public.toast: UPDATE: id[integer]:1 big[text]:unchanged-toast-datum",
+    "table public.t: UPDATE: old-key: id[integer]:1 new-tuple: id[integer]:2 v[text]:'x'",
+]
+
+
+def random_line(rng: random.Random, n_columns: int) -> str:
+    types = ["integer", "text", "boolean", "integer[]", "timestamp with time zone"]
+    words = ["a", "b c", "it''s", "[x]", "{1,2}", "d: e", "''''"]
+    cols = []
+    for ix in range(n_columns):
+        type_ = rng.choice(types)
+        if rng.random() < 0.1 and ix < n_columns - 1:
+            value = "null"
+        elif type_ == "integer":
+            value = str(rng.randint(-1000, 1000))
+        elif type_ == "boolean":
+            value = rng.choice(["true", "false"])
+        else:
+            value = "'v{}'".format("".join(rng.choice(words) for _ in range(3)))
+        cols.append("c{}[{}]:{}".format(ix, type_, value))
+    return "table public.t: INSERT: " + " ".join(cols)
+
+
+def corpus() -> List[str]:
+    rng = random.Random(0)
+    return LINES + [random_line(rng, rng.randint(1, 40)) for _ in range(500)]
+
+
+@pytest.mark.parametrize("line", corpus())
+def test_tokenize_crud_matches_legacy(line: str) -> None:
+    assert tokenize_crud(line) == tokenize_crud_legacy(line)
+
+
+def test_tokenize_crud_empty_string() -> None:
+    # The legacy tokenizer misreads '' as an escaped quote
+    _, _, _, columns = tokenize_crud("table public.t: INSERT: a[text]:'' b[integer]:1")
+    assert columns == [("a", "text", ""), ("b", "integer", "1")]
+
+
+def test_tokenize_crud_trailing_null() -> None:
+    # The legacy tokenizer reads a null in the last column as the text "null"
+    _, _, _, columns = tokenize_crud(
+        "table public.t: INSERT: a[integer]:1 b[text]:null"
+    )
+    assert columns == [("a", "integer", "1"), ("b", "text", None)]
+
+
+def test_tokenize_crud_old_key() -> None:
+    line = "table public.t: UPDATE: old-key: id[integer]:1 new-tuple: id[integer]:2 v[text]:'x'"
+    _, _, command, columns = tokenize_crud(line)
+    assert command == "UPDATE"
+    assert columns == [("id", "integer", "2"), ("v", "text", "x")]
+
+    assert tokenize_row(line, line.index("old-key")) == (
+        [("id", "integer", "2"), ("v", "text", "x")],
+        [("id", "integer", "1")],
+    )
+    assert tokenize_row(line, line.index("new-tuple")) == (columns, [])
+    assert tokenize_row(line, line.index("id[integer]:2")) == (columns, None)
+
+
+def test_tokenize_crud_no_tuple_data() -> None:
+    line = "table public.t: DELETE: (no-tuple-data)"
+    assert tokenize_crud(line) == ("public", "t", "DELETE", [])
+
+
+@pytest.mark.parametrize(
+    "line",
+    [
+        "table public.t: INSERT: a[text]:'unterminated",
+        "table public.t: INSERT: a[integer:1",
+        "table public.t INSERT",
+    ],
+)
+def test_tokenize_crud_malformed(line: str) -> None:
+    with pytest.raises(ValueError):
+        tokenize_crud(line)
+
+
+def test_tokenize_crud_truncate() -> None:
+    line = "table public.t: TRUNCATE: restart_seqs cascade"
+    assert tokenize_crud(line) == ("public", "t", "TRUNCATE", [])
+
+
+def test_tokenize_crud_quoted_names() -> None:
+    line = 'table "My.Schema"."Say ""hi""": INSERT: "Id"[integer]:1 v[text]:\'x\''
+    assert tokenize_crud(line) == (
+        "My.Schema",
+        'Say "hi"',
+        "INSERT",
+        [("Id", "integer", "1"), ("v", "text", "x")],
+    )
+    assert tokenize_crud('table "user": INSERT: id[integer]:1')[:2] == (None, "user")
@@ -0,0 +1,220 @@
+import struct
+from typing import List, Optional
+
+import pytest
+from fakes import FakeConnection
+
+from realtime.delivery import AckTracker
+from realtime.exceptions import ParseFailureException
+from realtime.message import CRUDMessage, TransactionMessage, parse
+from realtime.pgoutput import PgOutputDecoder
+from realtime.subscribe import subscribe
+
+# Frames as pgoutput (protocol version 1) sends them for
+#   create table public.account(id int primary key, email text, ok bool);
+#   insert into account values (5, 'it''s', true);
+
+RELATION = (
+    b"R"
+    + b"\x00\x00\x40\x01"  # relation oid 16385
+    + b"public\x00"
+    + b"account\x00"
+    + b"d"  # replica identity default
+    + b"\x00\x03"  # 3 columns
+    + b"\x01id\x00\x00\x00\x00\x17\xff\xff\xff\xff"  # key, int4, no typmod
+    + b"\x00email\x00\x00\x00\x00\x19\xff\xff\xff\xff"  # text
+    + b"\x00ok\x00\x00\x00\x00\x10\xff\xff\xff\xff"  # bool
+)
+BEGIN = (
+    b"B"
+    + b"\x00\x00\x00\x00\x01\x6b\x3a\x48"  # final lsn
+    + b"\x00\x02\x8f\x0e\x2f\x7a\x1c\x00"  # commit timestamp
+    + b"\x00\x00\x01\xf5"  # xid 501
+)
+INSERT = (
+    b"I"
+    + b"\x00\x00\x40\x01"
+    + b"N"
+    + b"\x00\x03"
+    + b"t\x00\x00\x00\x015"
+    + b"t\x00\x00\x00\x04it's"
+    + b"t\x00\x00\x00\x01t"
+)
+COMMIT = (
+    b"C"
+    + b"\x00"
+    + b"\x00\x00\x00\x00\x01\x6b\x3a\x48"
+    + b"\x00\x00\x00\x00\x01\x6b\x3a\x78"
+    + b"\x00\x02\x8f\x0e\x2f\x7a\x1c\x00"
+)
+
+
+def tuple_data(*values: Optional[str]) -> bytes:
+    out = struct.pack("!h", len(values))
+    for value in values:
+        if value is None:
+            out += b"n"
+        elif value == "unchanged":
+            out += b"u"
+        else:
+            out += b"t" + struct.pack("!i", len(value.encode())) + value.encode()
+    return out
+
+
+def relation(oid: int, table: str, columns: List[tuple]) -> bytes:
+    out = b"R" + struct.pack("!I", oid) + b"public\x00" + table.encode() + b"\x00d"
+    out += struct.pack("!h", len(columns))
+    for name, type_oid, typmod, key in columns:
+        out += (
+            bytes([key])
+            + name.encode()
+            + b"\x00"
+            + struct.pack("!Ii", type_oid, typmod)
+        )
+    return out
+
+
+def test_decode_matches_test_decoding() -> None:
+    decoder = PgOutputDecoder()
+    messages = [
+        message for _, message in decoder.decode_many([RELATION, BEGIN, INSERT, COMMIT])
+    ]
+
+    assert messages == [
+        parse("BEGIN 501"),
+        parse(
+            "table public.account: INSERT: id[integer]:5 email[text]:'it''s' ok[boolean]:true"
+        ),
+        parse("COMMIT 501"),
+    ]
+
+
+def test_decode_row_indexes() -> None:
+    decoder = PgOutputDecoder()
+    assert [ix for ix, _ in decoder.decode_many([RELATION, BEGIN, INSERT, COMMIT])] == [
+        1,
+        2,
+        3,
+    ]
+
+
+def test_relation_cache() -> None:
+    decoder = PgOutputDecoder()
+    decoder.decode_many([RELATION])
+
+    # Later fetches carry only tuple data
+    ((_, message),) = decoder.decode_many([INSERT])
+    assert isinstance(message, CRUDMessage)
+    assert message.table == "account"
+    assert [col.column for col in message.columns] == ["id", "email", "ok"]
+
+
+def test_decode_types() -> None:
+    decoder = PgOutputDecoder(type_names={70000: "mood"})
+    frames = [
+        relation(
+            1,
+            "typed",
+            [
+                ("v", 1043, 255 + 4, 1),
+                ("n", 1700, ((10 << 16) | 2) + 4, 0),
+                ("a", 1007, -1, 0),
+                ("m", 70000, -1, 0),
+                ("c", 80000, -1, 0),
+            ],
+        ),
+        b"Y" + struct.pack("!I", 80000) + b"public\x00color\x00",
+        b"I"
+        + struct.pack("!I", 1)
+        + b"N"
+        + tuple_data("x", "1.50", "{4,3}", "happy", "red"),
+    ]
+    ((_, message),) = decoder.decode_many(frames)
+
+    assert message == parse(
+        "table public.typed: INSERT: v[character varying(255)]:'x' n[numeric(10,2)]:1.50 "
+        "a[integer[]]:'{4,3}' m[mood]:'happy' c[80000]:'red'"
+    )
+
+
+def test_decode_update_and_delete() -> None:
+    decoder = PgOutputDecoder()
+    frames = [
+        RELATION,
+        # update with the old key logged
+        b"U"
+        + struct.pack("!I", 16385)
+        + b"K"
+        + tuple_data("5", None, None)
+        + b"N"
+        + tuple_data("6", "unchanged", "f"),
+        b"D" + struct.pack("!I", 16385) + b"K" + tuple_data("6", None, None),
+    ]
+    update, delete = [message for _, message in decoder.decode_many(frames)]
+
+    assert update == parse(
+        "table public.account: UPDATE: old-key: id[integer]:5 new-tuple: "
+        "id[integer]:6 email[text]:unchanged-toast-datum ok[boolean]:false"
+    )
+    assert delete == parse("table public.account: DELETE: id[integer]:6")
+
+
+def test_decode_truncate() -> None:
+    decoder = PgOutputDecoder()
+    frames = [
+        RELATION,
+        relation(2, "other", [("id", 23, -1, 1)]),
+        b"T" + struct.pack("!ib", 2, 0) + struct.pack("!II", 16385, 2),
+    ]
+    messages = [message for _, message in decoder.decode_many(frames)]
+
+    assert [(m.command, m.table) for m in messages] == [  # type: ignore
+        ("TRUNCATE", "account"),
+        ("TRUNCATE", "other"),
+    ]
+    assert messages[0] == parse("table public.account: TRUNCATE: (no-flags)")
+
+
+def test_decode_unknown_relation() -> None:
+    with pytest.raises(ParseFailureException):
+        PgOutputDecoder().decode_many([INSERT])
+
+
+@pytest.mark.asyncio
+@pytest.mark.timeout(5)
+async def test_subscribe_pgoutput() -> None:
+    con = FakeConnection(
+        [
+            ("0/1", 501, BEGIN),
+            ("0/1", 501, RELATION),
+            ("0/2", 501, INSERT),
+            ("0/3", 501, COMMIT),
+        ]
+    )
+    acks = AckTracker()
+
+    messages = []
+    subscription = subscribe(
+        con,  # type: ignore
+        "slot",
+        plugin="pgoutput",
+        plugin_options={"publication_names": "pub"},
+        acks=acks,
+    )
+    async for message in subscription:
+        messages.append(message)
+        if len(messages) == 3:
+            acks.ack()
+            break
+    await subscription.aclose()
+
+    assert messages[0] == TransactionMessage(command="BEGIN", lsn=501)
+    assert messages[2] == TransactionMessage(command="COMMIT", lsn=501)
+
+    sql, params = con.statements[1]
+    assert "pg_logical_slot_peek_binary_changes" in sql
+    assert params["options"] == ["proto_version", "1", "publication_names", "pub"]
+    assert con.statements[0][1]["plugin"] == "pgoutput"
+    # The relation row was counted as delivered, so the commit was confirmed
+    assert acks.rows_pending == 0
+    assert con.changes == []
@@ -0,0 +1,213 @@
+import asyncio
+from types import SimpleNamespace
+from typing import Any, Dict, List, Optional, Tuple
+
+import pytest
+from fakes import PASSWORD, FakeConnection, FakeReplicationServer, FakeResult
+from sqlalchemy import text
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+from realtime.message import parse
+from realtime.replica import LocalTable
+from realtime.transaction import Transaction
+
+
+def transaction(commit_lsn: int, *lines: str) -> Transaction:
+    out = Transaction(xid=1)
+    for line in lines:
+        out.append(parse(line))  # type: ignore
+    out.commit_lsn = commit_lsn
+    return out
+
+
+def account(command: str, id: int, email: str = "", name: str = "") -> str:
+    line = "table public.account: {}: id[integer]:{}".format(command, id)
+    if email:
+        line += " email[text]:'{}' name[text]:{}".format(email, name or "'x'")
+    return line
+
+
+def test_local_table() -> None:
+    table = LocalTable("public.account", key=["id"], indexes=["email"])
+    table.load(
+        [
+            {"id": 1, "email": "a@b.c", "name": "a"},
+            {"id": 2, "email": "a@b.c", "name": "b"},
+        ],
+        lsn=100,
+    )
+    assert len(table) == 2
+    assert [row["id"] for row in table.lookup("email", "a@b.c")] == [1, 2]
+
+    # Already part of the snapshot
+    assert not table.apply(transaction(90, account("DELETE", 1)))
+    assert 1 in table
+
+    assert table.apply(
+        transaction(
+            110,
+            account("INSERT", 3, "c@d.e"),
+            account("UPDATE", 2, "c@d.e", "unchanged-toast-datum"),
+            account("DELETE", 1),
+            "table public.other: DELETE: id[integer]:3",
+        )
+    )
+    assert table.applied_lsn == 110
+    assert table.get(1) is None
+    assert table.get(2) == {"id": 2, "email": "c@d.e", "name": "b"}
+    assert table.lookup("email", "a@b.c") == []
+    assert [row["id"] for row in table.lookup("email", "c@d.e")] == [3, 2]
+    with pytest.raises(ValueError):
+        table.lookup("name", "b")
+
+    table.apply(transaction(120, "table public.account: TRUNCATE: (no-flags)"))
+    assert len(table) == 0
+    assert table.indexes == {"email": {}}
+
+
+def test_local_table_composite_key() -> None:
+    table = LocalTable("public.member", key=["org", "person"])
+    table.load([{"org": 1, "person": 2, "role": "a"}], lsn=0)
+    table.apply(
+        transaction(
+            1,
+            "table public.member: UPDATE: org[integer]:1 person[integer]:2 "
+            "role[text]:'b'",
+        )
+    )
+    assert table.get(1, 2) == {"org": 1, "person": 2, "role": "b"}
+
+
+def test_local_table_key_change() -> None:
+    table = LocalTable("public.account", key=["id"], indexes=["email"])
+    table.load([{"id": 1, "email": "a@b.c", "name": "a"}], lsn=0)
+    table.apply(
+        transaction(
+            1,
+            "table public.account: UPDATE: old-key: id[integer]:1 new-tuple: "
+            "id[integer]:2 email[text]:'c@d.e' name[text]:unchanged-toast-datum",
+        )
+    )
+    assert table.get(1) is None
+    assert table.get(2) == {"id": 2, "email": "c@d.e", "name": "a"}
+    assert table.indexes == {"email": {"c@d.e": {2: table.get(2)}}}
+
+
+class SnapshotConnection(FakeConnection):
+    """A FakeConnection that also serves a snapshot of public.account, as
+    text, and its catalog
+    """
+
+    COLUMNS = [("id", "integer"), ("email", "text"), ("name", "text")]
+
+    def __init__(self, snapshot: List[Tuple[Optional[str], ...]], port: int) -> None:
+        super().__init__()
+        self.snapshot = snapshot
+        self.rolled_back = False
+        self.engine = SimpleNamespace(
+            url=make_url(
+                "postgresql+asyncpg://pytest:{}@127.0.0.1:{}/realtime".format(
+                    PASSWORD, port
+                )
+            )
+        )
+
+    async def execute(
+        self, statement: Any, params: Optional[Dict[str, Any]] = None
+    ) -> FakeResult:
+        result = await super().execute(statement, params)
+        sql = str(statement)
+        if "indisprimary" in sql:
+            return FakeResult([("public", "account", ["id"])])
+        if "format_type" in sql:
+            return FakeResult(self.COLUMNS)
+        if sql.startswith("SELECT CAST("):
+            return FakeResult(self.snapshot)
+        return result
+
+    async def rollback(self) -> None:
+        self.rolled_back = True
+
+
+@pytest.mark.asyncio
+@pytest.mark.timeout(5)
+async def test_bootstrap_and_follow() -> None:
+    async with FakeReplicationServer([]) as server:
+        con = SnapshotConnection([("1", "a@b.c", "a")], server.port)
+        table = LocalTable("public.account", indexes=["email"])
+        await table.bootstrap(con, slot_name="test_slot")  # type: ignore
+
+    assert table.snapshot_lsn == 0x1000
+    assert table.key_columns == ("id",)
+    # Converted as streamed values are
+    assert table.get(1) == {"id": 1, "email": "a@b.c", "name": "a"}
+    assert con.rolled_back
+    statements = [sql for sql, _ in con.statements]
+    # The snapshot is set up before any query
+    assert statements[:2] == [
+        "SET TRANSACTION ISOLATION LEVEL REPEATABLE READ",
+        "SET TRANSACTION SNAPSHOT '00000003-00000002-1'",
+    ]
+    assert statements[-1] == (
+        'SELECT CAST("id" AS text), CAST("email" AS text), CAST("name" AS text) '
+        'FROM "public"."account"'
+    )
+
+    con.changes = [
+        # Committed before the snapshot was taken
+        ("0/F00", 7, "BEGIN 7"),
+        ("0/F01", 7, account("DELETE", 1)),
+        ("0/F02", 7, "COMMIT 7"),
+        ("0/2000", 8, "BEGIN 8"),
+        ("0/2001", 8, account("INSERT", 2, "c@d.e")),
+        ("0/2002", 8, "COMMIT 8"),
+    ]
+    follow = asyncio.ensure_future(
+        table.follow(con, slot_name="test_slot", poll_delay=0.01)  # type: ignore
+    )
+    while table.applied_lsn != 0x2002:
+        await asyncio.sleep(0.01)
+    follow.cancel()
+    await asyncio.gather(follow, return_exceptions=True)
+
+    assert set(table.rows) == {1, 2}
+    assert table.lookup("email", "c@d.e") == [table.get(2)]
+
+
+@pytest.mark.asyncio
+@pytest.mark.timeout(5)
+async def test_bootstrap_on_database(
+    sync_engine: Engine, conn: AsyncConnection
+) -> None:
+
+    SLOT_NAME = "test_replica_slot"
+
+    sync_engine.execute(
+        text("create table replicated(id integer primary key, doc json, tags text[]);")
+    )
+    sync_engine.execute(
+        text("""insert into replicated values (1, '{"a": 1}', '{x}');""")
+    )
+
+    table = LocalTable("public.replicated")
+    await table.bootstrap(conn, slot_name=SLOT_NAME)
+    assert table.key_columns == ("id",)
+    assert table.get(1) == {"id": 1, "doc": {"a": 1}, "tags": ["x"]}
+
+    sync_engine.execute(
+        text("""insert into replicated values (2, '{"a": 2}', '{y}');""")
+    )
+    follow = asyncio.ensure_future(
+        table.follow(conn, slot_name=SLOT_NAME, poll_delay=0.01, drop_on_close=False)
+    )
+    while 2 not in table:
+        await asyncio.sleep(0.01)
+    follow.cancel()
+    await asyncio.gather(follow, return_exceptions=True)
+
+    # Streamed rows hold the same types as the snapshot's
+    assert table.get(2) == {"id": 2, "doc": {"a": 2}, "tags": ["y"]}
+    await conn.execute(
+        text("SELECT pg_drop_replication_slot(:slot_name)"), dict(slot_name=SLOT_NAME)
+    )
@@ -0,0 +1,131 @@
+import asyncio
+from types import SimpleNamespace
+from typing import Any, AsyncGenerator, List, Optional
+
+import pytest
+from fakes import PASSWORD, FakeConnection, FakeReplicationServer
+from sqlalchemy.engine import make_url
+
+from realtime.delivery import AckTracker
+from realtime.exceptions import ReplicationException
+from realtime.message import CRUDMessage, TransactionMessage
+from realtime.replication import ReplicationConnection, stream
+from realtime.subscribe import subscribe
+
+FRAMES = [
+    (10, b"BEGIN 501"),
+    (11, b"table public.account: INSERT: id[integer]:1"),
+    (12, b"COMMIT 501"),
+]
+
+
+async def collect(
+    messages: AsyncGenerator[Any, None], n: int, acks: Optional[AckTracker] = None
+) -> List[Any]:
+    out = []
+    async for message in messages:
+        out.append(message)
+        if acks is not None:
+            acks.ack()
+        if len(out) == n:
+            break
+    await messages.aclose()
+    return out
+
+
+@pytest.mark.asyncio
+@pytest.mark.timeout(5)
+@pytest.mark.parametrize("auth", ["trust", "md5", "scram"])
+async def test_stream(auth: str) -> None:
+    async with FakeReplicationServer(FRAMES, auth=auth) as server:
+        con = await ReplicationConnection.connect(
+            "127.0.0.1", server.port, "pytest", PASSWORD, "realtime"
+        )
+        changes = await collect(stream(con, "test_slot"), 3)
+        await con.close()
+
+    assert changes == FRAMES
+    assert server.startup["replication"] == "database"
+    assert server.queries == ['START_REPLICATION SLOT "test_slot" LOGICAL 0/0']
+
+
+@pytest.mark.asyncio
+@pytest.mark.timeout(5)
+async def test_stream_bad_password() -> None:
+    async with FakeReplicationServer(FRAMES, auth="md5") as server:
+        with pytest.raises(ReplicationException):
+            await ReplicationConnection.connect(
+                "127.0.0.1", server.port, "pytest", "wrong", "realtime"
+            )
+
+
+@pytest.mark.asyncio
+@pytest.mark.timeout(5)
+async def test_stream_reports_acknowledged_position() -> None:
+    async with FakeReplicationServer(FRAMES) as server:
+        con = await ReplicationConnection.connect(
+            "127.0.0.1", server.port, "pytest", PASSWORD, "realtime"
+        )
+        acks = AckTracker()
+        messages = stream(con, "test_slot", acks=acks, status_interval=0.01)
+        async for lsn, data in messages:
+            acks.delivered(lsn, commit=data.startswith(b"COMMIT"))
+            if lsn == 11:
+                # Status updates keep flowing while the consumer is busy
+                await asyncio.sleep(0.05)
+            if lsn == 12:
+                break
+        acks.ack()
+        await messages.aclose()
+        await con.close()
+
+    # Nothing is flushed until the transaction is acknowledged
+    assert all(flush == 0 for _, flush, _ in server.statuses[:-1])
+    assert len(server.statuses) > 2
+    assert server.statuses[-1][1] == 12
+
+
+@pytest.mark.asyncio
+@pytest.mark.timeout(5)
+async def test_subscribe_stream_transport() -> None:
+    async with FakeReplicationServer(FRAMES) as server:
+        con = FakeConnection()
+        con.engine = SimpleNamespace(  # type: ignore
+            url=make_url(
+                "postgresql+asyncpg://pytest:{}@127.0.0.1:{}/realtime".format(
+                    PASSWORD, server.port
+                )
+            )
+        )
+        messages = await collect(
+            subscribe(con, "test_slot", transport="stream"), 3  # type: ignore
+        )
+
+    assert messages == [
+        TransactionMessage(command="BEGIN", lsn=501),
+        CRUDMessage(
+            command="INSERT",
+            schema="public",
+            table="account",
+            columns=messages[1].columns,
+        ),
+        TransactionMessage(command="COMMIT", lsn=501),
+    ]
+    assert messages[1].columns[0].value == "1"
+    assert server.startup["user"] == "pytest"
+
+
+@pytest.mark.asyncio
+@pytest.mark.timeout(5)
+async def test_replication_slot_snapshot() -> None:
+    async with FakeReplicationServer([]) as server:
+        con = await ReplicationConnection.connect(
+            "127.0.0.1", server.port, "pytest", PASSWORD, "realtime"
+        )
+        lsn, snapshot = await con.create_slot("test_slot", "test_decoding")
+        await con.close()
+
+    assert (lsn, snapshot) == (0x1000, "00000003-00000002-1")
+    assert server.queries == [
+        'CREATE_REPLICATION_SLOT "test_slot" LOGICAL "test_decoding" EXPORT_SNAPSHOT'
+    ]
@@ -0,0 +1,65 @@
+import asyncio
+import time
+from typing import List
+
+import pytest
+from fakes import FakeConnection, transactions
+
+from realtime.scheduler import Backoff, FixedDelay, PollScheduler
+from realtime.subscribe import subscribe
+
+
+class RecordingScheduler:
+    """Records each wait, and commits another transaction during it"""
+
+    def __init__(self, con: FakeConnection) -> None:
+        self.con = con
+        self.rows: List[int] = []
+
+    async def wait(self, rows: int) -> None:
+        self.rows.append(rows)
+        self.con.changes.extend(transactions(1))
+
+
+@pytest.mark.asyncio
+async def test_backoff() -> None:
+    scheduler = Backoff(min_delay=0.001, max_delay=0.004, factor=2)
+
+    delays = []
+    for rows in [0, 0, 0, 0, 5, 0]:
+        await scheduler.wait(rows)
+        delays.append(scheduler.delay)
+
+    assert delays == [0.002, 0.004, 0.004, 0.004, 0.001, 0.002]
+
+
+@pytest.mark.asyncio
+@pytest.mark.timeout(5)
+async def test_wake_ends_wait_early() -> None:
+    wake = asyncio.Event()
+    schedulers: List[PollScheduler] = [
+        FixedDelay(10, wake=wake),
+        Backoff(10, 10, wake=wake),
+    ]
+    for scheduler in schedulers:
+        asyncio.get_running_loop().call_later(0.01, wake.set)
+        start = time.monotonic()
+        await scheduler.wait(0)
+        assert time.monotonic() - start < 1
+        assert not wake.is_set()
+
+
+@pytest.mark.asyncio
+@pytest.mark.timeout(5)
+async def test_subscribe_scheduler() -> None:
+    con = FakeConnection(transactions(10))
+    scheduler = RecordingScheduler(con)
+
+    ix = 0
+    async for _ in subscribe(con, "slot", batch_size=4, scheduler=scheduler):  # type: ignore
+        ix += 1
+        if ix == 36:
+            break
+
+    # Full batches are fetched back to back, then the scheduler is consulted
+    assert scheduler.rows == [30, 3]
@@ -0,0 +1,191 @@
+from typing import Any, Callable, Iterator, List, Tuple
+
+import pytest
+from fakes import stream
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.engine import Connection
+from sqlalchemy.exc import IntegrityError
+
+from realtime.keys import PrimaryKeys
+from realtime.message import parse
+from realtime.sink import Sink, runs
+
+
+class SyncTarget:
+    """Stands in for an AsyncConnection, running sync functions directly"""
+
+    def __init__(self, con: Connection) -> None:
+        self.con = con
+
+    async def run_sync(self, fn: Callable[..., Any], *args: Any) -> Any:
+        return fn(self.con, *args)
+
+
+@pytest.fixture
+def target() -> Iterator[Connection]:
+    engine = create_engine("sqlite://", future=True)
+    with engine.connect() as con:
+        con.execute(
+            text("create table account(id integer primary key, email text, n numeric)")
+        )
+        con.execute(
+            text(
+                "create table membership(org integer, person integer, role text, "
+                "primary key (org, person))"
+            )
+        )
+        con.commit()
+        yield con
+
+
+@pytest.fixture
+def statements(target: Connection) -> List[Tuple[str, bool]]:
+    executed: List[Tuple[str, bool]] = []
+
+    @event.listens_for(target, "before_cursor_execute")
+    def record(con, cursor, statement, parameters, context, executemany):  # type: ignore
+        executed.append((statement.split(" ")[0], executemany))
+
+    return executed
+
+
+def rows(con: Connection, table: str) -> List[Tuple[Any, ...]]:
+    return [tuple(row) for row in con.execute(text("select * from " + table))]
+
+
+def insert(id: int) -> str:
+    return "table public.account: INSERT: id[integer]:{} {} n[numeric]:1.5".format(
+        id, "email[text]:'a@b.c'"
+    )
+
+
+def member(command: str, org: int, person: int, role: str = "") -> str:
+    return "table public.team_member: {}: org[integer]:{} person[integer]:{}{}".format(
+        command, org, person, " role[text]:" + role if role else ""
+    )
+
+
+class Acks:
+    def __init__(self) -> None:
+        self.acked = 0
+
+    def ack(self) -> None:
+        self.acked += 1
+
+
+def test_runs() -> None:
+    changes = [
+        parse(insert(1)),
+        parse(insert(2)),
+        parse("table public.account: DELETE: id[integer]:1"),
+        parse(insert(3)),
+    ]
+    assert [(table, command, len(run)) for table, command, run in runs(changes)] == [  # type: ignore
+        (("public", "account"), "INSERT", 2),
+        (("public", "account"), "DELETE", 1),
+        (("public", "account"), "INSERT", 1),
+    ]
+
+
+@pytest.mark.asyncio
+async def test_sink_batches(
+    target: Connection, statements: List[Tuple[str, bool]]
+) -> None:
+    sink = Sink(SyncTarget(target))  # type: ignore
+    await sink.apply(
+        stream(
+            "BEGIN 1",
+            *[insert(id) for id in range(5)],
+            "table public.account: UPDATE: id[integer]:1 email[text]:'it''s' n[numeric]:2",
+            "table public.account: UPDATE: id[integer]:2 email[text]:'x' n[numeric]:3",
+            "table public.account: DELETE: id[integer]:3",
+            "table public.account: DELETE: id[integer]:4",
+            "COMMIT 1",
+        )
+    )
+
+    assert rows(target, "account") == [
+        (0, "a@b.c", 1.5),
+        (1, "it's", 2),
+        (2, "x", 3),
+    ]
+    # One statement per run
+    assert [s for s in statements if s[0] in ("INSERT", "UPDATE", "DELETE")] == [
+        ("INSERT", True),
+        ("UPDATE", True),
+        ("DELETE", False),
+    ]
+
+
+@pytest.mark.asyncio
+async def test_sink_follows_key_changes(target: Connection) -> None:
+    sink = Sink(SyncTarget(target))  # type: ignore
+    await sink.apply(
+        stream(
+            "BEGIN 1",
+            insert(1),
+            insert(2),
+            "table public.account: UPDATE: old-key: id[integer]:1 new-tuple: "
+            "id[integer]:10 email[text]:'x' n[numeric]:2",
+            "table public.account: UPDATE: id[integer]:2 email[text]:'y' n[numeric]:3",
+            "COMMIT 1",
+        )
+    )
+
+    # Matched on the key before the update
+    assert rows(target, "account") == [(2, "y", 3), (10, "x", 2)]
+
+
+@pytest.mark.asyncio
+async def test_sink_transaction_per_commit(target: Connection) -> None:
+    acks = Acks()
+    sink = Sink(SyncTarget(target))  # type: ignore
+    with pytest.raises(IntegrityError):
+        await sink.apply(
+            stream(
+                "BEGIN 1",
+                insert(1),
+                "COMMIT 1",
+                "BEGIN 2",
+                insert(2),
+                insert(1),
+                "COMMIT 2",
+            ),
+            acks=acks,  # type: ignore
+        )
+
+    # The failed transaction was rolled back, and only the first acknowledged
+    assert rows(target, "account") == [(1, "a@b.c", 1.5)]
+    assert acks.acked == 1
+
+
+@pytest.mark.asyncio
+async def test_sink_mapping_and_keys(target: Connection) -> None:
+    sink = Sink(
+        SyncTarget(target),  # type: ignore
+        tables={"public.team_member": "membership"},
+        keys=PrimaryKeys({("public", "team_member"): ["org", "person"]}),
+    )
+    await sink.apply(
+        stream(
+            "BEGIN 1",
+            insert(1),
+            # Columns the target does not have are left out
+            member("INSERT", 1, 1, "'a' extra[text]:'x'"),
+            member("INSERT", 1, 2, "'a' extra[text]:'x'"),
+            member("INSERT", 2, 1, "'a' extra[text]:'x'"),
+            member("UPDATE", 1, 2, "unchanged-toast-datum"),
+            member("UPDATE", 2, 1, "'b'"),
+            member("DELETE", 1, 1),
+            "COMMIT 1",
+        )
+    )
+
+    # Unmapped tables are skipped
+    assert rows(target, "account") == []
+    assert rows(target, "membership") == [(1, 2, "a"), (2, 1, "b")]
+
+    await sink.apply(
+        stream("table public.team_member: TRUNCATE: (no-flags)", "COMMIT 2")
+    )
+    assert rows(target, "membership") == []
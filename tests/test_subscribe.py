@@ -1,9 +1,14 @@
+from typing import List
+
 import pytest
+from fakes import FakeConnection, transactions
 from sqlalchemy import text
-from sqlalchemy.engine import Engine
+from sqlalchemy.engine import Engine, Row
 from sqlalchemy.ext.asyncio import AsyncConnection
 
-from realtime.subscribe import replication_slot, subscribe
+from realtime.delivery import AckTracker
+from realtime.message import Message, TransactionMessage
+from realtime.subscribe import drain, replication_slot, subscribe
 
 
 # @pytest.mark.skipif("GITHUB_SHA" in os.environ, reason="no worky")
@@ -41,3 +46,156 @@ async def test_subscribe(sync_engine: Engine, conn: AsyncConnection) -> None:
             break
 
     assert ix == 3
+
+
+@pytest.mark.asyncio
+@pytest.mark.timeout(5)
+async def test_subscribe_acks(sync_engine: Engine, conn: AsyncConnection) -> None:
+
+    SLOT_NAME = "test_subscribe_acks_slot"
+    PEEK = text(
+        "SELECT data FROM pg_logical_slot_peek_changes(:slot_name, NULL, NULL) "
+        "WHERE data LIKE 'table %'"
+    )
+
+    sync_engine.execute(text("create table acked(id integer primary key);"))
+    async with replication_slot(slot_name=SLOT_NAME, con=conn, drop_on_close=False):
+        pass
+    sync_engine.execute(text("insert into acked(id) values (1);"))
+    sync_engine.execute(text("insert into acked(id) values (2);"))
+
+    acks = AckTracker()
+    subscription = subscribe(conn, SLOT_NAME, drop_on_close=False, acks=acks)
+    async for message in subscription:
+        if message.command == "COMMIT":
+            acks.ack()
+            break
+    # Advances the slot past the acknowledged transaction
+    await subscription.aclose()
+
+    rows = (await conn.execute(PEEK, dict(slot_name=SLOT_NAME))).all()
+    assert [data for data, in rows] == ["table public.acked: INSERT: id[integer]:2"]
+    await conn.execute(
+        text("SELECT pg_drop_replication_slot(:slot_name)"),
+        dict(slot_name=SLOT_NAME),
+    )
+
+
+@pytest.mark.asyncio
+@pytest.mark.timeout(5)
+async def test_subscribe_replays_window(
+    sync_engine: Engine, conn: AsyncConnection
+) -> None:
+
+    SLOT_NAME = "test_subscribe_window_slot"
+    COMMITS = text(
+        "SELECT lsn FROM pg_logical_slot_peek_changes(:slot_name, NULL, NULL) "
+        "WHERE data LIKE 'COMMIT%'"
+    )
+    SLOTS = text("SELECT slot_name FROM pg_replication_slots ORDER BY slot_name")
+    params = dict(slot_name=SLOT_NAME)
+
+    sync_engine.execute(text("create table replayed(id integer primary key);"))
+    async with replication_slot(slot_name=SLOT_NAME, con=conn, drop_on_close=False):
+        pass
+    for id in range(3):
+        sync_engine.execute(text("insert into replayed(id) values ({});".format(id)))
+    commits = [lsn for lsn, in (await conn.execute(COMMITS, params)).all()]
+
+    # Only the second transaction committed in the window
+    window = subscribe(
+        conn, SLOT_NAME, start_lsn=commits[0], end_lsn=commits[1], batch_size=1
+    )
+    seen = [message async for message in window]
+    assert [message.command for message in seen] == ["BEGIN", "INSERT", "COMMIT"]
+    assert seen[1].columns[0].value == "1"  # type: ignore
+
+    # The slot itself was left as it was, and the copy dropped
+    assert len((await conn.execute(COMMITS, params)).all()) == 3
+    assert [name for name, in (await conn.execute(SLOTS)).all()] == [SLOT_NAME]
+    await conn.execute(text("SELECT pg_drop_replication_slot(:slot_name)"), params)
+
+
+@pytest.mark.asyncio
+async def test_drain_bounded() -> None:
+    con = FakeConnection(transactions(10))
+
+    batches: List[List[Row]] = []
+    async for rows in drain(con, "slot", batch_size=4):  # type: ignore
+        # Nothing more is consumed from the slot until this batch is handled
+        assert len(con.changes) == 30 - sum(len(x) for x in batches) - len(rows)
+        batches.append(rows)
+
+    assert [len(x) for x in batches] == [6, 6, 6, 6, 6]
+    assert con.changes == []
+
+
+@pytest.mark.asyncio
+async def test_drain_unbounded() -> None:
+    con = FakeConnection(transactions(10))
+    batches = [rows async for rows in drain(con, "slot", batch_size=None)]  # type: ignore
+    assert [len(x) for x in batches] == [30]
+
+
+@pytest.mark.asyncio
+@pytest.mark.timeout(5)
+async def test_subscribe_backpressure() -> None:
+    con = FakeConnection(transactions(100))
+
+    ix = 0
+    async for message in subscribe(con, "slot", batch_size=30):  # type: ignore
+        ix += 1
+        if ix == 10:
+            break
+
+    # Only the first batch was read from the slot
+    assert len(con.changes) == 300 - 30
+
+
+def begun(messages: List[Message]) -> List[int]:
+    """The lsns of the BEGIN messages of *messages*"""
+    return [
+        m.lsn
+        for m in messages
+        if isinstance(m, TransactionMessage) and m.command == "BEGIN"
+    ]
+
+
+@pytest.mark.asyncio
+@pytest.mark.timeout(5)
+async def test_subscribe_window() -> None:
+    con = FakeConnection(transactions(10))
+    live = subscribe(con, "slot", batch_size=3)  # type: ignore
+    window = subscribe(
+        con, "slot", batch_size=4, start_lsn="0/6", end_lsn=15  # type: ignore
+    )
+
+    seen = []
+    async for message in window:
+        seen.append(message)
+        # The live subscription carries on while the window is read
+        await live.__anext__()
+    await live.aclose()
+
+    # Transactions committed at 0/9, 0/C and 0/F
+    assert begun(seen) == [3, 4, 5]
+    assert len(seen) == 9
+    # The live slot only lost what the live subscription read
+    assert len(con.changes) == 30 - 9
+    assert con.copies == {}
+
+
+@pytest.mark.asyncio
+@pytest.mark.timeout(5)
+async def test_subscribe_window_to_end() -> None:
+    con = FakeConnection(transactions(10))
+    window = subscribe(con, "slot", start_lsn="0/1B")  # type: ignore
+    seen = [message async for message in window]
+    assert begun(seen) == [10]
+    assert len(con.changes) == 30
+
+    con.confirmed_flush = "0/1B"
+    with pytest.raises(ValueError):
+        async for _ in subscribe(con, "slot", start_lsn="0/18"):  # type: ignore
+            pass
+    assert con.copies == {}
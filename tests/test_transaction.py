@@ -0,0 +1,87 @@
+import os
+
+import pytest
+from fakes import FakeConnection, transactions
+
+from realtime.delivery import AckTracker
+from realtime.message import parse
+from realtime.subscribe import subscribe_transactions
+from realtime.transaction import Transaction
+
+
+def change(ix: int) -> str:
+    return "table public.t: INSERT: id[integer]:{} v[text]:'{}'".format(ix, "x" * 100)
+
+
+def test_transaction_in_memory() -> None:
+    transaction = Transaction(xid=501)
+    for ix in range(3):
+        transaction.append(parse(change(ix)))  # type: ignore
+
+    assert transaction.spill_file is None
+    assert len(transaction) == 3
+    assert list(transaction) == [parse(change(ix)) for ix in range(3)]
+
+
+def test_transaction_spills(tmp_path: str) -> None:
+    with Transaction(xid=501, memory_budget=1000, spill_dir=str(tmp_path)) as txn:
+        for ix in range(100):
+            txn.append(parse(change(ix)))  # type: ignore
+
+        assert 0 < len(txn.changes) < 10
+        assert txn.memory_used <= 1000
+        assert len(txn) == 100
+
+        expected = [parse(change(ix)) for ix in range(100)]
+        assert list(txn) == expected
+        # Iterating again reads the file from the top
+        assert list(txn) == expected
+
+    with pytest.raises(ValueError):
+        list(txn)
+    assert os.listdir(str(tmp_path)) == []
+
+
+def test_transaction_spills_typed_columns() -> None:
+    message = parse(change(7))
+    # Columns already built are pickled with the message
+    message.columns  # type: ignore
+    with Transaction(xid=501, memory_budget=0) as txn:
+        txn.append(message)  # type: ignore
+        assert txn.spill_file is not None
+        (spilled,) = list(txn)
+        assert [column.typed for column in spilled.columns] == [7, "x" * 100]
+
+
+@pytest.mark.asyncio
+@pytest.mark.timeout(5)
+async def test_subscribe_transactions() -> None:
+    con = FakeConnection(transactions(3, rows_per_transaction=50))
+    acks = AckTracker()
+
+    seen = []
+    spill_files = []
+    subscription = subscribe_transactions(
+        con,  # type: ignore
+        "slot",
+        memory_budget=2000,
+        acks=acks,
+        batch_size=30,
+    )
+    async for transaction in subscription:
+        changes = list(transaction)
+        seen.append((transaction.xid, transaction.commit_lsn, len(changes)))
+        assert transaction.spill_file is not None
+        spill_files.append(transaction.spill_file)
+        acks.ack()
+        if len(seen) == 3:
+            break
+    await subscription.aclose()
+
+    assert [n for _, _, n in seen] == [50, 50, 50]
+    assert len({xid for xid, _, _ in seen}) == 3
+    commit_lsns = [lsn for _, lsn, _ in seen if lsn is not None]
+    assert len(commit_lsns) == 3
+    assert commit_lsns == sorted(commit_lsns)
+    assert all(spill_file.closed for spill_file in spill_files)
+    assert con.changes == []
@@ -0,0 +1,124 @@
+import json
+
+import pytest
+from fakes import FakeConnection
+
+from realtime.exceptions import ParseFailureException
+from realtime.message import parse
+from realtime.subscribe import subscribe
+from realtime.wal2json import Wal2JsonDecoder
+
+# wal2json format-version 2 output with include-xids, include-types and
+# include-pk, for an insert, update and delete of public.account
+ROWS = [
+    '{"action":"B","xid":501}',
+    '{"action":"I","schema":"public","table":"account",'
+    '"columns":[{"name":"id","type":"integer","value":5},'
+    '{"name":"email","type":"character varying(255)","value":"it\'s"},'
+    '{"name":"ok","type":"boolean","value":true},'
+    '{"name":"balance","type":"numeric(10,2)","value":1.50},'
+    '{"name":"flags","type":"bit(3)","value":"101"},'
+    '{"name":"tags","type":"text[]","value":"{a,b}"},'
+    '{"name":"note","type":"text","value":null}],'
+    '"pk":[{"name":"id","type":"integer"}]}',
+    '{"action":"U","schema":"public","table":"account",'
+    '"columns":[{"name":"id","type":"integer","value":6}],'
+    '"identity":[{"name":"id","type":"integer","value":5}],'
+    '"pk":[{"name":"id","type":"integer"}]}',
+    '{"action":"D","schema":"public","table":"account",'
+    '"identity":[{"name":"id","type":"integer","value":6},'
+    '{"name":"email","type":"text","value":null}],'
+    '"pk":[{"name":"id","type":"integer"}]}',
+    '{"action":"T","schema":"public","table":"account"}',
+    '{"action":"M","transactional":false,"prefix":"x","content":"y"}',
+    '{"action":"C","xid":501}',
+]
+
+
+def test_decode_matches_test_decoding() -> None:
+    decoder = Wal2JsonDecoder()
+    messages = [message for _, message in decoder.decode_many(ROWS)]
+
+    assert messages == [
+        parse("BEGIN 501"),
+        parse(
+            "table public.account: INSERT: id[integer]:5 "
+            "email[character varying(255)]:'it''s' ok[boolean]:true "
+            "balance[numeric(10,2)]:1.50 flags[bit(3)]:B'101' "
+            "tags[text[]]:'{a,b}' note[text]:null"
+        ),
+        parse(
+            "table public.account: UPDATE: old-key: id[integer]:5 "
+            "new-tuple: id[integer]:6"
+        ),
+        parse("table public.account: DELETE: id[integer]:6"),
+        parse("table public.account: TRUNCATE: (no-flags)"),
+        parse("COMMIT 501"),
+    ]
+
+
+def test_decode_row_indexes() -> None:
+    decoder = Wal2JsonDecoder()
+    assert [ix for ix, _ in decoder.decode_many(ROWS)] == [0, 1, 2, 3, 4, 6]
+
+
+def test_decode_primary_keys() -> None:
+    decoder = Wal2JsonDecoder()
+    decoder.decode_many(ROWS)
+    assert decoder.primary_keys == {("public", "account"): ("id",)}
+
+
+def test_decode_json_value() -> None:
+    row = json.dumps(
+        {
+            "action": "I",
+            "schema": "public",
+            "table": "doc",
+            "columns": [{"name": "body", "type": "jsonb", "value": {"k": "it's"}}],
+        }
+    )
+    ((_, message),) = Wal2JsonDecoder().decode_many([row])
+    assert message.columns[0].value == '{"k": "it\'\'s"}'  # type: ignore
+
+
+@pytest.mark.parametrize(
+    "rows",
+    [
+        ['{"action":"I","schema":"public"'],
+        ['{"action":"X"}'],
+        ['{"action":"B"},{"action":"C"}'],
+        ['{"action":"I","schema":"public","table":"t"}'],
+    ],
+)
+def test_decode_failure(rows: list) -> None:
+    with pytest.raises(ParseFailureException):
+        Wal2JsonDecoder().decode_many(rows)
+
+
+@pytest.mark.asyncio
+@pytest.mark.timeout(5)
+async def test_subscribe_wal2json() -> None:
+    con = FakeConnection(
+        [("0/{:X}".format(ix + 1), 501, row) for ix, row in enumerate(ROWS)]
+    )
+
+    messages = []
+    subscription = subscribe(
+        con,  # type: ignore
+        "slot",
+        plugin="wal2json",
+        plugin_options={"add-tables": "public.account"},
+    )
+    async for message in subscription:
+        messages.append(message)
+        if message.command == "COMMIT":
+            break
+    await subscription.aclose()
+
+    assert len(messages) == 6
+    assert con.statements[0][1]["plugin"] == "wal2json"
+    sql, params = con.statements[1]
+    assert "pg_logical_slot_get_changes" in sql
+    options = dict(zip(params["options"][::2], params["options"][1::2]))
+    assert options["format-version"] == "2"
+    assert options["add-tables"] == "public.account"
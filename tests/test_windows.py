@@ -0,0 +1,68 @@
+import asyncio
+from typing import AsyncIterator, List, Optional
+
+import pytest
+from fakes import stream, transaction
+
+from realtime.message import Message
+from realtime.windows import windowed
+
+INSERT = "table public.account: INSERT: id[integer]:1"
+
+
+def commands(messages: List[Optional[Message]]) -> List[Optional[str]]:
+    return [None if message is None else message.command for message in messages]
+
+
+@pytest.mark.asyncio
+@pytest.mark.timeout(5)
+async def test_windowed_by_count() -> None:
+    lines = (
+        transaction(1, INSERT, INSERT)
+        + transaction(2, INSERT)
+        + transaction(3, INSERT, INSERT, INSERT)
+    )
+    out = [m async for m in windowed(stream(*lines), max_changes=2, max_delay=60)]
+    # Only closed at transaction boundaries, and at the end
+    assert commands(out) == [
+        *["BEGIN", "INSERT", "INSERT", "COMMIT", None],
+        *["BEGIN", "INSERT", "COMMIT"],
+        *["BEGIN", "INSERT", "INSERT", "INSERT", "COMMIT", None],
+    ]
+
+
+@pytest.mark.asyncio
+@pytest.mark.timeout(5)
+async def test_windowed_by_age() -> None:
+    lines = transaction(1, INSERT)
+    out: List[Optional[Message]] = []
+
+    async def consume() -> None:
+        async for message in windowed(stream(*lines, idle=10), 100, max_delay=0.05):
+            out.append(message)
+
+    task = asyncio.ensure_future(consume())
+    await asyncio.sleep(0.2)
+    # Closed while the source was idle
+    assert commands(out) == ["BEGIN", "INSERT", "COMMIT", None]
+    task.cancel()
+    await asyncio.gather(task, return_exceptions=True)
+
+
+@pytest.mark.asyncio
+@pytest.mark.timeout(5)
+async def test_windowed_closes_source() -> None:
+    closed = []
+
+    async def source() -> AsyncIterator[Message]:
+        try:
+            async for message in stream(*transaction(1, INSERT)):
+                yield message
+        finally:
+            closed.append(True)
+
+    windows = windowed(source(), max_changes=1, max_delay=60)
+    async for _ in windows:
+        break
+    await windows.aclose()
+    assert closed == [True]